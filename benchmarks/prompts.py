@@ -0,0 +1,249 @@
+"""
+Measures the prompt tokens and latency of code generation, with and without
+prompt caching, for the full and the compact instructions.
+
+The questions of responses.json are asked about data/sales_data.csv through
+the Anthropic client, pointed at a local stub of the Messages API. The stub
+answers with the recorded code, counts about one token per four characters
+and caches prompt prefixes the way the API does: a prefix ending with a
+`cache_control` block is stored when it has at least MIN_CACHED_TOKENS
+tokens, and later requests starting with it only pay for the rest. It
+waits for the prompt to be read before answering, at `--prefill` tokens a
+second and ten times as fast for cached tokens, so the latency it reports
+is the time to the first token of a model reading that fast.
+
+    python benchmarks/prompts.py --prefill 20000 --output prompts.json
+"""
+
+import argparse
+import hashlib
+import json
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import anthropic
+import httpx
+import polars as pl
+
+import probe
+from probe import stages
+from probe.context import build_context
+from probe.main import MODEL, generate_code
+from probe.trace import tracing
+
+ROOT = Path(__file__).parent
+DATA = ROOT.parent / "data" / "sales_data.csv"
+RESPONSES = ROOT / "responses.json"
+# The shortest prefix the API caches for Sonnet models
+MIN_CACHED_TOKENS = 1024
+CACHED_SPEEDUP = 10
+
+
+def tokens(text: str) -> int:
+    return -(-len(text) // 4)
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class StubServer(ThreadingHTTPServer):
+    """A Messages API answering every question with its recorded code."""
+
+    def __init__(self, replies: dict[str, str], prefill: float, caching=True):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.replies = replies
+        self.prefill = prefill
+        self.caching = caching
+        self.cache: set[str] = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def usage(self, blocks: list[dict], user: str) -> dict[str, int]:
+        """Reads a prompt, storing its cached prefixes like the API does."""
+        prefixes, digest, length = [], hashlib.sha256(), 0
+        for block in blocks:
+            digest.update(block["text"].encode())
+            length += tokens(block["text"])
+            if "cache_control" in block and length >= MIN_CACHED_TOKENS:
+                prefixes.append((digest.hexdigest(), length))
+        total = length + tokens(user)
+        read = written = 0
+        if self.caching:
+            with self.lock:
+                for key, length in prefixes:
+                    if key in self.cache:
+                        read = length
+                if prefixes:
+                    written = prefixes[-1][1] - read
+                    self.cache.update(key for key, _ in prefixes)
+        return {
+            "input_tokens": total - read - written,
+            "output_tokens": 0,
+            "cache_creation_input_tokens": written,
+            "cache_read_input_tokens": read,
+        }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: StubServer
+
+    def do_POST(self):
+        request = json.loads(
+            self.rfile.read(int(self.headers["content-length"]))
+        )
+        system = request.get("system") or []
+        if isinstance(system, str):
+            system = [{"type": "text", "text": system}]
+        user = request["messages"][-1]["content"]
+        usage = self.server.usage(system, user)
+        reply = self.server.replies.get(user, "")
+        usage["output_tokens"] = tokens(reply)
+        uncached = usage["input_tokens"] + usage["cache_creation_input_tokens"]
+        time.sleep(
+            (uncached + usage["cache_read_input_tokens"] / CACHED_SPEEDUP)
+            / self.server.prefill
+        )
+        body = json.dumps(
+            {
+                "id": "msg_stub",
+                "type": "message",
+                "role": "assistant",
+                "model": request["model"],
+                "content": [{"type": "text", "text": reply}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": usage,
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def stub(replies: dict[str, str], prefill: float, caching: bool):
+    """Sends the model calls of probe to a stub server."""
+    server = StubServer(replies, prefill, caching)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    original = stages._client
+    stages._client = anthropic.Anthropic(
+        base_url=server.url,
+        api_key="stub",
+        max_retries=0,
+        http_client=httpx.Client(),
+    )
+    try:
+        yield server
+    finally:
+        stages._client = original
+        server.shutdown()
+        server.server_close()
+
+
+def run(responses: list[dict], prefill: float) -> dict:
+    """
+    Asks every recorded question once per prompt and caching setting.
+
+    Returns:
+        dict: The environment, and for each setting the prompt tokens read
+        anew, written to and read from the cache, and the p50/p95 latency
+    """
+    df = probe.load(DATA)
+    data_context = build_context(df)
+    replies = {response["query"]: response["code"] for response in responses}
+    results = []
+    for compact in (False, True):
+        for caching in (False, True):
+            usage = dict.fromkeys(
+                (
+                    "input_tokens",
+                    "cache_creation_input_tokens",
+                    "cache_read_input_tokens",
+                ),
+                0,
+            )
+            latencies, errors = [], 0
+            with stub(replies, prefill, caching):
+                for response in responses:
+                    start = time.perf_counter()
+                    with tracing(response["query"], True) as current:
+                        output = generate_code(
+                            df,
+                            response["query"],
+                            data_context,
+                            code_cache=None,
+                            use_cache=False,
+                            compact_prompt=compact,
+                        )
+                    latencies.append(time.perf_counter() - start)
+                    errors += bool(output.error)
+                    for key in usage:
+                        usage[key] += current.tokens()[key]
+            results.append(
+                {
+                    "prompt": "compact" if compact else "full",
+                    "caching": caching,
+                    **usage,
+                    "prompt_tokens": sum(usage.values()),
+                    "p50": percentile(latencies, 0.5),
+                    "p95": percentile(latencies, 0.95),
+                    "errors": errors,
+                }
+            )
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "polars": pl.__version__,
+            "model": MODEL,
+            "prefill": prefill,
+            "questions": len(responses),
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--prefill",
+        type=float,
+        default=20_000,
+        help="Prompt tokens the stub reads a second",
+    )
+    parser.add_argument(
+        "--output", type=Path, default=Path("benchmark-prompts.json")
+    )
+    args = parser.parse_args()
+    report = run(json.loads(RESPONSES.read_text()), args.prefill)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(
+        f"{'prompt':<8} {'cache':<5} {'prompt':>7} {'uncached':>9}"
+        f" {'written':>8} {'read':>7} {'p50':>9} {'p95':>9}"
+    )
+    for row in report["results"]:
+        print(
+            f"{row['prompt']:<8} {'on' if row['caching'] else 'off':<5}"
+            f" {row['prompt_tokens']:>7} {row['input_tokens']:>9}"
+            f" {row['cache_creation_input_tokens']:>8}"
+            f" {row['cache_read_input_tokens']:>7}"
+            f" {row['p50'] * 1000:>7.1f}ms {row['p95'] * 1000:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Measures probe's own overhead on the questions of tests/test_queries.py.
+
+The model is replaced by the responses recorded in responses.json, so only
+probe and Polars are timed. Each question runs on copies of
+data/sales_data.csv repeated `--sizes` times, with every cache off, and the
+p50/p95 latency of each stage and the peak resident memory are reported
+and written to a JSON file that `--compare` reads back.
+
+    python benchmarks/queries.py --sizes 1 100 1000 --runs 5
+    python benchmarks/queries.py --compare previous.json
+    python benchmarks/queries.py --record  # asks the model again
+"""
+
+import argparse
+import json
+import platform
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+import polars as pl
+
+import probe
+import probe.main
+from probe import governor
+
+ROOT = Path(__file__).parent
+DATA = ROOT.parent / "data" / "sales_data.csv"
+RESPONSES = ROOT / "responses.json"
+# The functions of probe.main timed as each stage
+STAGES = {
+    "context": ["build_context"],
+    "eval": ["generate_code"],
+    "collect": ["execute"],
+    "render": ["local_answer", "translate_output"],
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@contextmanager
+def replay(responses: list[dict]):
+    """Answers the model calls of probe.main from recorded responses."""
+    by_query = {response["query"]: response for response in responses}
+    # The script handed to check_code only gets its query after the retries
+    asked = {}
+
+    def code_creator(context: str, query: str):
+        asked["query"] = query
+        return SimpleNamespace(text=by_query[query]["code"])
+
+    def check_code(output, schema=None):
+        return SimpleNamespace(text=by_query[asked["query"]]["code"])
+
+    def translate_output(output):
+        return SimpleNamespace(text=by_query[output.user_query]["answer"])
+
+    patched = {
+        "code_creator": code_creator,
+        "check_code": check_code,
+        "translate_output": translate_output,
+    }
+    original = {name: getattr(probe.main, name) for name in patched}
+    for name, function in patched.items():
+        setattr(probe.main, name, function)
+    try:
+        yield
+    finally:
+        for name, function in original.items():
+            setattr(probe.main, name, function)
+
+
+@contextmanager
+def timed(timings: dict[str, float]):
+    """Adds the time spent in each stage of probe.main to `timings`."""
+
+    def wrap(stage, function):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timings[stage] += time.perf_counter() - start
+
+        return wrapper
+
+    original = {}
+    for stage, names in STAGES.items():
+        for name in names:
+            original[name] = getattr(probe.main, name)
+            setattr(probe.main, name, wrap(stage, original[name]))
+    try:
+        yield
+    finally:
+        for name, function in original.items():
+            setattr(probe.main, name, function)
+
+
+@contextmanager
+def peak_memory(interval: float = 0.005):
+    """Samples the resident memory of the process until the block ends."""
+    peak = {"bytes": governor.memory_usage() or 0}
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(interval):
+            peak["bytes"] = max(peak["bytes"], governor.memory_usage() or 0)
+
+    thread = threading.Thread(target=sample, daemon=True)
+    thread.start()
+    try:
+        yield peak
+    finally:
+        done.set()
+        thread.join()
+
+
+def dataset(directory: Path, copies: int) -> pl.LazyFrame:
+    path = directory / f"sales-{copies}.parquet"
+    if not path.exists():
+        sales = pl.read_csv(DATA, try_parse_dates=True)
+        pl.concat([sales] * copies).write_parquet(path)
+    return probe.load(path)
+
+
+def ask(df: pl.LazyFrame, query: str) -> probe.main.PythonScript:
+    return probe.main.ask(
+        df,
+        query,
+        print_answer=False,
+        context_cache=None,
+        code_cache=None,
+        result_cache=None,
+        use_cache=False,
+    )
+
+
+def run(sizes: list[int], runs: int, responses: list[dict]) -> dict:
+    """
+    Asks every recorded question `runs` times at each size.
+
+    Returns:
+        dict: The environment, the p50/p95 seconds of every stage of every
+        question, the same over all questions, the peak memory and the
+        errors of each size
+    """
+    results, summary, errors = [], [], []
+    memory = {}
+    with tempfile.TemporaryDirectory() as directory, replay(responses):
+        for size in sizes:
+            df = dataset(Path(directory), size)
+            rows = df.select(pl.len()).collect().item()
+            totals = {stage: [] for stage in STAGES}
+            with peak_memory() as peak:
+                for response in responses:
+                    samples = {stage: [] for stage in STAGES}
+                    for _ in range(runs):
+                        timings = dict.fromkeys(STAGES, 0.0)
+                        with timed(timings):
+                            output = ask(df, response["query"])
+                        if output.error:
+                            errors.append(
+                                {
+                                    "size": size,
+                                    "query": response["query"],
+                                    "error": output.error,
+                                }
+                            )
+                        for stage, seconds in timings.items():
+                            samples[stage].append(seconds)
+                            totals[stage].append(seconds)
+                    for stage, values in samples.items():
+                        results.append(
+                            {
+                                "size": size,
+                                "rows": rows,
+                                "query": response["query"],
+                                "stage": stage,
+                                "p50": percentile(values, 0.5),
+                                "p95": percentile(values, 0.95),
+                            }
+                        )
+            memory[str(size)] = peak["bytes"]
+            for stage, values in totals.items():
+                summary.append(
+                    {
+                        "size": size,
+                        "rows": rows,
+                        "stage": stage,
+                        "p50": percentile(values, 0.5),
+                        "p95": percentile(values, 0.95),
+                    }
+                )
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "polars": pl.__version__,
+            "machine": platform.machine(),
+            "runs": runs,
+        },
+        "results": results,
+        "summary": summary,
+        "peak_memory": memory,
+        "errors": errors,
+    }
+
+
+def record(responses: list[dict]) -> list[dict]:
+    """Asks the model every question again, on the original data."""
+    df = probe.load(DATA)
+    recorded = []
+    for response in responses:
+        output = ask(df, response["query"])
+        recorded.append(
+            {
+                "query": response["query"],
+                "code": output.code_str,
+                "answer": output.answer,
+            }
+        )
+    return recorded
+
+
+def compare(report: dict, previous: dict):
+    before = {
+        (row["size"], row["stage"]): row["p50"] for row in previous["summary"]
+    }
+    print(f"{'size':>6} {'stage':<8} {'before':>9} {'after':>9} {'change':>8}")
+    for row in report["summary"]:
+        old = before.get((row["size"], row["stage"]))
+        if not old:
+            continue
+        print(
+            f"{row['size']:>6} {row['stage']:<8} {old * 1000:>7.1f}ms"
+            f" {row['p50'] * 1000:>7.1f}ms {row['p50'] / old - 1:>+8.0%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--output", type=Path, default=Path("benchmark-queries.json")
+    )
+    parser.add_argument(
+        "--compare", type=Path, help="A previous output to compare with"
+    )
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="Ask the model and record its responses to responses.json",
+    )
+    args = parser.parse_args()
+    responses = json.loads(RESPONSES.read_text())
+
+    if args.record:
+        RESPONSES.write_text(json.dumps(record(responses), indent=2) + "\n")
+        return
+
+    report = run(args.sizes, args.runs, responses)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"{'size':>6} {'rows':>10} {'stage':<8} {'p50':>9} {'p95':>9}")
+    for row in report["summary"]:
+        print(
+            f"{row['size']:>6} {row['rows']:>10} {row['stage']:<8}"
+            f" {row['p50'] * 1000:>7.1f}ms {row['p95'] * 1000:>7.1f}ms"
+        )
+    for size, peak in report["peak_memory"].items():
+        print(f"peak memory at size {size}: {peak / 2**20:.0f} MiB")
+    for error in report["errors"]:
+        print(f"error at size {error['size']}: {error['query']}")
+        print(f"    {error['error']}")
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Measures probe's cold start.
+
+Every scenario runs in a fresh interpreter, so each measurement includes
+the interpreter start and all imports, like a shell pipeline calling the
+CLI.
+
+    python benchmarks/startup.py --runs 20
+    python benchmarks/startup.py --importtime probe.main
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+SCENARIOS = {
+    "python": "pass",
+    "import probe": "import probe",
+    "import probe.app": "import probe.app",
+    "import probe.main": "import probe.main",
+    "first ask stage": "import probe.main; probe.main._stages()",
+}
+
+
+def measure(code: str, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", code],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def importtime(module: str, top: int = 15):
+    """Prints the modules with the largest cumulative import time."""
+    stderr = subprocess.run(
+        [
+            sys.executable,
+            "-W",
+            "ignore",
+            "-X",
+            "importtime",
+            "-c",
+            f"import {module}",
+        ],
+        capture_output=True,
+        text=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:>9.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--importtime", metavar="MODULE", help="Break down a module's imports"
+    )
+    args = parser.parse_args()
+
+    if args.importtime:
+        importtime(args.importtime)
+        return
+
+    print(f"{'scenario':<20} {'min':>8} {'median':>8} {'max':>8}")
+    for name, code in SCENARIOS.items():
+        timings = measure(code, args.runs)
+        print(
+            f"{name:<20} {min(timings) * 1000:>6.0f}ms"
+            f" {statistics.median(timings) * 1000:>6.0f}ms"
+            f" {max(timings) * 1000:>6.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+"""
+Generates synthetic sales data of any size, with the schema and
+distributions of sales_data.csv (see generate.py).
+
+Rows are generated in chunks of vectorized NumPy draws and written as one
+file per chunk, so memory stays bounded by the chunk size whatever the
+number of rows. Each chunk covers the next slice of the four years of
+dates, so the files are in date order. The same seed, row count and chunk
+size always give the same data.
+
+    python data/synth.py 100_000_000 data/large --partition-by region
+    python data/synth.py 1_000_000 data/skewed --skew 1.2 --format csv
+"""
+
+import argparse
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+FIRST_NAMES = [
+    "James",
+    "Mary",
+    "John",
+    "Patricia",
+    "Robert",
+    "Jennifer",
+    "Michael",
+    "Linda",
+    "William",
+    "Elizabeth",
+    "David",
+    "Barbara",
+    "Richard",
+    "Susan",
+    "Joseph",
+    "Jessica",
+    "Thomas",
+    "Sarah",
+    "Charles",
+    "Karen",
+    "Wei",
+    "Li",
+    "Ming",
+    "Yan",
+    "Yuki",
+    "Hiroshi",
+    "Akiko",
+    "Juan",
+    "Maria",
+    "Carlos",
+    "Sofia",
+    "Luis",
+    "Anna",
+    "Pavel",
+    "Elena",
+    "Ahmed",
+    "Fatima",
+    "Omar",
+    "Isabella",
+    "Emma",
+    "Noah",
+    "Olivia",
+    "Liam",
+    "Ava",
+    "Ethan",
+    "Mia",
+    "Lucas",
+    "Sophia",
+    "Mason",
+    "Charlotte",
+]
+LAST_NAMES = [
+    "Smith",
+    "Johnson",
+    "Williams",
+    "Brown",
+    "Jones",
+    "Garcia",
+    "Miller",
+    "Davis",
+    "Rodriguez",
+    "Martinez",
+    "Chen",
+    "Wang",
+    "Li",
+    "Zhang",
+    "Liu",
+    "Sato",
+    "Suzuki",
+    "Takahashi",
+    "Kim",
+    "Lee",
+    "Patel",
+    "Kumar",
+    "Singh",
+    "Sharma",
+    "Nguyen",
+    "Tran",
+    "Le",
+    "Andersen",
+    "Nielsen",
+    "Jensen",
+    "Schmidt",
+    "Mueller",
+    "Fischer",
+    "Weber",
+    "Santos",
+    "Silva",
+    "Oliveira",
+    "Kowalski",
+    "Nowak",
+    "Ivanov",
+    "Popov",
+    "Smirnov",
+    "Ahmed",
+    "Ali",
+    "Mohamed",
+    "Cohen",
+    "Levy",
+    "Martin",
+    "Roy",
+    "Tremblay",
+]
+COUNTRIES_STATES = {
+    "United States": [
+        "California",
+        "Texas",
+        "Florida",
+        "New York",
+        "Illinois",
+        "Pennsylvania",
+        "Ohio",
+        "Georgia",
+        "Michigan",
+        "North Carolina",
+    ],
+    "Canada": [
+        "Ontario",
+        "Quebec",
+        "British Columbia",
+        "Alberta",
+        "Manitoba",
+        "Saskatchewan",
+        "Nova Scotia",
+        "New Brunswick",
+    ],
+    "United Kingdom": ["England", "Scotland", "Wales", "Northern Ireland"],
+    "Australia": [
+        "New South Wales",
+        "Victoria",
+        "Queensland",
+        "Western Australia",
+        "South Australia",
+        "Tasmania",
+    ],
+    "Germany": [
+        "Bavaria",
+        "North Rhine-Westphalia",
+        "Baden-Württemberg",
+        "Lower Saxony",
+        "Hesse",
+        "Saxony",
+    ],
+}
+PRODUCTS = [
+    "Laptop",
+    "Smartphone",
+    "Tablet",
+    "Desktop",
+    "Monitor",
+    "Printer",
+    "Keyboard",
+    "Mouse",
+    "Headphones",
+    "Speaker",
+]
+CATEGORIES = ["Electronics", "Accessories", "Peripherals"]
+REGIONS = ["North", "South", "East", "West", "Central"]
+PAYMENT_METHODS = [
+    "Credit Card",
+    "Debit Card",
+    "PayPal",
+    "Bank Transfer",
+    "Cash",
+]
+CUSTOMER_SEGMENTS = ["Consumer", "Small Business", "Enterprise", "Government"]
+SALES_CHANNELS = ["Online", "Retail Store", "Direct Sales", "Distributor"]
+SHIPPING_METHODS = ["Standard", "Express", "Next Day", "Pickup"]
+SHIPPING_COSTS = {"Standard": 10, "Express": 25, "Next Day": 50, "Pickup": 0}
+DISCOUNTS = [0, 5, 10, 15, 20]
+RETURN_RATE = 0.05
+
+START = datetime(2020, 1, 2)
+HOURS = 365 * 4 * 24
+CHUNK_SIZE = 500_000
+
+
+def draw(
+    rng: np.random.Generator, n: int, size: int, skew: float
+) -> np.ndarray:
+    """
+    Indices of `size` values out of `n`, uniform for a skew of 0 and
+    following Zipf's law with exponent `skew` otherwise (the first values
+    are the most frequent).
+    """
+    if skew == 0:
+        return rng.integers(0, n, size)
+    p = np.cumsum(1 / np.arange(1, n + 1) ** skew)
+    return np.searchsorted(p, rng.random(size) * p[-1], side="right")
+
+
+def names(rng: np.random.Generator, n: int) -> pl.Series:
+    first = np.array(FIRST_NAMES)[rng.integers(0, len(FIRST_NAMES), n)]
+    last = np.array(LAST_NAMES)[rng.integers(0, len(LAST_NAMES), n)]
+    return pl.Series(first) + " " + pl.Series(last)
+
+
+def ids(prefix: str, numbers: np.ndarray, width: int) -> pl.Series:
+    return prefix + pl.Series(numbers).cast(pl.String).str.zfill(width)
+
+
+def people(
+    seed: int, customers: int, salespeople: int
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """The customers and salespeople every chunk draws from."""
+    rng = np.random.default_rng([seed, 0])
+    countries = list(COUNTRIES_STATES)
+    country = rng.integers(0, len(countries), customers)
+    sizes = np.array([len(COUNTRIES_STATES[c]) for c in countries])
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    states = np.array([s for c in countries for s in COUNTRIES_STATES[c]])
+    state = offsets[country] + (rng.random(customers) * sizes[country]).astype(
+        int
+    )
+    return (
+        pl.DataFrame(
+            {
+                "customer_id": ids("CUST-", np.arange(1, customers + 1), 5),
+                "customer_name": names(rng, customers),
+                "country": np.array(countries)[country],
+                "state": states[state],
+            }
+        ),
+        pl.DataFrame(
+            {
+                "salesperson_id": ids("SP-", np.arange(1, salespeople + 1), 3),
+                "salesperson_name": names(rng, salespeople),
+            }
+        ),
+    )
+
+
+def chunk(
+    index: int,
+    start: int,
+    rows: int,
+    total: int,
+    customers: pl.DataFrame,
+    salespeople: pl.DataFrame,
+    seed: int,
+    skew: float,
+) -> pl.DataFrame:
+    """
+    Rows `start` to `start + rows` of a dataset of `total` rows, dated in
+    the matching slice of the four years.
+    """
+    rng = np.random.default_rng([seed, index + 1])
+
+    def choice(values: list) -> pl.Series:
+        # Gathered by Polars, NumPy string arrays are slow to convert
+        return pl.Series(values).gather(draw(rng, len(values), rows, skew))
+
+    first = HOURS * start // total
+    last = max(HOURS * (start + rows) // total, first + 1)
+    hours = np.sort(rng.integers(first, last, rows))
+    customer = draw(rng, customers.height, rows, skew)
+    salesperson = draw(rng, salespeople.height, rows, skew)
+    df = pl.DataFrame(
+        {
+            "order_id": ids("ORD-", np.arange(start + 1, start + rows + 1), 6),
+            "date": np.datetime64(START, "us") + hours.astype("m8[h]"),
+            "product": choice(PRODUCTS),
+            "category": choice(CATEGORIES),
+            "quantity": rng.integers(1, 11, rows),
+            "unit_price": rng.uniform(50, 2000, rows).round(2),
+            "discount_percentage": choice(DISCOUNTS),
+            "region": choice(REGIONS),
+            "payment_method": choice(PAYMENT_METHODS),
+            "customer_segment": choice(CUSTOMER_SEGMENTS),
+            "sales_channel": choice(SALES_CHANNELS),
+            "shipping_method": choice(SHIPPING_METHODS),
+        }
+    )
+    df = pl.concat(
+        [
+            df,
+            customers[customer].select("customer_id"),
+            salespeople[salesperson].select("salesperson_id"),
+            customers[customer].drop("customer_id"),
+            salespeople[salesperson].drop("salesperson_id"),
+        ],
+        how="horizontal",
+    )
+    df = df.with_columns(
+        discount_amount=(
+            pl.col("unit_price")
+            * pl.col("quantity")
+            * pl.col("discount_percentage")
+            / 100
+        ).round(2),
+        subtotal=(pl.col("unit_price") * pl.col("quantity")).round(2),
+        shipping_cost=pl.col("shipping_method").replace_strict(
+            SHIPPING_COSTS, return_dtype=pl.Int64
+        ),
+    )
+    return df.select(
+        pl.exclude("shipping_cost", "discount_amount", "subtotal"),
+        "discount_amount",
+        "subtotal",
+        total_amount=(pl.col("subtotal") - pl.col("discount_amount")).round(2),
+        shipping_cost="shipping_cost",
+        final_amount=(
+            pl.col("subtotal")
+            - pl.col("discount_amount")
+            + pl.col("shipping_cost")
+        ).round(2),
+        returned=pl.Series(rng.random(rows) < RETURN_RATE),
+    )
+
+
+def chunks(
+    rows: int,
+    chunk_size: int = CHUNK_SIZE,
+    seed: int = 42,
+    skew: float = 0.0,
+    customers: int = 500,
+    salespeople: int = 50,
+) -> Iterator[pl.DataFrame]:
+    """The rows of a dataset, `chunk_size` at a time, in date order."""
+    customer_df, salespeople_df = people(seed, customers, salespeople)
+    for index, start in enumerate(range(0, rows, chunk_size)):
+        yield chunk(
+            index,
+            start,
+            min(chunk_size, rows - start),
+            rows,
+            customer_df,
+            salespeople_df,
+            seed,
+            skew,
+        )
+
+
+def write(
+    df: pl.DataFrame,
+    out: Path,
+    name: str,
+    format: str = "parquet",
+    partition_by: list[str] | None = None,
+):
+    """Writes a chunk, in hive directories (`region=East/`) if partitioned."""
+    parts = (
+        df.partition_by(partition_by, as_dict=True, include_key=False)
+        if partition_by
+        else {(): df}
+    )
+    for key, part in parts.items():
+        directory = out.joinpath(
+            *(
+                f"{column}={value}"
+                for column, value in zip(partition_by or [], key)
+            )
+        )
+        directory.mkdir(parents=True, exist_ok=True)
+        if format == "csv":
+            part.write_csv(directory / f"{name}.csv")
+        else:
+            part.write_parquet(directory / f"{name}.parquet")
+
+
+def generate(
+    rows: int,
+    out: str | Path,
+    chunk_size: int = CHUNK_SIZE,
+    seed: int = 42,
+    skew: float = 0.0,
+    format: str = "parquet",
+    partition_by: list[str] | None = None,
+    customers: int = 500,
+    salespeople: int = 50,
+):
+    """
+    Writes a dataset of `rows` rows to the directory `out`, one file per
+    chunk and partition.
+    """
+    out = Path(out)
+    for index, df in enumerate(
+        chunks(rows, chunk_size, seed, skew, customers, salespeople)
+    ):
+        write(df, out, f"part-{index:05d}", format, partition_by)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("rows", type=lambda s: int(s.replace("_", "")))
+    parser.add_argument("out", type=Path)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--skew",
+        type=float,
+        default=0.0,
+        help="Zipf exponent of categories, customers and salespeople",
+    )
+    parser.add_argument(
+        "--format", choices=["parquet", "csv"], default="parquet"
+    )
+    parser.add_argument("--partition-by", nargs="+", metavar="COLUMN")
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--salespeople", type=int, default=50)
+    args = parser.parse_args()
+    generate(
+        args.rows,
+        args.out,
+        args.chunk_size,
+        args.seed,
+        args.skew,
+        args.format,
+        args.partition_by,
+        args.customers,
+        args.salespeople,
+    )
+
+
+if __name__ == "__main__":
+    main()
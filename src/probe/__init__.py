@@ -1 +1,32 @@
-from .main import ask
+import importlib
+
+# Public names and the module defining them. They are imported on first
+# access, so `import probe` (and the CLI) stays cheap until a question is
+# actually asked.
+_EXPORTS = {
+    "ask": "main",
+    "ask_async": "aio",
+    "ask_many": "batch",
+    "Catalog": "catalog",
+    "ContextCache": "context",
+    "context_cache": "context",
+    "load": "ingest",
+    "Limits": "governor",
+    "Sampling": "sampling",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(
+        importlib.import_module(f".{_EXPORTS[name]}", __name__), name
+    )
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
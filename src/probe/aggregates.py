@@ -0,0 +1,513 @@
+import ast
+import copy
+import re
+import threading
+from dataclasses import dataclass
+
+import polars as pl
+
+from probe.repair import output_name
+
+# Aggregations whose partial results, computed on separate slices of the
+# rows, combine into the result on all rows: aggregation -> how partial
+# results combine. A mean is kept as a sum and a count.
+COMBINE = {
+    "sum": "sum",
+    "count": "sum",
+    "len": "sum",
+    "min": "min",
+    "max": "max",
+}
+DECOMPOSABLE = set(COMBINE) | {"mean"}
+# Methods computing a value from other rows than the current one
+WHOLE_COLUMN = {
+    "over",
+    "shift",
+    "diff",
+    "pct_change",
+    "rank",
+    "cum_sum",
+    "cum_count",
+    "cum_max",
+    "cum_min",
+    "cum_prod",
+    "rolling_mean",
+    "rolling_sum",
+    "rolling_min",
+    "rolling_max",
+    "rolling_std",
+    "sum",
+    "mean",
+    "median",
+    "min",
+    "max",
+    "count",
+    "len",
+    "n_unique",
+    "first",
+    "last",
+    "std",
+    "var",
+    "quantile",
+    "implode",
+    "explode",
+    "head",
+    "tail",
+    "sort",
+    "sort_by",
+    "gather",
+    "slice",
+    "unique",
+    "is_unique",
+    "is_duplicated",
+    "is_first_distinct",
+    "forward_fill",
+    "backward_fill",
+    "interpolate",
+    "reverse",
+    "shuffle",
+    "sample",
+    "top_k",
+    "bottom_k",
+    "arg_max",
+    "arg_min",
+    "mode",
+    "value_counts",
+}
+# LazyFrame methods that transform each row on its own
+ROW_METHODS = {
+    "filter",
+    "with_columns",
+    "select",
+    "drop",
+    "rename",
+    "cast",
+    "drop_nulls",
+}
+
+_WHOLE_COLUMN_PLAN = re.compile(
+    r"AGGREGATE|SORT|JOIN|UNIQUE|SLICE|UNION|DISTINCT|"
+    r"\.(" + "|".join(sorted(WHOLE_COLUMN)) + r")\("
+)
+_PARTIAL = "__probe_p"
+
+_lock = threading.Lock()
+_counts = {"updates": 0, "recomputes": 0, "rows_skipped": 0}
+
+
+@dataclass
+class Decomposition:
+    """
+    A query split into partial aggregates and the steps that finish it.
+
+    Args:
+        source (str): The row by row steps the query starts with, applied
+            to `df`
+        group_by (list[str] | None): The arguments of the group_by call,
+            None when the query aggregates all rows
+        keys (list[str]): The group keys of the partial aggregates
+        partials (dict[str, str]): Partial column -> the aggregation
+            computing it, which can run on any slice of the rows
+        combine (dict[str, str]): Partial column -> the aggregation
+            combining its values from several slices
+        final (str): Code computing the result from the combined partial
+            aggregates, bound to `df`
+    """
+
+    source: str
+    group_by: list[str] | None
+    keys: list[str]
+    partials: dict[str, str]
+    combine: dict[str, str]
+    final: str
+
+    def aggregate(self, aggregations: list[str]) -> str:
+        """Code aggregating the rows of `source` by the same keys."""
+        aggregations = f"[{', '.join(aggregations)}]"
+        if self.group_by is None:
+            return f"{self.source}.select({aggregations})"
+        return (
+            f"{self.source}.group_by({', '.join(self.group_by)})"
+            f".agg({aggregations})"
+        )
+
+    @property
+    def partial(self) -> str:
+        """Code computing the partial aggregates of `df`."""
+        return self.aggregate(
+            [
+                f"{expression}.alias({name!r})"
+                for name, expression in self.partials.items()
+            ]
+        )
+
+
+def _is_pl(node: ast.AST) -> bool:
+    return isinstance(node, ast.Name) and node.id == "pl"
+
+
+def _calls(node: ast.AST) -> set[str]:
+    """The names of the methods and functions called in an expression."""
+    return {
+        call.func.attr
+        for call in ast.walk(node)
+        if isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)
+    }
+
+
+def _uses_df(node: ast.AST) -> bool:
+    return any(
+        isinstance(name, ast.Name) and name.id == "df"
+        for name in ast.walk(node)
+    )
+
+
+def _col(name: str) -> ast.Call:
+    return ast.Call(
+        ast.Attribute(ast.Name("pl", ast.Load()), "col", ast.Load()),
+        [ast.Constant(name)],
+        [],
+    )
+
+
+def _method(receiver: ast.AST, name: str, *args: ast.AST) -> ast.Call:
+    return ast.Call(ast.Attribute(receiver, name, ast.Load()), list(args), [])
+
+
+class _Splitter(ast.NodeTransformer):
+    """Replaces the aggregations of an expression with partial columns."""
+
+    def __init__(self):
+        self.partials: dict[str, str] = {}
+        self.combine: dict[str, str] = {}
+        self.names: dict[str, str] = {}
+        self.valid = True
+
+    def _partial(self, expression: ast.AST, how: str) -> ast.AST:
+        # The same aggregation used twice is computed once
+        code = ast.unparse(expression)
+        if code not in self.names:
+            name = self.names[code] = f"{_PARTIAL}{len(self.partials)}"
+            self.partials[name] = code
+            self.combine[name] = how
+        return _col(self.names[code])
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        func = node.func
+        if (
+            not isinstance(func, ast.Attribute)
+            or func.attr not in DECOMPOSABLE
+        ):
+            return self.generic_visit(node)
+
+        if _is_pl(func.value):
+            # pl.len(), pl.count() and pl.sum("column")
+            if not node.args and func.attr in ("len", "count"):
+                return self._partial(_method(func.value, "len"), "sum")
+            if len(node.args) != 1 or not isinstance(
+                node.args[0], ast.Constant
+            ):
+                self.valid = False
+                return node
+            receiver = _col(node.args[0].value)
+        elif node.args or node.keywords:
+            self.valid = False
+            return node
+        else:
+            receiver = func.value
+        if _calls(receiver) & WHOLE_COLUMN:
+            self.valid = False
+            return node
+
+        if func.attr == "mean":
+            total = self._partial(_method(receiver, "sum"), "sum")
+            count = self._partial(_method(receiver, "count"), "sum")
+            # The mean of no values is null, as in Polars, not 0 / 0
+            counted = ast.Compare(count, [ast.Gt()], [ast.Constant(0)])
+            return _method(
+                _method(ast.Name("pl", ast.Load()), "when", counted),
+                "then",
+                ast.BinOp(total, ast.Div(), count),
+            )
+        return self._partial(_method(receiver, func.attr), COMBINE[func.attr])
+
+
+def _only_partials(node: ast.AST) -> bool:
+    """Whether a finished expression only reads partial columns."""
+    for call in ast.walk(node):
+        if not isinstance(call, ast.Call) or not isinstance(
+            call.func, ast.Attribute
+        ):
+            continue
+        if call.func.attr in WHOLE_COLUMN:
+            return False
+        if _is_pl(call.func.value) and call.func.attr not in ("lit", "when"):
+            name = call.args[0] if call.args else None
+            if not (
+                call.func.attr == "col"
+                and isinstance(name, ast.Constant)
+                and str(name.value).startswith(_PARTIAL)
+            ):
+                return False
+    return True
+
+
+def _expressions(call: ast.Call) -> list[ast.AST] | None:
+    """The expressions passed to a call, named ones aliased."""
+    args = call.args
+    if len(args) == 1 and isinstance(args[0], (ast.List, ast.Tuple)):
+        args = args[0].elts
+    if any(isinstance(arg, ast.Starred) for arg in args):
+        return None
+    return list(args) + [
+        _method(keyword.value, "alias", ast.Constant(keyword.arg))
+        for keyword in call.keywords
+        if keyword.arg and keyword.arg != "maintain_order"
+    ]
+
+
+def _chain(node: ast.AST) -> list[ast.Call] | None:
+    """The method calls of a chain starting at `df`, innermost first."""
+    calls = []
+    while isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        calls.append(node)
+        node = node.func.value
+    if not (isinstance(node, ast.Name) and node.id == "df"):
+        return None
+    return calls[::-1]
+
+
+def _aggregation(call: ast.Call) -> tuple[bool, list, list] | None:
+    """
+    Whether a step groups, with its keys and aggregated expressions, or
+    None when it does not aggregate.
+    """
+    attr = call.func.attr
+    receiver = call.func.value
+    grouped = (
+        isinstance(receiver, ast.Call)
+        and isinstance(receiver.func, ast.Attribute)
+        and receiver.func.attr == "group_by"
+    )
+    if attr == "agg" and grouped:
+        return True, _expressions(receiver), _expressions(call)
+    if attr in ("len", "count") and grouped and not call.args:
+        length = _method(ast.Name("pl", ast.Load()), "len")
+        return (
+            True,
+            _expressions(receiver),
+            [_method(length, "alias", ast.Constant(attr))],
+        )
+    if attr == "select":
+        expressions = _expressions(call)
+        if expressions and all(_calls(e) & DECOMPOSABLE for e in expressions):
+            return False, [], expressions
+    return None
+
+
+def decompose(code: str) -> Decomposition | None:
+    """
+    Splits generated code into partial aggregates that can be updated.
+
+    Supported queries filter and derive columns row by row, then either
+    group by keys or select over all rows, aggregating with sum, count,
+    len, mean, min and max, optionally combined with arithmetic. Any steps
+    after the aggregation (sorting, limits, more columns) are kept in
+    `final` and run again on the combined result.
+
+    Args:
+        code: The generated code
+
+    Returns:
+        Decomposition | None: The split query, or None when it cannot be
+        computed from partial aggregates
+    """
+    try:
+        tree = ast.parse(code, mode="eval")
+    except SyntaxError:
+        return None
+    body = tree.body
+    if not _uses_df(body):
+        # An expression selected on the data
+        body = _method(ast.Name("df", ast.Load()), "select", body)
+
+    chain = _chain(body)
+    if chain is None:
+        return None
+    found = next(
+        (
+            (i, split)
+            for i, call in enumerate(chain)
+            if (split := _aggregation(call)) is not None
+        ),
+        None,
+    )
+    if found is None:
+        return None
+    index, (grouped, keys, expressions) = found
+    if keys is None or expressions is None:
+        return None
+    step = chain[index]
+    before = chain[:index]
+    if grouped:
+        # The group_by call is part of the aggregation step
+        before = before[:-1]
+    for call in before:
+        arguments = call.args + [keyword.value for keyword in call.keywords]
+        if call.func.attr not in ROW_METHODS or any(
+            _uses_df(arg) or _calls(arg) & WHOLE_COLUMN for arg in arguments
+        ):
+            return None
+    for call in chain[index + 1 :]:
+        if any(_uses_df(arg) for arg in call.args):
+            return None
+
+    key_names = []
+    for key in keys:
+        name = output_name(key)
+        if name is None or _calls(key) & WHOLE_COLUMN:
+            return None
+        key_names.append(name)
+
+    splitter, finished = _Splitter(), []
+    for expression in expressions:
+        name = output_name(expression)
+        if name is None:
+            return None
+        expression = splitter.visit(copy.deepcopy(expression))
+        if not splitter.valid or not _only_partials(expression):
+            return None
+        if not (
+            isinstance(expression, ast.Call)
+            and expression.func.attr == "alias"
+        ):
+            expression = _method(expression, "alias", ast.Constant(name))
+        finished.append(expression)
+    if not splitter.partials:
+        return None
+
+    receiver = step.func.value
+    group_by = None
+    if grouped:
+        receiver, arguments = receiver.func.value, receiver
+        group_by = [ast.unparse(arg) for arg in arguments.args] + [
+            f"{keyword.arg}={ast.unparse(keyword.value)}"
+            for keyword in arguments.keywords
+        ]
+    final_step = _method(
+        ast.Name("df", ast.Load()),
+        "select",
+        ast.List([_col(k) for k in key_names] + finished, ast.Load()),
+    )
+    # Rebuild the steps after the aggregation on top of the combined result
+    final = final_step
+    for call in chain[index + 1 :]:
+        final = ast.Call(
+            ast.Attribute(final, call.func.attr, ast.Load()),
+            call.args,
+            call.keywords,
+        )
+    return Decomposition(
+        source=ast.unparse(receiver),
+        group_by=group_by,
+        keys=key_names,
+        partials=splitter.partials,
+        combine=splitter.combine,
+        final=ast.unparse(ast.fix_missing_locations(final)),
+    )
+
+
+def _strings(frame: pl.DataFrame) -> pl.DataFrame:
+    # Categoricals collected separately cannot be concatenated or compared
+    return frame.with_columns(pl.col(pl.Categorical).cast(pl.String))
+
+
+def combine(
+    states: list[pl.DataFrame], decomposition: Decomposition
+) -> pl.DataFrame:
+    """Combines partial aggregates computed on separate slices of the rows."""
+    frame = pl.concat([_strings(state) for state in states], how="vertical")
+    aggregations = [
+        getattr(pl.col(column), how)().alias(column)
+        for column, how in decomposition.combine.items()
+    ]
+    if not decomposition.keys:
+        return frame.select(aggregations)
+    return frame.group_by(decomposition.keys, maintain_order=True).agg(
+        aggregations
+    )
+
+
+def appendable(lazy: pl.LazyFrame) -> bool:
+    """
+    Whether `lazy` scans files and every row of it only depends on one row
+    of the files, in the same order, so rows appended to the files are
+    appended to it.
+    """
+    try:
+        plan = lazy.explain()
+    except Exception:
+        return False
+    return "SCAN" in plan and not _WHOLE_COLUMN_PLAN.search(plan)
+
+
+def row_hash(frame: pl.DataFrame) -> int | None:
+    """A hash of the first row of a frame, None when it is empty."""
+    if frame.is_empty():
+        return None
+    return _strings(frame.head(1)).hash_rows(seed=0).item()
+
+
+def watermark_frames(
+    lazy: pl.LazyFrame, rows: int | None = None
+) -> list[pl.LazyFrame]:
+    """
+    The queries describing the rows of `lazy`: its length, first and last
+    row and, given the length it had before, its last row back then.
+    """
+    frames = [lazy.select(pl.len()), lazy.head(1), lazy.tail(1)]
+    if rows:
+        frames.append(lazy.slice(rows - 1, 1))
+    return frames
+
+
+def watermark(length: pl.DataFrame, first, last) -> dict:
+    return {
+        "rows": length.item(),
+        "first": row_hash(first),
+        "last": row_hash(last),
+    }
+
+
+def appended(saved: dict, current: dict, previous_last) -> bool:
+    """
+    Whether the data only gained rows at its end since `saved` was taken.
+
+    The first row and the row that was last must be unchanged. Rows edited
+    in between are not detected.
+    """
+    return (
+        current["rows"] >= saved["rows"]
+        and current["first"] == saved["first"]
+        and row_hash(previous_last) == saved["last"]
+    )
+
+
+def record(appended_rows: int | None, skipped_rows: int = 0):
+    """Counts an update from appended rows, or a full recomputation."""
+    with _lock:
+        if appended_rows is None:
+            _counts["recomputes"] += 1
+        else:
+            _counts["updates"] += 1
+            _counts["rows_skipped"] += skipped_rows
+
+
+def stats() -> dict[str, int]:
+    """
+    Returns:
+        dict[str, int]: The number of results updated from appended rows,
+        of full recomputations, and of rows not read again thanks to updates
+    """
+    with _lock:
+        return dict(_counts)
@@ -0,0 +1,286 @@
+import asyncio
+from typing import Any, AsyncIterator, Callable
+
+import anthropic
+import polars as pl
+
+from probe import cache, context, governor, prompts
+from probe.cache import CodeCache, ResultCache
+from probe.catalog import Catalog
+from probe.context import ContextCache, DataContext, build_context
+from probe.governor import Limits
+from probe.main import (
+    MODEL,
+    PythonScript,
+    cached_code,
+    check_code_message,
+    collect,
+    local_answer,
+    repair_and_validate,
+    store_code,
+    translate_message,
+)
+from probe.sampling import Sampling
+from probe.trace import retried, span, tracing, usage
+
+_client: anthropic.AsyncAnthropic | None = None
+
+
+def _default_client() -> anthropic.AsyncAnthropic:
+    global _client
+    if _client is None:
+        _client = anthropic.AsyncAnthropic()
+    return _client
+
+
+async def _complete(
+    name: str,
+    client: anthropic.AsyncAnthropic | None,
+    system: str | list[dict],
+    user: str,
+    max_tokens: int,
+) -> str:
+    with span(f"llm.{name}", model=MODEL) as current:
+        response = await (client or _default_client()).messages.create(
+            model=MODEL,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            system=system,
+            messages=[{"role": "user", "content": user}],
+        )
+        current.set(**usage(response))
+    return "".join(
+        block.text for block in response.content if block.type == "text"
+    )
+
+
+async def code_creator_async(
+    context: list[dict],
+    query: str,
+    client: anthropic.AsyncAnthropic | None = None,
+) -> str:
+    return await _complete("code_creator", client, context, query, 1000)
+
+
+async def check_code_async(
+    output: PythonScript,
+    schema: pl.Schema | None = None,
+    client: anthropic.AsyncAnthropic | None = None,
+) -> str:
+    return await _complete(
+        "check_code",
+        client,
+        prompts.check_system(),
+        check_code_message(output, schema),
+        1000,
+    )
+
+
+async def translate_output_async(
+    output: PythonScript, client: anthropic.AsyncAnthropic | None = None
+) -> str:
+    return await _complete(
+        "translate_output",
+        client,
+        prompts.TRANSLATE,
+        translate_message(output),
+        200,
+    )
+
+
+async def translate_output_stream_async(
+    output: PythonScript, client: anthropic.AsyncAnthropic | None = None
+) -> AsyncIterator[str]:
+    with span("llm.translate_output", model=MODEL) as current:
+        async with (client or _default_client()).messages.stream(
+            model=MODEL,
+            temperature=0.7,
+            max_tokens=200,
+            system=prompts.TRANSLATE,
+            messages=[{"role": "user", "content": translate_message(output)}],
+        ) as stream:
+            async for chunk in stream.text_stream:
+                yield chunk
+            current.set(**usage(await stream.get_final_message()))
+
+
+async def execute_with_retry_async(
+    code: str,
+    data: pl.LazyFrame | Catalog,
+    max_retries=3,
+    client: anthropic.AsyncAnthropic | None = None,
+    schema: pl.Schema | None = None,
+) -> PythonScript:
+    """Async counterpart of `probe.main.execute_with_retry`."""
+    if schema is None:
+        schema = await asyncio.to_thread(data.collect_schema)
+    execution_result = await asyncio.to_thread(
+        repair_and_validate, code, data, schema, max_retries > 0
+    )
+
+    retry_count = 0
+    while execution_result.error and retry_count < max_retries:
+        retried()
+        with span(
+            "retry", attempt=retry_count + 1, error=execution_result.error
+        ):
+            checked_code = await check_code_async(
+                execution_result, schema, client
+            )
+            checked_execution = await asyncio.to_thread(
+                repair_and_validate,
+                checked_code,
+                data,
+                schema,
+                retry_count + 1 < max_retries,
+            )
+        if not checked_execution.error:
+            execution_result = checked_execution
+            break
+
+        retry_count += 1
+
+    return execution_result
+
+
+async def generate_code_async(
+    df: pl.LazyFrame | Catalog,
+    query: str,
+    data_context: DataContext,
+    max_retries: int = 0,
+    code_cache: CodeCache | None = cache.code_cache,
+    use_cache: bool = True,
+    client: anthropic.AsyncAnthropic | None = None,
+    compact_prompt: bool = False,
+) -> PythonScript:
+    """Async counterpart of `probe.main.generate_code`."""
+    output = await asyncio.to_thread(
+        cached_code,
+        df,
+        query,
+        data_context,
+        code_cache,
+        use_cache,
+        compact_prompt,
+    )
+    if output is None:
+        code = await code_creator_async(
+            prompts.code_system(data_context.prompt, compact_prompt),
+            query,
+            client,
+        )
+        output = await execute_with_retry_async(
+            code,
+            df,
+            max_retries=max_retries,
+            client=client,
+            schema=data_context.schema,
+        )
+        await asyncio.to_thread(
+            store_code, output, query, data_context, code_cache, compact_prompt
+        )
+    output.user_query = query
+    return output
+
+
+async def ask_async(
+    df: pl.LazyFrame | Catalog,
+    query: str,
+    max_retries: int = 0,
+    context_cache: ContextCache | None = context.context_cache,
+    code_cache: CodeCache | None = cache.code_cache,
+    result_cache: ResultCache | None = cache.result_cache,
+    use_cache: bool = True,
+    client: anthropic.AsyncAnthropic | None = None,
+    on_chunk: Callable[[str], Any] | None = None,
+    fast_answer: bool | None = None,
+    max_rows: int | None = None,
+    summary: bool = False,
+    limits: Limits | None = governor.DEFAULT_LIMITS,
+    approximate: bool | Sampling = False,
+    trace: bool | None = None,
+    profile: bool = False,
+    compact_prompt: bool = False,
+) -> PythonScript:
+    """
+    Async counterpart of `probe.ask`.
+
+    LLM calls go through `anthropic.AsyncAnthropic`. Everything else runs
+    the code of `probe.ask` on a thread, so the event loop is never blocked
+    by the model, the caches or Polars.
+
+    Args:
+        df: The data to query
+        query: The question to answer
+        client: The Anthropic client to use, defaults to a shared one
+        on_chunk: Called with each piece of the answer as it is streamed
+        approximate: Whether to answer from a sample first, see `probe.ask`
+        trace: Whether to trace the question, see `probe.ask`
+        profile: Whether to profile the generated query, see `probe.ask`
+        compact_prompt: Whether to send the short instructions, see
+            `probe.ask`
+
+    Returns:
+        PythonScript: The same result `probe.ask` would return
+    """
+    with tracing(query, trace) as current:
+        with span("context"):
+            data_context = await asyncio.to_thread(
+                context_cache.get
+                if context_cache is not None
+                else build_context,
+                df,
+            )
+        output = await generate_code_async(
+            df,
+            query,
+            data_context,
+            max_retries=max_retries,
+            code_cache=code_cache,
+            use_cache=use_cache,
+            client=client,
+            compact_prompt=compact_prompt,
+        )
+        output.trace = current
+        await asyncio.to_thread(
+            collect,
+            output,
+            df,
+            data_context,
+            approximate=approximate,
+            fast_answer=fast_answer,
+            limits=limits,
+            result_cache=result_cache,
+            use_cache=use_cache,
+            max_rows=max_rows,
+            summary=summary,
+            profile=profile,
+        )
+        if output.execution_error is not None:
+            return output
+
+        marker = output.approximation.marker() if output.approximation else ""
+        with span("translate") as translating:
+            output.answer = local_answer(output, fast_answer)
+            translating.set(
+                local=output.answer is not None, stream=on_chunk is not None
+            )
+            if output.answer is not None:
+                output.answer = marker + output.answer
+                if on_chunk is not None:
+                    on_chunk(output.answer)
+            elif on_chunk is None:
+                output.answer = marker + await translate_output_async(
+                    output, client
+                )
+            else:
+                chunks = [marker] if marker else []
+                if marker:
+                    on_chunk(marker)
+                async for chunk in translate_output_stream_async(
+                    output, client
+                ):
+                    chunks.append(chunk)
+                    on_chunk(chunk)
+                output.answer = "".join(chunks)
+        return output
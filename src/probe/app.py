@@ -1,25 +1,29 @@
-import time
+import sys
 from typing import Annotated
 
-import polars as pl
 import typer
 
-from probe import ask
+# Only the standard library is imported at module level: polars and the
+# model clients load inside the commands that need them
+from probe import server as probe_server
 
 app = typer.Typer()
+serve_app = typer.Typer()
 
 
-def stream_answer(text: str | None):
-    if text:
-        for word in text.split():
-            print(word, end=" ", flush=True)
-            time.sleep(0.05)
-        print()
+def print_chunk(chunk: str):
+    print(chunk, end="", flush=True)
+
+
+def fail(error: str):
+    """Reports a failed question on stderr and exits with status 1."""
+    print(error, file=sys.stderr)
+    raise typer.Exit(1)
 
 
 @app.command()
 def main(
-    data: Annotated[str, typer.Argument(help="Path to CSV data file")],
+    data: Annotated[str, typer.Argument(help="Data file, directory or glob")],
     query: Annotated[str, typer.Argument(help="Query to execute")],
     print_code: bool = typer.Option(
         False, "--print-code", help="Print generated code"
@@ -28,18 +32,174 @@ def main(
         False, "--print-output", help="Print raw output"
     ),
     retries: int = typer.Option(0, "--retries", help="Max retries"),
+    timeout: float | None = typer.Option(
+        None, "--timeout", help="Cancel the query after this many seconds"
+    ),
+    no_cache: bool = typer.Option(
+        False, "--no-cache", help="Ignore cached code and results"
+    ),
+    max_rows: int | None = typer.Option(
+        None, "--max-rows", help="Only collect this many result rows"
+    ),
+    no_convert: bool = typer.Option(
+        False, "--no-convert", help="Scan CSV files directly"
+    ),
+    no_types: bool = typer.Option(
+        False, "--no-types", help="Keep CSV columns as parsed"
+    ),
+    sidecar_format: str = typer.Option(
+        "parquet", "--sidecar-format", help="CSV sidecar format: parquet/ipc"
+    ),
+    approximate: float | None = typer.Option(
+        None,
+        "--approximate",
+        help="Answer first from this fraction of the rows, then exactly",
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Profile the generated query and print its plan and timings",
+    ),
+    compact_prompt: bool = typer.Option(
+        False,
+        "--compact-prompt",
+        help="Send the model shorter instructions, for fewer prompt tokens",
+    ),
+    server: str | None = typer.Option(
+        None,
+        "--server",
+        envvar="PROBE_SERVER",
+        help="Ask a running `probe serve` (host:port or unix:/path)",
+    ),
 ):
-    df = pl.scan_csv(data)
-    out = ask(
+    if server is not None:
+        # The server applies its own limits and answers exactly
+        local = {
+            "--timeout": timeout is not None,
+            "--approximate": approximate is not None,
+            "--profile": profile,
+        }
+        if rejected := [name for name, used in local.items() if used]:
+            raise typer.BadParameter(
+                f"{', '.join(rejected)} cannot be used with --server"
+            )
+        out = probe_server.ask_remote(
+            server,
+            data,
+            query,
+            max_retries=retries,
+            use_cache=not no_cache,
+            max_rows=max_rows,
+            compact_prompt=compact_prompt,
+        )
+        if out["error"]:
+            fail(out["error"])
+        print(out["answer"])
+        if print_code:
+            print("\n\n-------\n\n" + out["code"])
+        if print_output:
+            print("\n\n-------\n\n", out["console_output"])
+        return
+
+    from probe import ask, load
+    from probe.governor import DEFAULT_LIMITS, Limits
+    from probe.sampling import Sampling
+
+    limits = DEFAULT_LIMITS if timeout is None else Limits(timeout=timeout)
+
+    df = load(
+        data,
+        convert=not no_convert,
+        format=sidecar_format,
+        typed=not no_types,
+    )
+    output = ask(
         df,
         query,
         print_code=print_code,
         print_output=print_output,
         max_retries=retries,
         print_answer=False,
+        use_cache=not no_cache,
+        stream=True,
+        on_chunk=print_chunk,
+        max_rows=max_rows,
+        limits=limits,
+        approximate=(
+            Sampling(fraction=approximate)
+            if approximate is not None
+            else False
+        ),
+        profile=profile,
+        compact_prompt=compact_prompt,
     )
-    stream_answer(out.answer)
+    if output.error or output.execution_error is not None:
+        fail(output.error or output.execution_error.message)
+    print()
+    if output.profile is not None:
+        print("\n" + output.profile.describe())
+    if output.exact is not None:
+        exact = output.exact.result()
+        if exact.error or exact.execution_error is not None:
+            fail(exact.error or exact.execution_error.message)
+        print(exact.answer)
+
+
+@serve_app.command()
+def serve(
+    dataset: list[str] = typer.Option(
+        [], "--dataset", "-d", help="Dataset to keep loaded, as name=path"
+    ),
+    host: str = typer.Option(probe_server.DEFAULT_HOST, "--host"),
+    port: int = typer.Option(probe_server.DEFAULT_PORT, "--port"),
+    unix_socket: str | None = typer.Option(
+        None, "--socket", help="Listen on a Unix socket instead of TCP"
+    ),
+    no_convert: bool = typer.Option(
+        False, "--no-convert", help="Scan CSV files directly"
+    ),
+    timeout: float = typer.Option(
+        300.0, "--timeout", help="Cancel a query after this many seconds"
+    ),
+    max_memory_mb: int | None = typer.Option(
+        None, "--max-memory-mb", help="Cancel queries above this memory use"
+    ),
+    reject_risky: bool = typer.Option(
+        False, "--reject-risky", help="Refuse cross joins and similar plans"
+    ),
+    isolate: bool = typer.Option(
+        True,
+        "--isolate/--no-isolate",
+        help="Run each query in a worker process that can be killed",
+    ),
+    allow_paths: str | None = typer.Option(
+        None,
+        "--allow-paths",
+        help="Also serve files under this directory, loaded on first use",
+    ),
+):
+    from probe.governor import Limits
+
+    limits = Limits(
+        timeout=timeout,
+        max_memory=max_memory_mb * 2**20 if max_memory_mb else None,
+        reject_risky=reject_risky,
+        isolate=isolate,
+    )
+    datasets = probe_server.Datasets(allow_paths, convert=not no_convert)
+    for spec in dataset:
+        name, _, path = spec.partition("=")
+        datasets.register(name, path or name)
+    probe_server.serve(datasets, host, port, unix_socket, limits)
+
+
+def cli():
+    # `probe serve ...` starts the daemon, anything else asks a question
+    if sys.argv[1:2] == ["serve"]:
+        serve_app(args=sys.argv[2:], prog_name="probe serve")
+    else:
+        app()
 
 
 if __name__ == "__main__":
-    app()
+    cli()
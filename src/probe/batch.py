@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+
+from probe import cache, context, governor, main
+from probe.cache import CodeCache, ResultCache
+from probe.context import ContextCache, build_context
+from probe.governor import ExecutionError, Limits
+from probe.main import (
+    PythonScript,
+    generate_code,
+    local_answer,
+    set_result,
+    to_lazy,
+)
+
+
+def _fail(output: PythonScript, error: ExecutionError):
+    output.error = error.message
+    output.execution_error = error
+
+
+def _collect(
+    outputs: list[PythonScript],
+    df: pl.LazyFrame,
+    limits: Limits | None = governor.DEFAULT_LIMITS,
+) -> list[pl.DataFrame | None]:
+    lazy_frames = []
+    for output in outputs:
+        try:
+            lf = to_lazy(output, df)
+            if limits is not None:
+                output.plan_warnings = governor.check_plan(lf, limits)
+            lazy_frames.append(lf)
+        except governor.QueryAborted as e:
+            _fail(output, e.error)
+            lazy_frames.append(None)
+        except Exception as e:
+            _fail(output, ExecutionError(kind="runtime", message=str(e)))
+            lazy_frames.append(None)
+
+    valid = [lf for lf in lazy_frames if lf is not None]
+    try:
+        # One plan for every query, so the scan and common subplans are
+        # shared, run in the background under the time and memory limits
+        collected = iter(governor.collect_all(valid, limits))
+        return [
+            next(collected) if lf is not None else None for lf in lazy_frames
+        ]
+    except governor.QueryAborted:
+        pass
+
+    # A single failing query fails them all; fall back to one at a time
+    results = []
+    for output, lf in zip(outputs, lazy_frames):
+        result = None
+        if lf is not None:
+            try:
+                result = governor.collect(lf, limits)
+            except governor.QueryAborted as e:
+                _fail(output, e.error)
+        results.append(result)
+    return results
+
+
+def ask_many(
+    df: pl.LazyFrame,
+    queries: list[str],
+    concurrency: int = 8,
+    max_retries: int = 0,
+    context_cache: ContextCache | None = context.context_cache,
+    code_cache: CodeCache | None = cache.code_cache,
+    result_cache: ResultCache | None = cache.result_cache,
+    use_cache: bool = True,
+    fast_answer: bool | None = None,
+    limits: Limits | None = governor.DEFAULT_LIMITS,
+    compact_prompt: bool = False,
+) -> list[PythonScript]:
+    """
+    Answers several queries against the same data.
+
+    The schema context is built once, code generation and translation run
+    on a pool of `concurrency` threads, and every generated query is
+    collected in a single `pl.collect_all` call, which shares the scan of
+    the data, in the background under `limits`. With `isolate` or a memory
+    limit each query runs in its own worker instead. A query that fails keeps its
+    error on its own `PythonScript` without affecting the others.
+
+    Args:
+        df: The data to query
+        queries: The questions to answer
+        concurrency (int): Maximum number of concurrent LLM calls, defaults to 8
+        limits: Execution limits of every query, see `probe.governor.Limits`
+        compact_prompt: Whether to send the short instructions, see
+            `probe.ask`
+
+    Returns:
+        list[PythonScript]: One result per query, in the order given
+    """
+    data_context = (
+        context_cache.get(df)
+        if context_cache is not None
+        else build_context(df)
+    )
+
+    def generate(query: str) -> PythonScript:
+        try:
+            return generate_code(
+                df,
+                query,
+                data_context,
+                max_retries=max_retries,
+                code_cache=code_cache,
+                use_cache=use_cache,
+                compact_prompt=compact_prompt,
+            )
+        except Exception as e:
+            return PythonScript(user_query=query, code_str="", error=str(e))
+
+    def translate(output: PythonScript) -> PythonScript:
+        if output.error is None:
+            output.answer = local_answer(output, fast_answer)
+        if output.error is None and output.answer is None:
+            try:
+                output.answer = main.translate_output(output).text
+            except Exception as e:
+                output.error = str(e)
+        return output
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outputs = list(pool.map(generate, queries))
+
+        pending = []
+        for output in outputs:
+            if output.error:
+                continue
+            result = None
+            if use_cache and result_cache is not None:
+                result = result_cache.get(output.code_str, data_context.key)
+            if result is not None:
+                set_result(output, result)
+            else:
+                pending.append(output)
+
+        for output, result in zip(pending, _collect(pending, df, limits)):
+            if result is None:
+                continue
+            set_result(output, result)
+            if result_cache is not None:
+                result_cache.put(output.code_str, data_context.key, result)
+
+        return list(pool.map(translate, outputs))
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+
+import polars as pl
+
+from probe import prompts
+from probe.sources import is_local
+
+
+def prompt_version() -> str:
+    """A digest of every prompt template, so new prompts miss old code."""
+    templates = sorted(
+        (name, value)
+        for name, value in vars(prompts).items()
+        if name.isupper() and isinstance(value, str)
+    )
+    return hashlib.sha256(repr(templates).encode()).hexdigest()[:12]
+
+
+PROMPT_VERSION = prompt_version()
+
+
+def cache_dir() -> Path:
+    """Root directory for probe's on-disk caches, overridable with PROBE_CACHE_DIR."""
+    root = os.environ.get("PROBE_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache", "probe"
+    )
+    return Path(root)
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().rstrip("?.!").strip().lower()
+
+
+class CodeCache:
+    """
+    Persistent cache of generated code that ran successfully.
+
+    Entries are keyed by schema hash, normalized query, model and prompt
+    version, and stored in a SQLite file. Least recently used entries are
+    evicted once `max_entries` or `max_bytes` is exceeded, and entries older
+    than `ttl` seconds are ignored.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        max_entries: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float | None = 7 * 24 * 3600,
+    ):
+        self._path = Path(path) if path is not None else None
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._ready: Path | None = None
+
+    @property
+    def path(self) -> Path:
+        return self._path or cache_dir() / "code.sqlite"
+
+    def _connect(self) -> sqlite3.Connection:
+        path = self.path
+        if self._ready != path:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        if self._ready != path:
+            with conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS code (
+                        key TEXT PRIMARY KEY,
+                        code TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created REAL NOT NULL,
+                        accessed REAL NOT NULL
+                    )
+                    """
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS code_accessed ON code(accessed)"
+                )
+            self._ready = path
+        return conn
+
+    @staticmethod
+    def key(schema_hash: str, query: str, model: str) -> str:
+        parts = (schema_hash, normalize_query(query), model, PROMPT_VERSION)
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    def get(self, schema_hash: str, query: str, model: str) -> str | None:
+        key = self.key(schema_hash, query, model)
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute(
+                    "SELECT code, created FROM code WHERE key = ?", (key,)
+                ).fetchone()
+                if (
+                    row is not None
+                    and self.ttl is not None
+                    and now - row[1] > self.ttl
+                ):
+                    conn.execute("DELETE FROM code WHERE key = ?", (key,))
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute(
+                    "UPDATE code SET accessed = ? WHERE key = ?", (now, key)
+                )
+        finally:
+            conn.close()
+        self.hits += 1
+        return row[0]
+
+    def put(self, schema_hash: str, query: str, model: str, code: str):
+        key = self.key(schema_hash, query, model)
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO code VALUES (?, ?, ?, ?, ?)",
+                    (key, code, len(code.encode()), now, now),
+                )
+                self._evict(conn)
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection):
+        if self.ttl is not None:
+            conn.execute(
+                "DELETE FROM code WHERE created < ?", (time.time() - self.ttl,)
+            )
+        count, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM code"
+        ).fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        for key, entry_size in conn.execute(
+            "SELECT key, size FROM code ORDER BY accessed"
+        ).fetchall():
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM code WHERE key = ?", (key,))
+            count -= 1
+            size -= entry_size
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM code")
+        finally:
+            conn.close()
+
+    def __len__(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM code").fetchone()[0]
+        finally:
+            conn.close()
+
+
+code_cache = CodeCache()
+
+
+class ResultCache:
+    """
+    Cache of collected results stored as Arrow IPC files.
+
+    Entries are keyed by the generated code and the fingerprint of the data
+    it ran against, and are memory-mapped back on a hit. Least recently used
+    files are evicted once the directory grows past `max_bytes`. Results of
+    data only this process can identify, such as in-memory frames, are not
+    stored, since no other process could ever read them back.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        max_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self._path = Path(path) if path is not None else None
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def path(self) -> Path:
+        return self._path or cache_dir() / "results"
+
+    @staticmethod
+    def key(code: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\x1f{code}".encode()).hexdigest()
+
+    def _file(self, code: str, fingerprint: str) -> Path:
+        return self.path / f"{self.key(code, fingerprint)}.arrow"
+
+    def get(self, code: str, fingerprint: str) -> pl.DataFrame | None:
+        file = self._file(code, fingerprint)
+        try:
+            result = pl.read_ipc(file, memory_map=True)
+            os.utime(file)
+        except (OSError, pl.exceptions.PolarsError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, code: str, fingerprint: str, result: pl.DataFrame):
+        if is_local(fingerprint) or result.estimated_size() > self.max_bytes:
+            return
+        file = self._file(code, fingerprint)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        result.write_ipc(tmp)
+        os.replace(tmp, file)
+        self._evict(keep=file)
+
+    def _evict(self, keep: Path | None = None):
+        entries = []
+        for file in self.path.glob("*.arrow"):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, file in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            if file == keep:
+                continue
+            self._remove(file)
+            size -= entry_size
+
+    def _remove(self, file: Path):
+        file.unlink(missing_ok=True)
+
+    def clear(self):
+        for file in self.path.glob("*.arrow"):
+            file.unlink(missing_ok=True)
+
+    def __len__(self):
+        return sum(1 for _ in self.path.glob("*.arrow"))
+
+
+result_cache = ResultCache()
+
+
+class StateCache(ResultCache):
+    """
+    Cache of partial aggregates, with a watermark of the rows they cover.
+
+    Entries are keyed by the code computing them and the identity of the
+    data source, which does not change when rows are appended to it, so an
+    entry can be updated with the new rows instead of recomputed.
+    """
+
+    @property
+    def path(self) -> Path:
+        return self._path or cache_dir() / "aggregates"
+
+    def get_state(
+        self, code: str, identity: str
+    ) -> tuple[pl.DataFrame, dict] | None:
+        file = self._file(code, identity)
+        try:
+            watermark = json.loads(file.with_suffix(".json").read_text())
+        except (OSError, ValueError):
+            return None
+        state = self.get(code, identity)
+        return None if state is None else (state, watermark)
+
+    def put_state(
+        self, code: str, identity: str, state: pl.DataFrame, watermark: dict
+    ):
+        if state.estimated_size() > self.max_bytes:
+            return
+        file = self._file(code, identity)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp.write_text(json.dumps(watermark))
+        os.replace(tmp, file.with_suffix(".json"))
+        self.put(code, identity, state)
+
+    def _remove(self, file: Path):
+        # The watermark goes along with the state it describes
+        super()._remove(file)
+        file.with_suffix(".json").unlink(missing_ok=True)
+
+    def clear(self):
+        super().clear()
+        for file in self.path.glob("*.json"):
+            file.unlink(missing_ok=True)
+
+
+state_cache = StateCache()
@@ -0,0 +1,155 @@
+import hashlib
+from dataclasses import dataclass, field, replace
+
+import polars as pl
+
+from probe.sources import LOCAL, is_local, source_fingerprint
+
+
+@dataclass
+class Table:
+    name: str
+    df: pl.LazyFrame
+    key: list[str] = field(default_factory=list)
+    # Column of this table -> (referenced table, referenced column)
+    references: dict[str, tuple[str, str]] = field(default_factory=dict)
+
+
+class Catalog:
+    """
+    Several named LazyFrames that are asked about together.
+
+    Every table is available to the generated code as a variable named
+    after it, and `df` is the main table. Declared keys tell the model how
+    the tables join, so a question only joins the tables it needs instead
+    of requiring one denormalized table.
+
+    Example:
+        catalog = probe.Catalog()
+        catalog.register(
+            "sales",
+            sales,
+            references={
+                "customer_id": "customers",
+                "salesperson_id": "salespeople",
+            },
+        )
+        catalog.register("customers", customers, key="customer_id")
+        catalog.register("salespeople", salespeople, key="salesperson_id")
+        probe.ask(catalog, "Which country buys the most laptops?")
+    """
+
+    def __init__(self, main: str | None = None):
+        self._main = main
+        self.tables: dict[str, Table] = {}
+
+    def register(
+        self,
+        name: str,
+        df: pl.LazyFrame,
+        key: str | list[str] | None = None,
+        references: dict[str, str] | None = None,
+    ) -> "Catalog":
+        """
+        Adds a table to the catalog.
+
+        Args:
+            name: The variable name of the table in generated code
+            df: The data of the table
+            key: The column(s) identifying a row of the table
+            references: Foreign keys, from a column of this table to
+                "table" (its key) or "table.column"
+
+        Returns:
+            Catalog: The catalog itself, so calls can be chained
+        """
+        if not name.isidentifier() or name in ("df", "pl"):
+            raise ValueError(f"{name!r} cannot be used as a table name")
+        df = df.lazy()
+        columns = df.collect_schema().names()
+        key = [key] if isinstance(key, str) else list(key or [])
+        for column in key + list(references or {}):
+            if column not in columns:
+                raise ValueError(f"table {name!r} has no column {column!r}")
+        self.tables[name] = Table(
+            name,
+            df,
+            key,
+            {
+                column: tuple(target.partition(".")[::2])
+                for column, target in (references or {}).items()
+            },
+        )
+        return self
+
+    @property
+    def main_name(self) -> str:
+        """The name of the table bound to `df` in generated code."""
+        if not self.tables:
+            raise ValueError("the catalog has no tables")
+        return self._main or next(iter(self.tables))
+
+    @property
+    def main(self) -> pl.LazyFrame:
+        return self.tables[self.main_name].df
+
+    def collect_schema(self) -> pl.Schema:
+        """The columns of every table, the first table's dtype winning."""
+        schema = pl.Schema()
+        for table in self.tables.values():
+            for column, dtype in table.df.collect_schema().items():
+                schema.setdefault(column, dtype)
+        return schema
+
+    @property
+    def frames(self) -> dict[str, pl.LazyFrame]:
+        return {name: table.df for name, table in self.tables.items()}
+
+    def with_table(self, name: str, df: pl.LazyFrame) -> "Catalog":
+        """A copy of the catalog where table `name` holds other data."""
+        catalog = Catalog(self._main)
+        catalog.tables = dict(self.tables)
+        catalog.tables[name] = replace(self.tables[name], df=df)
+        return catalog
+
+    def relationships(self) -> list[tuple[str, str, str, str]]:
+        """
+        Returns:
+            list[tuple[str, str, str, str]]: (table, column, referenced
+            table, referenced column) for every declared foreign key
+        """
+        joins = []
+        for table in self.tables.values():
+            for column, (target, target_column) in table.references.items():
+                if target not in self.tables:
+                    raise KeyError(
+                        f"{table.name}.{column} references unknown table "
+                        f"{target!r}"
+                    )
+                if not target_column:
+                    target_key = self.tables[target].key
+                    target_column = (
+                        target_key[0] if len(target_key) == 1 else column
+                    )
+                joins.append((table.name, column, target, target_column))
+        return joins
+
+    def fingerprint(self) -> str:
+        """Identifies the tables, their sources and their relationships."""
+        digest = hashlib.sha256(repr(self.relationships()).encode())
+        local = False
+        for name, table in self.tables.items():
+            fingerprint = source_fingerprint(table.df)
+            local = local or is_local(fingerprint)
+            digest.update(f"{name}:{table.key}:{fingerprint}".encode())
+        digest.update(f"main:{self.main_name}".encode())
+        return (LOCAL if local else "") + digest.hexdigest()
+
+    def __getitem__(self, name: str) -> pl.LazyFrame:
+        return self.tables[name].df
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tables
+
+    def __len__(self) -> int:
+        return len(self.tables)
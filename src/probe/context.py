@@ -0,0 +1,234 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import polars as pl
+
+from probe import prompts
+from probe.catalog import Catalog
+from probe.sources import hive_partitions, source_fingerprint
+from probe.stats import load_stats, summarize
+
+# Partition values listed in the prompt, per partition column
+MAX_PARTITION_VALUES = 30
+
+
+@dataclass(frozen=True)
+class DataContext:
+    """The schema/sample block sent to the model for one data source."""
+
+    key: str
+    schema: pl.Schema
+    sample: pl.DataFrame
+    stats: str | None = None
+    partitions: dict[str, list[str]] | None = None
+
+    @property
+    def schema_hash(self) -> str:
+        return hashlib.sha256(
+            repr(list(self.schema.items())).encode()
+        ).hexdigest()
+
+    @property
+    def prompt(self) -> str:
+        prompt = prompts.DATA.format(self.schema, self.sample)
+        if categorical := categorical_columns(self.schema):
+            prompt += prompts.CATEGORICAL.format(", ".join(categorical))
+        if self.stats:
+            prompt += prompts.COLUMN_STATS.format(self.stats)
+        if self.partitions:
+            prompt += prompts.PARTITIONS.format(
+                ", ".join(self.partitions),
+                describe_partitions(self.partitions),
+            )
+        return prompt
+
+
+@dataclass(frozen=True)
+class CatalogContext(DataContext):
+    """
+    The context of a Catalog: the block of every table and how they join.
+
+    `schema` holds the columns of all tables, for repairing generated code.
+    """
+
+    main: str = ""
+    tables: dict[str, DataContext] = field(default_factory=dict)
+    relationships: list[tuple[str, str, str, str]] = field(
+        default_factory=list
+    )
+
+    @property
+    def schema_hash(self) -> str:
+        schemas = [
+            (name, list(table.schema.items()))
+            for name, table in self.tables.items()
+        ]
+        return hashlib.sha256(
+            repr((self.main, schemas, self.relationships)).encode()
+        ).hexdigest()
+
+    @property
+    def prompt(self) -> str:
+        prompt = prompts.DATA.format(
+            "\n".join(
+                f"{name}: {table.schema}"
+                for name, table in self.tables.items()
+            ),
+            "\n".join(
+                f"{name}:\n{table.sample}"
+                for name, table in self.tables.items()
+            ),
+        )
+        categorical = [
+            f"{name}.{column}"
+            for name, table in self.tables.items()
+            for column in categorical_columns(table.schema)
+        ]
+        if categorical:
+            prompt += prompts.CATEGORICAL.format(", ".join(categorical))
+        stats = [
+            f"{name}:\n{table.stats}"
+            for name, table in self.tables.items()
+            if table.stats
+        ]
+        if stats:
+            prompt += prompts.COLUMN_STATS.format("\n".join(stats))
+        joins = [
+            f"- {table}.{column} = {target}.{target_column}"
+            for table, column, target, target_column in self.relationships
+        ]
+        prompt += prompts.CATALOG.format(
+            ", ".join(self.tables),
+            self.main,
+            "\n".join(joins) or "No join keys were declared.",
+        )
+        return prompt
+
+
+def categorical_columns(schema: pl.Schema) -> list[str]:
+    """The Categorical and Enum columns, which have no `.str` methods."""
+    return [
+        name
+        for name, dtype in schema.items()
+        if isinstance(dtype, (pl.Categorical, pl.Enum))
+    ]
+
+
+def describe_partitions(partitions: dict[str, list[str]]) -> str:
+    lines = []
+    for key, values in partitions.items():
+        shown = ", ".join(values[:MAX_PARTITION_VALUES])
+        if len(values) > MAX_PARTITION_VALUES:
+            shown += f" and {len(values) - MAX_PARTITION_VALUES} more"
+        lines.append(f"- {key}: {shown}")
+    return "\n".join(lines)
+
+
+def build_catalog_context(
+    catalog: Catalog, key: str | None = None, stats: bool = True
+) -> CatalogContext:
+    tables = {
+        name: build_context(table.df, stats=stats)
+        for name, table in catalog.tables.items()
+    }
+    main = catalog.main_name
+    return CatalogContext(
+        key=key or catalog.fingerprint(),
+        schema=catalog.collect_schema(),
+        sample=tables[main].sample,
+        main=main,
+        tables=tables,
+        relationships=catalog.relationships(),
+    )
+
+
+def fingerprint(data: pl.LazyFrame | Catalog) -> str:
+    if isinstance(data, Catalog):
+        return data.fingerprint()
+    return source_fingerprint(data)
+
+
+def build_context(
+    df: pl.LazyFrame | Catalog, key: str | None = None, stats: bool = True
+) -> DataContext:
+    if isinstance(df, Catalog):
+        return build_catalog_context(df, key, stats)
+    key = key or source_fingerprint(df)
+    return DataContext(
+        key=key,
+        schema=df.collect_schema(),
+        sample=df.head(1).collect(),
+        stats=summarize(load_stats(df, key)) if stats else None,
+        partitions=hive_partitions(df) or None,
+    )
+
+
+class ContextCache:
+    """
+    LRU cache of DataContext objects keyed by source fingerprint.
+
+    Repeated questions on the same data reuse the schema and sample row
+    instead of scanning the source again.
+    """
+
+    def __init__(self, maxsize: int = 32, with_stats: bool = True):
+        self.maxsize = maxsize
+        self.with_stats = with_stats
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, DataContext] = OrderedDict()
+        self._lock = threading.Lock()
+        self._frame_locks: dict[int, threading.Lock] = {}
+
+    def _frame_lock(self, df: pl.LazyFrame | Catalog) -> threading.Lock:
+        # Polars raises if another thread touches the same LazyFrame while
+        # it is being resolved, so each frame is read by one thread at a time
+        with self._lock:
+            lock = self._frame_locks.get(id(df))
+            if lock is None:
+                lock = self._frame_locks[id(df)] = threading.Lock()
+                weakref.finalize(df, self._frame_locks.pop, id(df), None)
+            return lock
+
+    def get(self, df: pl.LazyFrame | Catalog) -> DataContext:
+        # The context is built outside the cache lock, so building one for
+        # a new source does not hold up lookups of the others
+        with self._frame_lock(df):
+            key = fingerprint(df)
+            with self._lock:
+                if key in self._entries:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+                self.misses += 1
+
+            context = build_context(df, key, stats=self.with_stats)
+            with self._lock:
+                self._entries[key] = context
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            return context
+
+    def invalidate(self, df: pl.LazyFrame | Catalog | None = None):
+        """Drops the entry for `df`, or every entry when `df` is None."""
+        with self._lock:
+            if df is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(fingerprint(df), None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+context_cache = ContextCache()
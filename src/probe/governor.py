@@ -0,0 +1,428 @@
+import asyncio
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Literal
+
+import polars as pl
+from pydantic import BaseModel
+
+# Windows and joins above these counts are reported as risky
+MAX_WINDOWS = 3
+MAX_JOINS = 3
+# Memory of a query with a memory limit is measured every this many seconds
+MEMORY_INTERVAL = 0.05
+
+_REDUCTION = re.compile(
+    r"\.(sum|mean|median|min|max|count|len|n_unique|first|last|std|var)\(\)"
+)
+
+
+@dataclass(frozen=True)
+class Limits:
+    """
+    Limits applied to every generated query.
+
+    Args:
+        timeout (float | None): Wall-clock seconds to wait for the query.
+            With `isolate` the query is then killed, without it probe only
+            stops waiting and Polars finishes the running operation in the
+            background
+        max_memory (int | None): Resident memory, in bytes, above which the
+            query is killed. Setting it collects in a worker process, as
+            with `isolate`, whose memory is measured where /proc exists
+        reject_risky (bool): Refuse to run plans with risky patterns instead
+            of only reporting them
+        isolate (bool): Collect in a worker process that is killed when a
+            limit is reached
+    """
+
+    timeout: float | None = 300.0
+    max_memory: int | None = None
+    reject_risky: bool = False
+    isolate: bool = False
+
+
+DEFAULT_LIMITS = Limits()
+
+
+class ExecutionError(BaseModel):
+    """Why a generated query did not produce a result."""
+
+    kind: Literal["code", "plan", "timeout", "memory", "runtime"]
+    message: str
+    findings: list[str] = []
+
+
+class QueryAborted(Exception):
+    def __init__(self, error: ExecutionError):
+        super().__init__(error.message)
+        self.error = error
+
+
+def _side_is_reduced(root: str) -> bool:
+    root = root.strip()
+    if root.startswith(("AGGREGATE", "SLICE")):
+        return True
+    return root.startswith("SELECT") and bool(_REDUCTION.search(root))
+
+
+def inspect_plan(lazy: pl.LazyFrame) -> list[str]:
+    """
+    Looks for patterns in the optimized plan that can blow up at runtime.
+
+    Args:
+        lazy: The query to inspect
+
+    Returns:
+        list[str]: A description of each risky pattern, empty if none
+    """
+    lines = lazy.explain().splitlines()
+    findings = []
+    for i, line in enumerate(lines):
+        if line.strip() != "CROSS JOIN:":
+            continue
+        # The first node under each side is the root of its plan
+        sides = " " * (len(line) - len(line.lstrip()))
+        roots = []
+        for j in range(i + 1, len(lines) - 1):
+            if lines[j].startswith(
+                (sides + "LEFT PLAN", sides + "RIGHT PLAN")
+            ):
+                roots.append(lines[j + 1])
+            if len(roots) == 2:
+                break
+        # Crossing with a single aggregated row is a common way to compute
+        # shares of a total, only a product of two tables is a problem
+        if not any(_side_is_reduced(root) for root in roots):
+            findings.append(
+                "cross join of two tables: the result has one row per pair "
+                "of input rows"
+            )
+
+    plan = "\n".join(lines)
+    if re.search(r"IEJOIN|NESTED LOOP", plan):
+        findings.append("inequality join: every row may match many rows")
+    joins = len(re.findall(r"^\s*END \w+ JOIN", plan, re.M))
+    if joins > MAX_JOINS:
+        findings.append(f"{joins} joins in one query")
+    windows = plan.count(".over(")
+    if windows > MAX_WINDOWS:
+        findings.append(f"{windows} window expressions over the whole data")
+    return findings
+
+
+def check_plan(lazy: pl.LazyFrame, limits: Limits) -> list[str]:
+    """
+    Inspects the plan, raising `QueryAborted` when `limits` reject it.
+
+    Returns:
+        list[str]: The risky patterns found, when they are allowed to run
+    """
+    findings = inspect_plan(lazy)
+    if findings and limits.reject_risky:
+        raise QueryAborted(
+            ExecutionError(
+                kind="plan",
+                message="The query was not run: " + "; ".join(findings),
+                findings=findings,
+            )
+        )
+    return findings
+
+
+def memory_usage(pid: int | str = "self") -> int | None:
+    """Resident memory of a process in bytes, None when unknown."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            resident = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident * os.sysconf("SC_PAGE_SIZE")
+
+
+def _runtime_error(e: Exception | str) -> QueryAborted:
+    return QueryAborted(ExecutionError(kind="runtime", message=str(e)))
+
+
+class _Background:
+    """
+    A collect running on a thread, so it can be waited for with a timeout.
+
+    Polars cannot interrupt an operation once it has started, so giving up
+    on the collect only stops waiting for it, and the operation running
+    finishes in the background.
+    """
+
+    # Whether `cancel` stops the query, rather than only waiting for it
+    kills = False
+
+    def __init__(self, collect: Callable[[], Any]):
+        self._result = None
+        self._error: Exception | None = None
+        self._done = threading.Event()
+        threading.Thread(
+            target=self._run, args=(collect,), daemon=True
+        ).start()
+
+    def _run(self, collect: Callable[[], Any]):
+        try:
+            self._result = collect()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def wait(self, timeout: float | None) -> bool:
+        return self._done.wait(timeout)
+
+    def fetch(self):
+        if self._error is not None:
+            raise _runtime_error(self._error)
+        return self._result
+
+    def memory(self) -> int | None:
+        # The resident memory of the process includes everything else it
+        # holds, so it says nothing about the query
+        return None
+
+    def cancel(self):
+        pass
+
+
+class _InProcess(_Background):
+    """A query collected on Polars' thread pool."""
+
+    def __init__(self, lazy: pl.LazyFrame):
+        self.query = lazy.collect(background=True)
+        super().__init__(self.query.fetch_blocking)
+
+    def cancel(self):
+        self.query.cancel()
+
+
+class _Shared(_Background):
+    """
+    Queries collected together by one `pl.collect_all`, so they share their
+    scans and common subplans.
+    """
+
+    def __init__(self, frames: list[pl.LazyFrame], comm_subplan_elim: bool):
+        super().__init__(
+            lambda: pl.collect_all(frames, comm_subplan_elim=comm_subplan_elim)
+        )
+
+
+def _run_isolated(directory: str):
+    """Entry point of the worker process started by `_Isolated`."""
+    target = os.path.join(directory, "result.arrow")
+    try:
+        with open(os.path.join(directory, "plan.bin"), "rb") as f:
+            lazy = pl.LazyFrame.deserialize(f)
+        lazy.collect().write_ipc(target)
+    except Exception as e:
+        with open(target + ".error", "w") as f:
+            f.write(str(e))
+
+
+class _Isolated:
+    """A query collected in a worker process, which is killed on cancel."""
+
+    kills = True
+
+    def __init__(self, lazy: pl.LazyFrame):
+        plan = lazy.serialize()
+        self.directory = tempfile.mkdtemp(prefix="probe-")
+        self.target = os.path.join(self.directory, "result.arrow")
+        with open(os.path.join(self.directory, "plan.bin"), "wb") as f:
+            f.write(plan)
+        # A fresh interpreter rather than multiprocessing, which would
+        # re-import the caller's __main__ module in the worker
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "probe.governor", self.directory],
+            stdin=subprocess.DEVNULL,
+        )
+
+    def wait(self, timeout: float | None) -> bool:
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return False
+        return True
+
+    def fetch(self) -> pl.DataFrame:
+        try:
+            if os.path.exists(self.target + ".error"):
+                with open(self.target + ".error") as f:
+                    raise _runtime_error(f.read())
+            if self.process.returncode != 0:
+                raise _runtime_error(
+                    "The query worker exited with code "
+                    f"{self.process.returncode}"
+                )
+            return pl.read_ipc(self.target, memory_map=False)
+        finally:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def memory(self) -> int | None:
+        return memory_usage(self.process.pid)
+
+    def cancel(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _isolated(limits: Limits) -> bool:
+    # Memory is only measured for a query with a process of its own
+    return limits.isolate or limits.max_memory is not None
+
+
+def _start(
+    frames: list[pl.LazyFrame], limits: Limits, comm_subplan_elim: bool
+) -> list:
+    isolated = _isolated(limits)
+    if comm_subplan_elim and len(frames) > 1 and not isolated:
+        return [_Shared(frames, comm_subplan_elim)]
+    jobs = []
+    try:
+        for frame in frames:
+            if isolated:
+                try:
+                    jobs.append(_Isolated(frame))
+                    continue
+                except pl.exceptions.ComputeError:
+                    # Plans calling Python functions cannot be serialized
+                    pass
+            jobs.append(_InProcess(frame))
+    except Exception as e:
+        _cancel(jobs)
+        raise _runtime_error(e) from e
+    return jobs
+
+
+def _check(jobs: list, limits: Limits, deadline: float | None):
+    """Raises `QueryAborted` when the queries went over a limit."""
+    if deadline is not None and time.monotonic() >= deadline:
+        message = (
+            f"The query was cancelled after {limits.timeout:g}s"
+            if all(job.kills for job in jobs)
+            else f"The query did not finish within {limits.timeout:g}s"
+        )
+        raise QueryAborted(ExecutionError(kind="timeout", message=message))
+    if limits.max_memory is not None:
+        memory = max((job.memory() or 0 for job in jobs), default=0)
+        if memory > limits.max_memory:
+            raise QueryAborted(
+                ExecutionError(
+                    kind="memory",
+                    message=(
+                        f"The query was cancelled at {memory / 2**20:,.0f} "
+                        f"MiB of memory, above the "
+                        f"{limits.max_memory / 2**20:,.0f} MiB limit"
+                    ),
+                )
+            )
+
+
+def _timeout(limits: Limits, deadline: float | None) -> float | None:
+    """How long to wait for a query before checking the limits again."""
+    timeout = None
+    if deadline is not None:
+        timeout = max(deadline - time.monotonic(), 0)
+    if limits.max_memory is not None:
+        timeout = min(timeout, MEMORY_INTERVAL) if timeout else MEMORY_INTERVAL
+    return timeout
+
+
+def _wait(jobs: list, limits: Limits) -> list:
+    """Waits for every query, cancelling all of them at the limits."""
+    deadline = None
+    if limits.timeout is not None:
+        deadline = time.monotonic() + limits.timeout
+    results = []
+    try:
+        for job in jobs:
+            while not job.wait(_timeout(limits, deadline)):
+                _check(jobs, limits, deadline)
+            results.append(job.fetch())
+    except QueryAborted:
+        _cancel(jobs)
+        raise
+    except Exception as e:
+        _cancel(jobs)
+        raise _runtime_error(e) from e
+    if len(jobs) == 1 and isinstance(jobs[0], _Shared):
+        return results[0]
+    return results
+
+
+def _cancel(jobs: list):
+    for job in jobs:
+        job.cancel()
+
+
+def _unlimited(limits: Limits | None) -> bool:
+    return limits is None or (
+        limits.timeout is None
+        and limits.max_memory is None
+        and not limits.isolate
+    )
+
+
+def collect_all(
+    frames: list[pl.LazyFrame],
+    limits: Limits | None = DEFAULT_LIMITS,
+    comm_subplan_elim: bool = True,
+) -> list[pl.DataFrame]:
+    """
+    Collects queries concurrently, giving up on them at the limits.
+
+    Args:
+        frames: The queries to run
+        limits: The wall-clock and memory limits, None for no limits
+        comm_subplan_elim (bool): Run the queries in a single
+            `pl.collect_all`, sharing their common subplans. With `isolate`
+            every query runs in its own worker instead
+
+    Returns:
+        list[pl.DataFrame]: The results, in the order of `frames`
+
+    Raises:
+        QueryAborted: When a query fails or goes over a limit
+    """
+    if _unlimited(limits):
+        try:
+            return pl.collect_all(frames, comm_subplan_elim=comm_subplan_elim)
+        except Exception as e:
+            raise _runtime_error(e) from e
+
+    return _wait(_start(frames, limits, comm_subplan_elim), limits)
+
+
+def collect(
+    lazy: pl.LazyFrame, limits: Limits | None = DEFAULT_LIMITS
+) -> pl.DataFrame:
+    return collect_all([lazy], limits)[0]
+
+
+async def collect_all_async(
+    frames: list[pl.LazyFrame],
+    limits: Limits | None = DEFAULT_LIMITS,
+    comm_subplan_elim: bool = True,
+) -> list[pl.DataFrame]:
+    """Async counterpart of `collect_all`, waiting on a thread."""
+    return await asyncio.to_thread(
+        collect_all, frames, limits, comm_subplan_elim
+    )
+
+
+if __name__ == "__main__":
+    _run_isolated(sys.argv[1])
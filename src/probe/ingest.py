@@ -0,0 +1,338 @@
+import glob
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+
+import polars as pl
+
+from probe.cache import cache_dir
+
+SIDECAR_DIR = ".probe"
+SIDECAR_VERSION = 3
+CSV_INFER_SCHEMA_LENGTH = 10_000
+
+# Type profiling: string columns whose sampled values all parse with one of
+# these formats become temporal, and columns with few distinct values
+# become categorical
+PROFILE_SAMPLE_ROWS = 10_000
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y"]
+DATETIME_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S%.f",
+    "%Y-%m-%d %H:%M:%S%.f",
+    "%Y-%m-%dT%H:%M:%S%.fZ",
+    "%Y-%m-%dT%H:%M:%S%.f%z",
+    "%Y-%m-%dT%H:%M",
+    "%Y-%m-%d %H:%M",
+]
+MAX_CATEGORIES = 10_000
+CATEGORY_RATIO = 0.1
+CATEGORICAL = "categorical"
+
+SCANNERS = {
+    ".parquet": pl.scan_parquet,
+    ".arrow": pl.scan_ipc,
+    ".ipc": pl.scan_ipc,
+    ".feather": pl.scan_ipc,
+    ".ndjson": pl.scan_ndjson,
+    ".jsonl": pl.scan_ndjson,
+    ".csv": pl.scan_csv,
+}
+
+FORMATS = {"parquet": ".parquet", "ipc": ".arrow"}
+# Formats Polars can read hive partition columns (key=value directories) from
+HIVE_SCANNERS = {".parquet", ".arrow", ".ipc", ".feather"}
+
+
+def sidecar_dir(path: Path) -> Path:
+    """
+    Where the columnar copy of `path` lives.
+
+    Defaults to a `.probe` directory next to the source, falling back to
+    probe's cache directory when the source directory is read-only.
+    """
+    local = path.parent / SIDECAR_DIR
+    try:
+        local.mkdir(exist_ok=True)
+        if os.access(local, os.W_OK):
+            return local
+    except OSError:
+        pass
+    digest = hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:16]
+    remote = cache_dir() / "sidecars" / digest
+    remote.mkdir(parents=True, exist_ok=True)
+    return remote
+
+
+def detect_temporal_format(values: pl.Series) -> str | None:
+    """Returns the first date/datetime format that parses every value."""
+    values = values.drop_nulls()
+    if values.is_empty():
+        return None
+    for fmt in DATE_FORMATS + DATETIME_FORMATS:
+        parse = (
+            values.str.to_date
+            if fmt in DATE_FORMATS
+            else values.str.to_datetime
+        )
+        try:
+            parsed = parse(fmt, strict=False)
+        except pl.exceptions.PolarsError:
+            continue
+        if parsed.null_count() == 0:
+            return fmt
+    return None
+
+
+def _parse(column: pl.Expr, fmt: str) -> pl.Expr:
+    if fmt in DATE_FORMATS:
+        return column.str.to_date(fmt, strict=False)
+    return column.str.to_datetime(fmt, strict=False)
+
+
+def infer_types(lf: pl.LazyFrame) -> dict[str, str]:
+    """
+    Profiles the string columns of a LazyFrame.
+
+    Temporal formats are detected on a sample of rows, then checked against
+    every row along with the number of distinct values, in one pass over
+    the whole data, so a value further down in another format keeps its
+    column a string instead of turning into a null.
+
+    Args:
+        lf: The data to profile
+
+    Returns:
+        dict[str, str]: Column name to either a temporal format string or
+        "categorical", for the columns that should be converted
+    """
+    schema = lf.collect_schema()
+    strings = [name for name, dtype in schema.items() if dtype == pl.String]
+    if not strings:
+        return {}
+
+    formats = {}
+    sample = lf.select(strings).head(PROFILE_SAMPLE_ROWS).collect()
+    for name in strings:
+        fmt = detect_temporal_format(sample[name])
+        if fmt is not None:
+            formats[name] = fmt
+
+    counts = lf.select(
+        pl.len().alias("__rows"),
+        pl.col(strings).n_unique(),
+        *(
+            (
+                _parse(pl.col(name), fmt).null_count()
+                - pl.col(name).null_count()
+            ).alias(f"__unparsed:{name}")
+            for name, fmt in formats.items()
+        ),
+    ).collect()
+    rows = counts["__rows"].item()
+    types = {}
+    for name in strings:
+        if name in formats and counts[f"__unparsed:{name}"].item() == 0:
+            types[name] = formats[name]
+            continue
+        n_unique = counts[name].item()
+        if n_unique <= MAX_CATEGORIES and n_unique <= rows * CATEGORY_RATIO:
+            types[name] = CATEGORICAL
+    return types
+
+
+def apply_types(lf: pl.LazyFrame, types: dict[str, str]) -> pl.LazyFrame:
+    """Converts columns as described by `infer_types`."""
+    exprs = []
+    for name, kind in types.items():
+        column = pl.col(name)
+        if kind == CATEGORICAL:
+            # Lexical ordering keeps sort() alphabetical like plain strings
+            exprs.append(column.cast(pl.Categorical("lexical")))
+        else:
+            exprs.append(_parse(column, kind))
+    return lf.with_columns(exprs) if exprs else lf
+
+
+def _source_meta(path: Path, format: str, typed: bool) -> dict:
+    stat = path.stat()
+    return {
+        "version": SIDECAR_VERSION,
+        "source": str(path.resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "format": format,
+        "typed": typed,
+    }
+
+
+def _read_meta(path: Path) -> dict | None:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write(lf: pl.LazyFrame, target: Path, format: str):
+    tmp = target.with_name(f"{target.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        if format == "parquet":
+            lf.sink_parquet(tmp)
+        else:
+            lf.sink_ipc(tmp)
+    except pl.exceptions.InvalidOperationError:
+        # Plans the streaming engine cannot run are collected in memory
+        df = lf.collect()
+        if format == "parquet":
+            df.write_parquet(tmp)
+        else:
+            df.write_ipc(tmp)
+    os.replace(tmp, target)
+
+
+def _scan(target: Path, types: dict[str, str]) -> pl.LazyFrame:
+    lf = SCANNERS[target.suffix](target)
+    # Columnar files do not keep the categorical ordering
+    categorical = [name for name, kind in types.items() if kind == CATEGORICAL]
+    if categorical:
+        lf = lf.with_columns(
+            pl.col(categorical).cast(pl.Categorical("lexical"))
+        )
+    return lf
+
+
+def convert_csv(
+    path: str | Path, format: str = "parquet", typed: bool = True
+) -> tuple[Path, dict[str, str]]:
+    """
+    Converts a CSV file to a columnar sidecar, reusing an up-to-date one.
+
+    The sidecar is rebuilt whenever the size or modification time of the
+    CSV changes. With `typed`, the converted data is profiled once and
+    temporal strings and low-cardinality text columns are stored as
+    Date/Datetime and Categorical.
+
+    Args:
+        path: The CSV file to convert
+        format (str): "parquet" or "ipc", defaults to "parquet"
+        typed (bool): Convert column types, defaults to True
+
+    Returns:
+        tuple[Path, dict[str, str]]: The sidecar file and the converted types
+    """
+    if format not in FORMATS:
+        raise ValueError(
+            f"format must be one of {list(FORMATS)}, got {format!r}"
+        )
+    path = Path(path)
+    directory = sidecar_dir(path)
+    target = directory / f"{path.name}{FORMATS[format]}"
+    meta_file = directory / f"{path.name}.json"
+
+    source = _source_meta(path, format, typed)
+    meta = _read_meta(meta_file)
+    if target.exists() and meta is not None and meta.get("source") == source:
+        return target, meta.get("types", {})
+
+    lf = pl.scan_csv(path, infer_schema_length=CSV_INFER_SCHEMA_LENGTH)
+    _write(lf, target, format)
+    types = {}
+    if typed:
+        # Profile the columnar copy rather than parsing the CSV a second time
+        types = infer_types(SCANNERS[target.suffix](target))
+        if types:
+            typed_target = target.with_name(f"{target.name}.typed")
+            _write(
+                apply_types(SCANNERS[target.suffix](target), types),
+                typed_target,
+                format,
+            )
+            os.replace(typed_target, target)
+    meta_file.write_text(json.dumps({"source": source, "types": types}))
+    return target, types
+
+
+def is_dataset(path: str | Path) -> bool:
+    """Whether `path` is a directory or a glob of files rather than a file."""
+    return glob.has_magic(str(path)) or Path(path).is_dir()
+
+
+def dataset_files(path: str | Path) -> list[Path]:
+    """The data files of a directory (searched recursively) or a glob."""
+    if Path(path).is_dir():
+        files = [
+            file
+            for file in Path(path).rglob("*")
+            if file.suffix.lower() in SCANNERS
+            and SIDECAR_DIR not in file.parts
+        ]
+    else:
+        files = [Path(file) for file in glob.glob(str(path), recursive=True)]
+    return sorted(file for file in files if file.is_file())
+
+
+def scan_dataset(path: str | Path) -> pl.LazyFrame:
+    """
+    Scans every file of a directory or glob as one LazyFrame.
+
+    Parquet and Arrow IPC datasets laid out as hive partitions
+    (`year=2024/month=7/...`) get the partition keys as columns, and
+    filters on them skip the files of other partitions at scan time.
+
+    Args:
+        path: A directory or a glob pattern
+
+    Returns:
+        pl.LazyFrame: A scan of all the files
+    """
+    files = dataset_files(path)
+    if not files:
+        raise FileNotFoundError(f"no data files found in {path}")
+    suffixes = {file.suffix.lower() for file in files}
+    if len(suffixes) > 1:
+        raise ValueError(
+            f"{path} mixes file formats: {', '.join(sorted(suffixes))}"
+        )
+    suffix = suffixes.pop()
+    source = str(path)
+    if Path(path).is_dir() and suffix not in HIVE_SCANNERS:
+        source = str(Path(path) / "**" / f"*{suffix}")
+    if suffix in HIVE_SCANNERS:
+        return SCANNERS[suffix](source, hive_partitioning=True)
+    return SCANNERS.get(suffix, pl.scan_csv)(source)
+
+
+def load(
+    path: str | Path,
+    convert: bool = True,
+    format: str = "parquet",
+    typed: bool = True,
+) -> pl.LazyFrame:
+    """
+    Scans a data file, converting CSV files to a columnar sidecar first.
+
+    Directories and globs are scanned as one dataset with `scan_dataset`,
+    without conversion. Parsing CSV text is usually most of the time spent
+    on a question, so the first load of a CSV writes a Parquet (or Arrow
+    IPC) copy next to it and later loads scan that copy instead. The copy
+    stores dates as temporal types and low-cardinality text as Categorical,
+    so generated queries do not re-parse them.
+
+    Args:
+        path: The file, directory or glob to load
+        convert (bool): Convert CSV files to a sidecar, defaults to True
+        format (str): Sidecar format, "parquet" or "ipc"
+        typed (bool): Convert column types in the sidecar, defaults to True
+
+    Returns:
+        pl.LazyFrame: A scan of the data
+    """
+    if is_dataset(path):
+        return scan_dataset(path)
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".csv" and convert:
+        target, types = convert_csv(path, format, typed)
+        return _scan(target, types)
+    return SCANNERS.get(suffix, pl.scan_csv)(path)
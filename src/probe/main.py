@@ -1,14 +1,42 @@
-from typing import Any
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Iterator
 
-import ell
 import polars as pl
-from ell.types import Message
 from pydantic import BaseModel, Field
 
-from probe import prompts
+from probe import (
+    aggregates,
+    cache,
+    context,
+    governor,
+    profiling,
+    prompts,
+    repair,
+    rollups,
+    sampling,
+    sources,
+)
+from probe.cache import CodeCache, ResultCache, StateCache
+from probe.catalog import Catalog
+from probe.context import ContextCache, DataContext, build_context
+from probe.governor import ExecutionError, Limits
+from probe.profiling import QueryProfile
+from probe.render import render_answer
+from probe.rollups import RollupStore
+from probe.sampling import Approximation, SampleCache, Sampling
+from probe.trace import Trace, retried, span, tracing, usage
+
+if TYPE_CHECKING:
+    import anthropic
+
+    from probe.stages import Reply
 
 MODEL = "claude-3-5-sonnet-20241022"
 
+_client: "anthropic.Anthropic | None" = None
+_refiner: ThreadPoolExecutor | None = None
+
 
 class PythonScript(BaseModel, arbitrary_types_allowed=True):
     user_query: str | None = None
@@ -18,45 +46,75 @@ class PythonScript(BaseModel, arbitrary_types_allowed=True):
     console_output: str | None = None
     answer: str | None = None
     result: Any = None
+    row_count: int | None = None
+    repairs: list[str] = []
+    execution_error: ExecutionError | None = None
+    plan_warnings: list[str] = []
+    from_rollup: bool = False
+    approximation: Approximation | None = None
+    # Resolves to the exact PythonScript of an approximate answer
+    exact: Future | None = None
+    trace: Trace | None = None
+    profile: QueryProfile | None = None
 
 
-@ell.complex(
-    model=MODEL,
-    temperature=0.7,
-    max_tokens=1000,
-)
-def code_creator(df: pl.LazyFrame, query: str):
-    return [
-        ell.system(
-            prompts.SYS_PROMPT.format(df.collect_schema(), df.head(1).collect())
-            + f"\n{prompts.POLARS_TWEAKS}"
-        ),
-        ell.user(query),
-    ]
+def _stages():
+    # The Anthropic client takes most of probe's import time, so the LLM
+    # stages in `probe.stages` are only imported when a question needs the
+    # model
+    from probe import stages
 
+    return stages
 
-@ell.complex(
-    model=MODEL,
-    temperature=0.7,
-    max_tokens=1000,
-)
-def check_code(output: PythonScript):
-    return [
-        ell.system(prompts.CHECK_CODE),
-        ell.user(f"""
+
+def _call_model(name: str, *args) -> "Reply":
+    with span(f"llm.{name}", model=MODEL) as current:
+        reply = getattr(_stages(), name)(*args)
+        current.set(**reply.usage)
+    return reply
+
+
+def _code_model(compact_prompt: bool) -> str:
+    # Code written from the compact prompt is cached apart from the other
+    return f"{MODEL}+compact" if compact_prompt else MODEL
+
+
+def code_creator(context: list[dict], query: str) -> "Reply":
+    return _call_model("code_creator", context, query)
+
+
+def check_code(
+    output: PythonScript, schema: pl.Schema | None = None
+) -> "Reply":
+    return _call_model("check_code", output, schema)
+
+
+def translate_output(output: PythonScript) -> "Reply":
+    return _call_model("translate_output", output)
+
+
+def check_code_message(
+    output: PythonScript, schema: pl.Schema | None = None
+) -> str:
+    return f"""
+        Schema of `df`:
+        {schema}
 
         Code being checked:
-        {output.code}
+        {output.code_str}
 
         Error/Output:
         {output.error}
-        """),
-    ]
+        """
 
 
-def safe_eval(code: str, data: pl.LazyFrame) -> PythonScript:
+def safe_eval(code: str, data: pl.LazyFrame | Catalog) -> PythonScript:
+    tables = {}
+    if isinstance(data, Catalog):
+        tables, data = data.frames, data.main
     # Create restricted globals
     safe_globals = {
+        **tables,
         "pl": pl,
         "df": data,
         "print": print,
@@ -77,37 +135,96 @@ def safe_eval(code: str, data: pl.LazyFrame) -> PythonScript:
     }
 
     output = PythonScript(code_str=code)
-    try:
-        output.code = eval(code, safe_globals, safe_globals)
-    except Exception as e:
-        output.error = str(e)
+    with span("safe_eval") as current:
+        try:
+            output.code = eval(code, safe_globals, safe_globals)
+        except Exception as e:
+            output.error = str(e)
+            current.set(error=output.error)
+    return output
+
+
+def validate(code: str, data: pl.LazyFrame | Catalog) -> PythonScript:
+    """Evaluates code and resolves the schema of its result, without running it."""
+    output = safe_eval(code, data)
+    if not output.error:
+        try:
+            to_lazy(output, data).collect_schema()
+        except Exception as e:
+            output.error = str(e)
+    return output
+
+
+def repair_and_validate(
+    code: str,
+    data: pl.LazyFrame | Catalog,
+    schema: pl.Schema,
+    retries_left: bool = True,
+) -> PythonScript:
+    """
+    Validates code after fixing the mistakes `probe.repair` knows about.
+
+    Args:
+        code: The generated code
+        data: The data the code runs on
+        schema: The schema of `data`
+        retries_left: Whether a failure would be sent back to the model,
+            see `probe.repair.record`
+
+    Returns:
+        PythonScript: The repaired script, or the original one when the
+        repairs did not help
+    """
+    repaired, fixes = repair.repair_code(
+        code, schema.names(), context.categorical_columns(schema)
+    )
+    output = validate(repaired, data)
+    if not fixes:
+        return output
+    if output.error:
+        original = validate(code, data)
+        if not original.error:
+            return original
+    output.repairs = fixes
+    repair.record(not output.error, retries_left)
     return output
 
 
 def execute_with_retry(
-    initial_code_result: Message, data: pl.LazyFrame, max_retries=3
+    initial_code_result: "Reply",
+    data: pl.LazyFrame | Catalog,
+    max_retries=3,
+    schema: pl.Schema | None = None,
 ) -> PythonScript:
     """
     Executes code with retry attempts if errors occur.
 
+    Every script is repaired locally and validated against the schema
+    before the model is asked to fix it.
+
     Args:
         initial_code_result: The initial code execution result
         max_retries (int): Maximum number of retry attempts, defaults to 3
+        schema: The schema of `data`, resolved from it when not given
 
     Returns:
         PythonScript: The final execution result after retries
     """
-    execution_result = safe_eval(
-        initial_code_result.text.replace("groupby", "group_by"), data
+    schema = schema if schema is not None else data.collect_schema()
+    execution_result = repair_and_validate(
+        initial_code_result.text, data, schema, max_retries > 0
     )
 
     retry_count = 0
     while execution_result.error and retry_count < max_retries:
-        print("RETRYING", execution_result.error, execution_result.code_str)
-        checked_code = check_code(execution_result)
-        print(checked_code)
-        checked_execution = safe_eval(checked_code.text, data)
-        print(checked_execution)
+        retried()
+        with span(
+            "retry", attempt=retry_count + 1, error=execution_result.error
+        ):
+            checked_code = check_code(execution_result, schema)
+            checked_execution = repair_and_validate(
+                checked_code.text, data, schema, retry_count + 1 < max_retries
+            )
         if not checked_execution.error:
             execution_result = checked_execution
             break
@@ -117,54 +234,650 @@ def execute_with_retry(
     return execution_result
 
 
-@ell.complex(
-    model=MODEL,
-    temperature=0.7,
-    max_tokens=200,
-)
-def translate_output(output: PythonScript):
-    return [
-        ell.system(prompts.TRANSLATE),
-        ell.user(
-            f"Query: {output.user_query}, console_output:\n{output.console_output}"
-        ),
+def translate_message(output: PythonScript) -> str:
+    return (
+        f"Query: {output.user_query}, console_output:\n{output.console_output}"
+    )
+
+
+def generate_code(
+    df: pl.LazyFrame | Catalog,
+    query: str,
+    data_context: DataContext,
+    max_retries: int = 0,
+    code_cache: CodeCache | None = cache.code_cache,
+    use_cache: bool = True,
+    compact_prompt: bool = False,
+) -> PythonScript:
+    output = cached_code(
+        df, query, data_context, code_cache, use_cache, compact_prompt
+    )
+    if output is None:
+        output = code_creator(
+            prompts.code_system(data_context.prompt, compact_prompt), query
+        )
+        output = execute_with_retry(
+            output,
+            data=df,
+            max_retries=max_retries,
+            schema=data_context.schema,
+        )
+        store_code(output, query, data_context, code_cache, compact_prompt)
+    output.user_query = query
+    return output
+
+
+def cached_code(
+    df: pl.LazyFrame | Catalog,
+    query: str,
+    data_context: DataContext,
+    code_cache: CodeCache | None,
+    use_cache: bool = True,
+    compact_prompt: bool = False,
+) -> PythonScript | None:
+    """The code generated before for `query`, None when it does not run."""
+    if not use_cache or code_cache is None:
+        return None
+    code = code_cache.get(
+        data_context.schema_hash, query, _code_model(compact_prompt)
+    )
+    if code is None:
+        return None
+    output = safe_eval(code, df)
+    return None if output.error else output
+
+
+def store_code(
+    output: PythonScript,
+    query: str,
+    data_context: DataContext,
+    code_cache: CodeCache | None,
+    compact_prompt: bool = False,
+):
+    if not output.error and code_cache is not None:
+        code_cache.put(
+            data_context.schema_hash,
+            query,
+            _code_model(compact_prompt),
+            output.code_str,
+        )
+
+
+def to_lazy(output: PythonScript, df: pl.LazyFrame | Catalog) -> pl.LazyFrame:
+    if isinstance(output.code, pl.Expr):
+        if isinstance(df, Catalog):
+            df = df.main
+        return df.select(output.code)
+    return output.code.lazy()
+
+
+def set_result(output: PythonScript, result: pl.DataFrame):
+    output.result = result
+    output.row_count = result.height
+    with pl.Config(tbl_rows=100, fmt_str_lengths=50):
+        output.console_output = str(result)
+
+
+def bounded_frames(
+    lazy: pl.LazyFrame, max_rows: int, summary: bool = False
+) -> list[pl.LazyFrame]:
+    frames = [lazy.head(max_rows), lazy.select(pl.len())]
+    if summary:
+        numeric = lazy.select(pl.selectors.numeric())
+        frames.append(
+            pl.concat(
+                [
+                    getattr(numeric, stat)().select(
+                        pl.lit(stat).alias("statistic"), pl.all()
+                    )
+                    for stat in ("null_count", "min", "max", "mean")
+                ],
+                how="diagonal_relaxed",
+            )
+        )
+    return frames
+
+
+def set_bounded_result(
+    output: PythonScript,
+    lazy: pl.LazyFrame,
+    head: pl.DataFrame,
+    row_count: pl.DataFrame,
+    stats: pl.DataFrame | None = None,
+):
+    """
+    Stores a preview of a result that was not fully collected.
+
+    `output.result` stays a LazyFrame the caller can collect or sink, while
+    the console output only holds the first rows, the exact row count and,
+    optionally, summary statistics of the numeric columns.
+    """
+    output.result = lazy
+    output.row_count = row_count.item()
+    with pl.Config(tbl_rows=100, fmt_str_lengths=50):
+        console_output = str(head)
+        if output.row_count > head.height:
+            console_output += (
+                f"\nShowing the first {head.height} of "
+                f"{output.row_count} rows."
+            )
+        if stats is not None and stats.width > 1:
+            console_output += f"\nSummary of all rows:\n{stats}"
+    output.console_output = console_output
+
+
+def execute_incremental(
+    output: PythonScript,
+    df: pl.LazyFrame | Catalog,
+    limits: Limits | None = governor.DEFAULT_LIMITS,
+    state_cache: StateCache = cache.state_cache,
+) -> pl.DataFrame | None:
+    """
+    Runs a decomposable query from partial aggregates kept between runs.
+
+    The partial aggregates of `output.code` are stored with a watermark of
+    the rows they cover. When rows were only appended to the data since,
+    the query runs on the new rows and the partial aggregates are combined;
+    otherwise it runs on all rows and they are stored again.
+
+    Returns:
+        pl.DataFrame | None: The result, or None when the query cannot be
+        computed from partial aggregates or the data is not a file scan
+    """
+    try:
+        return _execute_incremental(output, df, limits, state_cache)
+    except governor.QueryAborted:
+        raise
+    except Exception:
+        # Running the query itself reports its errors, if it has any
+        return None
+
+
+def _execute_incremental(
+    output: PythonScript,
+    df: pl.LazyFrame | Catalog,
+    limits: Limits | None,
+    state_cache: StateCache,
+) -> pl.DataFrame | None:
+    if isinstance(df, Catalog) or not aggregates.appendable(df):
+        return None
+    decomposition = aggregates.decompose(output.code_str)
+    if decomposition is None:
+        return None
+    identity = sources.source_identity(df)
+    if identity is None:
+        return None
+
+    saved = state_cache.get_state(decomposition.partial, identity)
+    rows = saved[1]["rows"] if saved is not None else None
+    length, first, last, *previous = governor.collect_all(
+        aggregates.watermark_frames(df, rows), limits
+    )
+    current = aggregates.watermark(length, first, last)
+    if rows and aggregates.appended(saved[1], current, *previous):
+        state = saved[0]
+        if current["rows"] > rows:
+            delta = df.slice(rows)
+            partial = to_lazy(safe_eval(decomposition.partial, delta), delta)
+            state = aggregates.combine(
+                [state, governor.collect(partial, limits)], decomposition
+            )
+        aggregates.record(current["rows"] - rows, skipped_rows=rows)
+    else:
+        partial = safe_eval(decomposition.partial, df)
+        if partial.error:
+            return None
+        state = aggregates.combine(
+            [governor.collect(to_lazy(partial, df), limits)], decomposition
+        )
+        aggregates.record(None)
+    state_cache.put_state(decomposition.partial, identity, state, current)
+
+    final = safe_eval(decomposition.final, state.lazy())
+    schema = to_lazy(output, df).collect_schema()
+    return to_lazy(final, state.lazy()).collect().cast(dict(schema))
+
+
+def rollup_query(
+    output: PythonScript,
+    df: pl.LazyFrame | Catalog,
+    data_context: DataContext,
+    limits: Limits | None = governor.DEFAULT_LIMITS,
+    rollup_store: RollupStore = rollups.rollup_store,
+) -> pl.LazyFrame | None:
+    """
+    Rewrites the query of `output` to read a rollup of the data.
+
+    The aggregation shape of the query is counted first, and the rollup of
+    a shape asked about often enough is built from the data, see
+    `rollups.RollupStore`. The query is then computed from the smallest
+    up-to-date rollup grouped by at least its dimensions.
+
+    Returns:
+        pl.LazyFrame | None: The rewritten query, with the schema of the
+        original one, or None when no rollup answers it
+    """
+    try:
+        if isinstance(df, Catalog) or not sources.scans_files(df):
+            return None
+        decomposition = aggregates.decompose(output.code_str)
+        if decomposition is None:
+            return None
+        shape = rollups.shape(decomposition, data_context.schema)
+        identity = sources.source_identity(df)
+        if shape is None or identity is None:
+            return None
+
+        if rollup_store.observe(identity, data_context.key, shape):
+            build = to_lazy(safe_eval(rollups.rollup_code(shape), df), df)
+            rollup, rows = governor.collect_all(
+                [build, df.select(pl.len())], limits
+            )
+            if rollup_store.save(
+                identity, data_context.key, shape, rollup, rows.item()
+            ):
+                rollups.record("built")
+
+        found = rollup_store.find(identity, data_context.key, shape)
+        if found is None:
+            return None
+        rollup, frame = found
+        state = safe_eval(rollups.routed_code(decomposition, rollup), frame)
+        final = safe_eval(decomposition.final, to_lazy(state, frame))
+        lazy = to_lazy(final, to_lazy(state, frame))
+        return lazy.cast(dict(to_lazy(output, df).collect_schema()))
+    except Exception:
+        # The query runs on the data as written
+        return None
+
+
+def execute(
+    output: PythonScript,
+    df: pl.LazyFrame | Catalog,
+    data_context: DataContext,
+    limits: Limits | None = governor.DEFAULT_LIMITS,
+    result_cache: ResultCache | None = cache.result_cache,
+    use_cache: bool = True,
+    max_rows: int | None = None,
+    summary: bool = False,
+    state_cache: StateCache | None = cache.state_cache,
+    rollup_store: RollupStore | None = rollups.rollup_store,
+    profile: bool = False,
+):
+    """
+    Runs the generated query of `output` under `limits`.
+
+    The optimized plan is inspected before anything runs, and collection
+    is given up on at the time or memory limit, see `governor.Limits`. Aggregations
+    are read from a rollup of the data when one answers them, see
+    `rollup_query`, or else updated from the rows appended to the data
+    since they last ran, see `execute_incremental`. Failures are stored on
+    `output.execution_error` instead of being raised.
+
+    With `profile`, the query runs as generated through the Polars
+    profiler instead, see `probe.profiling`, and the plan and timings of
+    its nodes are stored on `output.profile`. Neither the caches nor the
+    time and memory limits apply then.
+    """
+    if output.error:
+        output.execution_error = ExecutionError(
+            kind="code", message=output.error
+        )
+        return
+    try:
+        lazy = to_lazy(output, df)
+        if profile:
+            if limits is not None:
+                output.plan_warnings = governor.check_plan(lazy, limits)
+            result, output.profile = profiling.profile_query(lazy)
+            set_result(output, result)
+            return
+        if use_cache and rollup_store is not None:
+            routed = rollup_query(
+                output, df, data_context, limits, rollup_store
+            )
+            if routed is not None:
+                lazy, state_cache = routed, None
+                output.from_rollup = True
+                rollups.record("routed")
+        if max_rows is not None:
+            if limits is not None:
+                output.plan_warnings = governor.check_plan(lazy, limits)
+            # Without subplan elimination each frame is its own query, so
+            # the full result is never cached in memory just to take its
+            # head and length
+            frames = governor.collect_all(
+                bounded_frames(lazy, max_rows, summary),
+                limits,
+                comm_subplan_elim=False,
+            )
+            set_bounded_result(output, lazy, *frames)
+            return
+
+        result = None
+        if use_cache and result_cache is not None:
+            result = result_cache.get(output.code_str, data_context.key)
+        if result is None:
+            if limits is not None:
+                output.plan_warnings = governor.check_plan(lazy, limits)
+            if use_cache and state_cache is not None:
+                result = execute_incremental(output, df, limits, state_cache)
+            if result is None:
+                result = governor.collect(lazy, limits)
+            if result_cache is not None:
+                result_cache.put(output.code_str, data_context.key, result)
+        set_result(output, result)
+    except governor.QueryAborted as e:
+        output.error = e.error.message
+        output.execution_error = e.error
+    except Exception as e:
+        output.error = str(e)
+        output.execution_error = ExecutionError(kind="runtime", message=str(e))
+
+
+def execute_approximate(
+    output: PythonScript,
+    df: pl.LazyFrame | Catalog,
+    data_context: DataContext,
+    sample: Sampling = sampling.DEFAULT_SAMPLING,
+    limits: Limits | None = governor.DEFAULT_LIMITS,
+    sample_cache: SampleCache = sampling.sample_cache,
+):
+    """
+    Runs the generated query of `output` on a sample of the data.
+
+    The sample is drawn once per dataset and kept in `sample_cache`. The
+    same code is evaluated against the sample and against disjoint
+    replicates of it, which are collected together. Sums and counts are
+    scaled up to all rows, stratum by stratum when the sample is
+    stratified, and the spread of the aggregated columns over the
+    replicates gives their margin of error, stored with the sampling
+    fraction on `output.approximation`.
+    """
+    if output.error:
+        output.execution_error = ExecutionError(
+            kind="code", message=output.error
+        )
+        return
+    try:
+        frames = []
+        drawn = sample_cache.get(df, data_context.key, sample, limits)
+        for data in sampling.sample_frames(df, drawn, sample.replicates):
+            script = safe_eval(output.code_str, data)
+            if script.error:
+                raise ValueError(script.error)
+            frames.append(to_lazy(script, data))
+        if limits is not None:
+            output.plan_warnings = governor.check_plan(frames[0], limits)
+        results = governor.collect_all(frames, limits)
+    except governor.QueryAborted as e:
+        output.error = e.error.message
+        output.execution_error = e.error
+        return
+    except Exception as e:
+        output.error = str(e)
+        output.execution_error = ExecutionError(kind="runtime", message=str(e))
+        return
+
+    columns = sampling.aggregations(output.code_str)
+    strata = sampling.strata(drawn, sample)
+    result = sampling.scale_totals(
+        results[0], columns, sample.fraction, strata[0]
+    )
+    replicates = [
+        sampling.scale_totals(
+            replicate, columns, sample.fraction / sample.replicates, part
+        )
+        for replicate, part in zip(results[1:], strata[1:])
     ]
+    output.approximation = Approximation(
+        fraction=sample.fraction,
+        stratify_by=list(sample.stratify_by),
+        margins=sampling.margins(result, replicates, columns),
+    )
+    set_result(output, result)
+    output.console_output += "\n" + output.approximation.describe()
+
+
+def refine(
+    output: PythonScript,
+    df: pl.LazyFrame | Catalog,
+    data_context: DataContext,
+    fast_answer: bool | None = None,
+    **kwargs,
+) -> PythonScript:
+    """
+    Runs the query of an approximate answer on all rows, and answers again.
+
+    Args:
+        output: The approximate answer
+        df: The data
+        data_context: The context of `df`
+        fast_answer (bool | None): As in `ask`
+        **kwargs: The options of `execute`
+
+    Returns:
+        PythonScript: The exact answer, or the error that prevented it
+    """
+    exact = PythonScript(
+        user_query=output.user_query,
+        code_str=output.code_str,
+        code=output.code,
+        repairs=output.repairs,
+    )
+    execute(exact, df, data_context, **kwargs)
+    if exact.execution_error is None:
+        exact.answer = (
+            local_answer(exact, fast_answer) or translate_output(exact).text
+        )
+    return exact
+
+
+def _refine_later(*args, **kwargs) -> Future:
+    global _refiner
+    if _refiner is None:
+        _refiner = ThreadPoolExecutor(thread_name_prefix="probe-refine")
+    return _refiner.submit(refine, *args, **kwargs)
+
+
+def collect(
+    output: PythonScript,
+    df: pl.LazyFrame | Catalog,
+    data_context: DataContext,
+    approximate: bool | Sampling = False,
+    fast_answer: bool | None = None,
+    limits: Limits | None = governor.DEFAULT_LIMITS,
+    result_cache: ResultCache | None = cache.result_cache,
+    use_cache: bool = True,
+    max_rows: int | None = None,
+    summary: bool = False,
+    profile: bool = False,
+):
+    """
+    Runs the generated query of `output` with `execute`, or on a sample of
+    the data first when `approximate` asks for it, see `ask`.
+    """
+    options = dict(
+        limits=limits,
+        result_cache=result_cache,
+        use_cache=use_cache,
+        max_rows=max_rows,
+        summary=summary,
+        profile=profile,
+    )
+    sample = sampling.DEFAULT_SAMPLING if approximate is True else approximate
+    with span("collect") as collecting:
+        if (
+            sample
+            and not profile
+            and not (
+                use_cache
+                and result_cache is not None
+                and result_cache.get(output.code_str, data_context.key)
+                is not None
+            )
+        ):
+            execute_approximate(output, df, data_context, sample, limits)
+            if sample.refine and output.execution_error is None:
+                output.exact = _refine_later(
+                    output, df, data_context, fast_answer, **options
+                )
+        else:
+            execute(output, df, data_context, **options)
+        collecting.set(
+            rows=output.row_count,
+            approximate=output.approximation is not None,
+            from_rollup=output.from_rollup,
+            error=output.execution_error and output.execution_error.kind,
+        )
+
+
+def local_answer(output: PythonScript, fast_answer: bool | None) -> str | None:
+    """
+    Answers from a template when the result is simple enough.
+
+    With `fast_answer=None` only empty and single-value results are rendered
+    locally, `True` also renders single rows and short lists, and `False`
+    always leaves the answer to the model.
+    """
+    if fast_answer is False or not isinstance(output.result, pl.DataFrame):
+        return None
+    return render_answer(output.result, extended=bool(fast_answer))
+
+
+def translate_output_stream(
+    output: PythonScript, client: "anthropic.Anthropic | None" = None
+) -> Iterator[str]:
+    """Streams the answer as the model produces it, instead of waiting for it."""
+    global _client
+    if client is None:
+        client = _client = _client or _stages().client()
+    with span("llm.translate_output", model=MODEL) as current:
+        with client.messages.stream(
+            model=MODEL,
+            temperature=0.7,
+            max_tokens=200,
+            system=prompts.TRANSLATE,
+            messages=[{"role": "user", "content": translate_message(output)}],
+        ) as stream:
+            yield from stream.text_stream
+            current.set(**usage(stream.get_final_message()))
 
 
 def ask(
-    df: pl.LazyFrame,
+    df: pl.LazyFrame | Catalog,
     query: str,
     print_query: bool = False,
     print_code: bool = False,
     print_output: bool = False,
     max_retries: int = 0,
     print_answer: bool = True,
+    context_cache: ContextCache | None = context.context_cache,
+    code_cache: CodeCache | None = cache.code_cache,
+    result_cache: ResultCache | None = cache.result_cache,
+    use_cache: bool = True,
+    stream: bool = False,
+    on_chunk: Callable[[str], Any] | None = None,
+    fast_answer: bool | None = None,
+    max_rows: int | None = None,
+    summary: bool = False,
+    limits: Limits | None = governor.DEFAULT_LIMITS,
+    approximate: bool | Sampling = False,
+    trace: bool | None = None,
+    profile: bool = False,
+    compact_prompt: bool = False,
 ):
-    output = code_creator(df, query)
-    output = execute_with_retry(output, data=df, max_retries=max_retries)
-    with pl.Config(tbl_rows=100, fmt_str_lengths=50):
-        if isinstance(output.code, pl.Expr):
-            result = df.select(output.code).collect()
-            output.console_output = str(result)
-        else:
-            result = output.code.lazy().collect()
-            output.console_output = str(result)
-    output.user_query = query
-    output.answer = translate_output(output).text
-    output.result = result
+    """
+    Answers a question about `df`.
 
-    if print_query:
-        print(query, "\n-------")
+    The instructions and the description of the data are sent as cached
+    blocks of the system prompt, so the model provider only reads them
+    anew once they expire. With `compact_prompt=True`, shorter instructions
+    are sent, which take about a quarter of the tokens.
 
-    if print_answer:
-        print(output.answer)
+    With `trace=True`, or by default once a sink was added with
+    `probe.trace.add_sink`, the time spent in every stage, the tokens of
+    every model call and the retries are stored in `output.trace` and sent
+    to the sinks. With `profile=True`, the generated query is collected
+    through the Polars profiler, see `execute`, and an approximate answer
+    is not given.
+    """
+    with tracing(query, trace) as current:
+        with span("context"):
+            data_context = (
+                context_cache.get(df)
+                if context_cache is not None
+                else build_context(df)
+            )
+        output = generate_code(
+            df,
+            query,
+            data_context,
+            max_retries=max_retries,
+            code_cache=code_cache,
+            use_cache=use_cache,
+            compact_prompt=compact_prompt,
+        )
+        output.trace = current
+        collect(
+            output,
+            df,
+            data_context,
+            approximate=approximate,
+            fast_answer=fast_answer,
+            limits=limits,
+            result_cache=result_cache,
+            use_cache=use_cache,
+            max_rows=max_rows,
+            summary=summary,
+            profile=profile,
+        )
 
-    if print_code:
-        print("\n\n-------\n\n" + output.code_str)
+        if print_query:
+            print(query, "\n-------")
 
-    if print_output:
-        print("\n\n-------\n\n", output.console_output)
-    return output
+        if output.execution_error is not None:
+            if print_answer:
+                print(output.error)
+            if print_code:
+                print("\n\n-------\n\n" + output.code_str)
+            return output
+
+        marker = output.approximation.marker() if output.approximation else ""
+        with span("translate") as translating:
+            output.answer = local_answer(output, fast_answer)
+            translating.set(local=output.answer is not None, stream=stream)
+            if output.answer is not None:
+                output.answer = marker + output.answer
+                if stream and on_chunk is not None:
+                    on_chunk(output.answer)
+                elif print_answer:
+                    print(output.answer)
+            elif stream:
+                chunks = []
+                # The marker goes out first, ahead of the model's answer
+                for chunk in itertools.chain(
+                    [marker] if marker else [], translate_output_stream(output)
+                ):
+                    chunks.append(chunk)
+                    if on_chunk is not None:
+                        on_chunk(chunk)
+                    elif print_answer:
+                        print(chunk, end="", flush=True)
+                output.answer = "".join(chunks)
+                if print_answer and on_chunk is None:
+                    print()
+            else:
+                output.answer = marker + translate_output(output).text
+                if print_answer:
+                    print(output.answer)
+
+        if print_code:
+            print("\n\n-------\n\n" + output.code_str)
+
+        if print_output:
+            print("\n\n-------\n\n", output.console_output)
+        return output
 
 
 if __name__ == "__main__":
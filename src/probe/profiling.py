@@ -0,0 +1,169 @@
+import re
+from collections import Counter
+
+import polars as pl
+from pydantic import BaseModel
+
+# Nodes taking more than this share of the run time are reported, in
+# queries running for longer than MIN_REPORTED_TIME seconds
+SLOW_NODE_SHARE = 0.5
+MIN_REPORTED_TIME = 0.1
+# Nodes that need all of their input before the first row goes out, so a
+# limit above them cannot stop an earlier sort early
+BLOCKING_NODES = ("UNIQUE", "AGGREGATE", "JOIN", "SORT BY")
+
+_WINDOW = re.compile(r"(col\(\"[^\"]+\"\)\S*?\.over\(\[[^\]]*\]\))")
+_PARSE = re.compile(
+    r"col\(\"([^\"]+)\"\)\.str\.(?:strptime|to_date|to_datetime|to_time"
+    r"|to_integer|json_decode)"
+)
+_CAST_PARSE = re.compile(
+    r"col\(\"([^\"]+)\"\)\.strict_cast\((?:Date|Datetime|Int|Float)"
+)
+_SCAN = re.compile(r"^(csv|parquet|ipc|ndjson|df|scan)", re.I)
+
+
+class NodeTiming(BaseModel):
+    """When a node of the plan ran, in microseconds from the start."""
+
+    node: str
+    start: int
+    end: int
+
+    @property
+    def duration(self) -> int:
+        return self.end - self.start
+
+
+class QueryProfile(BaseModel):
+    """
+    How a generated query ran.
+
+    Args:
+        plan (str): The optimized plan
+        nodes (list[NodeTiming]): The timing of every node of the plan
+        findings (list[str]): Expensive patterns in the plan, and nodes
+            that took most of the time
+    """
+
+    plan: str
+    nodes: list[NodeTiming]
+    findings: list[str] = []
+
+    @property
+    def total(self) -> int:
+        """Microseconds from the start of the query to its last node."""
+        return max((node.end for node in self.nodes), default=0)
+
+    def describe(self) -> str:
+        width = max((len(node.node) for node in self.nodes), default=4)
+        lines = ["Optimized plan:", self.plan, "", "Node timings:"]
+        for node in self.nodes:
+            share = node.duration / self.total if self.total else 0.0
+            lines.append(
+                f"  {node.node:<{width}} {node.duration / 1000:>9.1f}ms"
+                f" {share:>6.1%}"
+            )
+        if self.findings:
+            lines += ["", "Findings:"]
+            lines += [f"  - {finding}" for finding in self.findings]
+        return "\n".join(lines)
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def sorts_before_limits(plan: str) -> list[str]:
+    """
+    Sorts under a limit that Polars cannot turn into a top-k, because a
+    blocking node sits between them, so all rows are sorted to keep a few.
+
+    Args:
+        plan: The plan before optimization, which still shows every
+            `SLICE` (the optimized plan folds them into other nodes)
+    """
+    lines = plan.splitlines()
+    findings = []
+    for i, line in enumerate(lines):
+        if not line.strip().startswith("SLICE"):
+            continue
+        depth, blocked = _indent(line), None
+        for below in lines[i + 1 :]:
+            if below.strip() and _indent(below) <= depth:
+                break
+            text = below.strip()
+            if text.startswith("SORT BY") and blocked:
+                findings.append(
+                    f"all rows are sorted ({text}) before {blocked}, though "
+                    "only the first rows are kept: sort after it"
+                )
+                break
+            if text.startswith(BLOCKING_NODES):
+                blocked = blocked or text.split("[")[0].split(" BY")[0]
+    return findings
+
+
+def inspect_profile(
+    lazy: pl.LazyFrame, plan: str, nodes: list[NodeTiming]
+) -> list[str]:
+    """
+    Looks for patterns in a plan that make it slow, and for the nodes that
+    took most of its run time.
+
+    Args:
+        lazy: The query
+        plan: Its optimized plan
+        nodes: The timings of its nodes
+
+    Returns:
+        list[str]: A description of each expensive pattern
+    """
+    findings = sorts_before_limits(lazy.explain(optimized=False))
+
+    for window in dict.fromkeys(_WINDOW.findall(plan)):
+        hint = (
+            ", and unique() keeps one row per group: use group_by instead"
+            if "UNIQUE" in plan
+            else ""
+        )
+        findings.append(
+            f"window {window} is computed for every row of its input{hint}"
+        )
+
+    parsed = Counter(_PARSE.findall(plan) + _CAST_PARSE.findall(plan))
+    for column, count in parsed.items():
+        if count > 1:
+            findings.append(
+                f"column {column!r} is parsed from text {count} times, parse "
+                "it once in with_columns (or load the data with probe.load)"
+            )
+
+    total = max((node.end for node in nodes), default=0)
+    for node in nodes:
+        if node.node == "optimization" or _SCAN.match(node.node):
+            continue
+        if (
+            total > MIN_REPORTED_TIME * 1e6
+            and node.duration / total > SLOW_NODE_SHARE
+        ):
+            findings.append(
+                f"{node.node} took {node.duration / total:.0%} of the time"
+            )
+    return findings
+
+
+def profile_query(lazy: pl.LazyFrame) -> tuple[pl.DataFrame, QueryProfile]:
+    """
+    Collects a query through the Polars profiler.
+
+    Returns:
+        tuple[pl.DataFrame, QueryProfile]: The result, and the optimized
+        plan with the timing of each node and the expensive patterns found
+    """
+    plan = lazy.explain()
+    result, timings = lazy.profile()
+    nodes = [NodeTiming(**row) for row in timings.iter_rows(named=True)]
+    return result, QueryProfile(
+        plan=plan, nodes=nodes, findings=inspect_profile(lazy, plan, nodes)
+    )
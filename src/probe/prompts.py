@@ -1,15 +1,7 @@
-SYS_PROMPT = """
+CODE_INSTRUCTIONS = """
 You are an advanced AI assistant specialized in data analysis and Python programming. Your primary function is to convert user queries into Python code using the Polars library for efficient data manipulation and analysis.
 
-Before we begin, here's the schema of the dataframe or lazyframe you'll be working with:
-
-{}
-
-You can only use the columns presented in the schema above.
-
-Here is the data of a sample row:
-{}
-
+The schema of the dataframe or lazyframe you'll be working with, and the data of a sample row, are given after these instructions. You can only use the columns presented in that schema.
 
 When a user presents a query, follow these steps:
 
@@ -65,6 +57,66 @@ Only write python code. Do not use senteces like : "Here is the Python code to..
 
 """
 
+COMPACT_INSTRUCTIONS = """
+Convert the user's question about a Polars LazyFrame `df` into one Polars
+expression (pl.Expr) or LazyFrame. `pl` is imported. Reply with the code
+only: no markdown fences, prose, comments, print or pandas. Use only the
+columns of the schema given below.
+
+Examples:
+    pl.col("amount").filter(pl.col("status") == "completed").sum()
+    df.group_by("category").agg(pl.col("amount").mean().alias("avg_amount"), pl.len().alias("count"))
+    df.sort("amount", descending=True).limit(5)
+
+Current Polars API: group_by (not groupby), replace (not map_dict), sort
+takes descending= and nulls_last= as keywords, Expr has no .item() or
+.group_by(), struct fields are read with .struct.field("a"). Output
+columns must have unique names. Date and Datetime columns are already
+parsed; parse date strings with str.strptime, str.to_date or
+str.to_datetime and a format without .%f, strict=False for bad values.
+Cast Categorical columns with .cast(pl.String) before calling .str
+methods on them.
+"""
+
+DATA = """
+Here's the schema of the dataframe or lazyframe you'll be working with:
+
+{}
+
+Here is the data of a sample row:
+{}
+"""
+
+COLUMN_STATS = """
+Here is a summary of the values in each column. Use it to pick exact
+category values, date formats and realistic ranges:
+{}
+"""
+
+CATEGORICAL = """
+These columns are Categorical: {}. Cast them with .cast(pl.String) before
+calling .str methods on them.
+"""
+
+PARTITIONS = """
+The data is stored in files partitioned by {}. Each partition column has
+these values:
+{}
+Whenever the question restricts one of these columns, or a period that
+they describe, filter on the partition columns directly (for example
+pl.col("year") == 2024), in addition to any other filter, so that only the
+matching files are read.
+"""
+
+CATALOG = """
+The data is split into several tables. Each table is a LazyFrame in a
+variable named after it: {}. `df` is the {} table.
+The tables join on these keys:
+{}
+Only join the tables whose columns the question needs, using the keys
+above, and select the columns you need from a table before joining it.
+"""
+
 POLARS_TWEAKS = """"
 A few things you should remember:
     1. Polars is already imported and you should only use Polars.
@@ -76,10 +128,11 @@ A few things you should remember:
     7. 'Expr' object has no attribute 'item'
     8. Struct fields can be accessed with `.struct.field("a")`
     9. Make sure that there are not duplicate column names if you are returning a df.
-    10. You may need to parse dates
+    10. You may need to parse dates stored as strings. Columns with a Date or Datetime type are already parsed.
     11. Do not use markdown to generate the code. Only write it out (without the ```python``` marks.)
     12. Do not add an if __name__ == "__main__" block!!
     13.'Expr' object has no attribute 'group_by'
+    14. `.str` methods do not work on Categorical columns. Cast them first: pl.col("region").cast(pl.String).str.contains("East")
 
 When parsing dates, remember that:
     -  Do not use `.%f`
@@ -142,3 +195,50 @@ Example:
         └──────┘
     Reply: There is no data matching your query. You may want to try a different state or modify your search criteria.
 """
+
+
+# The shortest prompt prefix the provider caches, for Sonnet models
+MIN_CACHED_TOKENS = 1024
+
+
+def cached(*texts: str) -> list[dict]:
+    """
+    System prompt blocks, with a cache breakpoint on those long enough.
+
+    The provider caches a prompt up to the end of a block marked with
+    `cache_control`, but ignores the mark when that prefix is shorter than
+    MIN_CACHED_TOKENS, so only blocks ending a prefix at least that long,
+    counted at about four characters a token, are marked.
+    """
+    blocks, length = [], 0
+    for text in texts:
+        length += len(text)
+        block = {"type": "text", "text": text}
+        if length >= MIN_CACHED_TOKENS * 4:
+            block["cache_control"] = {"type": "ephemeral"}
+        blocks.append(block)
+    return blocks
+
+
+def code_system(data: str, compact: bool = False) -> list[dict]:
+    """
+    The system prompt of `code_creator`, as Anthropic content blocks.
+
+    The instructions, the same for every question, come first, then the
+    block describing the data, the same for every question about it. Each
+    ends with a cache breakpoint once the prompt up to it is long enough to
+    be cached, so only the question is read anew.
+
+    Args:
+        data: The block describing the data, see `DataContext.prompt`
+        compact: Use the short instructions, about a quarter of the tokens
+    """
+    instructions = (
+        COMPACT_INSTRUCTIONS if compact else CODE_INSTRUCTIONS + POLARS_TWEAKS
+    )
+    return cached(instructions, data)
+
+
+def check_system() -> list[dict]:
+    """The system prompt of `check_code`, cached when long enough."""
+    return cached(CHECK_CODE)
@@ -0,0 +1,92 @@
+from datetime import date, datetime
+
+import polars as pl
+
+NO_DATA = (
+    "There is no data matching your query. "
+    "You may want to try a different query."
+)
+
+# Results up to this size can be phrased without the model
+MAX_LIST_ROWS = 10
+MAX_ROW_COLUMNS = 6
+
+
+def _label(column: str) -> str:
+    return column.replace("_", " ").strip()
+
+
+def _value(value) -> str:
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, float):
+        # Two decimals would round small values such as rates down to zero
+        if value != 0 and abs(value) < 0.01:
+            return f"{value:.6g}"
+        return f"{value:,.2f}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, datetime):
+        if value.time() == datetime.min.time():
+            return value.date().isoformat()
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, date):
+        return value.isoformat()
+    if value is None:
+        return "unknown"
+    return str(value)
+
+
+def _is_scalar(dtype: pl.DataType) -> bool:
+    return not isinstance(dtype, (pl.List, pl.Array, pl.Struct, pl.Object))
+
+
+def render_answer(result: pl.DataFrame, extended: bool = False) -> str | None:
+    """
+    Phrases simple results without an LLM call.
+
+    Empty frames and single values are always rendered. With `extended`,
+    a single row and a short ranked list of (label, value) pairs are
+    rendered too.
+
+    Args:
+        result: The collected query result
+        extended (bool): Also render single rows and short lists
+
+    Returns:
+        str | None: The answer, or None when the result needs the model
+    """
+    if not isinstance(result, pl.DataFrame):
+        return None
+    if not all(_is_scalar(dtype) for dtype in result.dtypes):
+        return None
+
+    height, width = result.shape
+    if height == 0:
+        return NO_DATA
+
+    if (height, width) == (1, 1):
+        column = result.columns[0]
+        return f"The {_label(column)} is {_value(result.item())}."
+
+    if not extended:
+        return None
+
+    if height == 1 and width <= MAX_ROW_COLUMNS:
+        row = result.row(0, named=True)
+        return "; ".join(f"{_label(k)}: {_value(v)}" for k, v in row.items())
+
+    if height <= MAX_LIST_ROWS and width <= 3:
+        label, *values = result.columns
+        lines = []
+        for i, row in enumerate(result.iter_rows(named=True), start=1):
+            details = ", ".join(
+                f"{_label(c)} {_value(row[c])}" for c in values
+            )
+            lines.append(
+                f"{i}. {_value(row[label])}"
+                + (f": {details}" if details else "")
+            )
+        return "\n".join(lines)
+
+    return None
@@ -0,0 +1,398 @@
+import ast
+import difflib
+import re
+import threading
+from typing import Iterable
+
+# Attributes removed from Polars that have a drop-in replacement
+RENAMED = {
+    "groupby": "group_by",
+    "with_row_count": "with_row_index",
+    "cumsum": "cum_sum",
+    "cumcount": "cum_count",
+    "cummax": "cum_max",
+    "cummin": "cum_min",
+    "cumprod": "cum_prod",
+}
+# Calls whose string arguments are column names
+COLUMN_METHODS = {
+    "select",
+    "group_by",
+    "sort",
+    "drop",
+    "drop_nulls",
+    "unique",
+    "over",
+    "with_columns",
+}
+COLUMN_KEYWORDS = {"by", "subset", "partition_by"}
+PL_COLUMN_FUNCTIONS = {
+    "col",
+    "count",
+    "sum",
+    "mean",
+    "median",
+    "min",
+    "max",
+    "first",
+    "last",
+    "n_unique",
+}
+# Calls producing columns the code does not name, after which unknown
+# column names cannot be told apart from misspelled ones
+OPAQUE_METHODS = {
+    "unnest",
+    "pivot",
+    "unpivot",
+    "melt",
+    "to_dummies",
+    "join",
+    "prefix",
+    "suffix",
+    "map",
+}
+COLUMN_CUTOFF = 0.8
+
+_FENCE = re.compile(r"```[a-zA-Z]*\s*\n(.*?)```", re.S)
+
+_lock = threading.Lock()
+_counts = {"repairs": 0, "llm_calls_saved": 0}
+
+
+def strip_fences(code: str) -> tuple[str, bool]:
+    """Returns the code inside the first markdown code block, if any."""
+    match = _FENCE.search(code)
+    if match is None:
+        stripped = code.strip().strip("`")
+        return stripped, stripped != code.strip()
+    return match.group(1).strip(), True
+
+
+def match_column(name: str, columns: Iterable[str]) -> str | None:
+    """
+    Finds the column a misspelled or wrongly-cased name refers to.
+
+    Args:
+        name: The column name used by the code
+        columns: The known column names
+
+    Returns:
+        str | None: The matching column, or None when nothing is close enough
+    """
+    by_key = {}
+    for column in columns:
+        by_key.setdefault(_key(column), column)
+    if _key(name) in by_key:
+        return by_key[_key(name)]
+    close = difflib.get_close_matches(
+        _key(name), list(by_key), n=1, cutoff=COLUMN_CUTOFF
+    )
+    return by_key[close[0]] if close else None
+
+
+def _key(name: str) -> str:
+    return re.sub(r"[\s_\-]+", "", name.lower())
+
+
+def _is_pl(node: ast.AST) -> bool:
+    return isinstance(node, ast.Name) and node.id == "pl"
+
+
+def _string(node: ast.AST) -> str | None:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def output_name(node: ast.AST) -> str | None:
+    """The name Polars gives the column produced by an expression."""
+    if _string(node) is not None:
+        return _string(node)
+    if isinstance(node, ast.BinOp):
+        return output_name(node.left)
+    if isinstance(node, ast.Compare):
+        return output_name(node.left)
+    if isinstance(node, ast.UnaryOp):
+        return output_name(node.operand)
+    if isinstance(node, ast.Attribute):
+        return output_name(node.value)
+    if not isinstance(node, ast.Call) or not isinstance(
+        node.func, ast.Attribute
+    ):
+        return None
+
+    func = node.func
+    if func.attr == "alias" and node.args:
+        return _string(node.args[0])
+    if _is_pl(func.value):
+        if func.attr in PL_COLUMN_FUNCTIONS and len(node.args) == 1:
+            return _string(node.args[0])
+        if func.attr in ("len", "count") and not node.args:
+            return func.attr
+        return None
+    if isinstance(func.value, ast.Attribute) and func.value.attr == "name":
+        return None
+    return output_name(func.value)
+
+
+class _Repairer(ast.NodeTransformer):
+    def __init__(
+        self,
+        columns: list[str],
+        fix_columns: bool,
+        categorical: Iterable[str] = (),
+    ):
+        self.columns = columns
+        self.fix_columns = fix_columns
+        self.categorical = set(categorical)
+        self.fixes: list[str] = []
+
+    def _fix(self, description: str):
+        if description not in self.fixes:
+            self.fixes.append(description)
+
+    def _column(self, node: ast.AST) -> ast.AST:
+        if isinstance(node, (ast.List, ast.Tuple)):
+            node.elts = [self._column(element) for element in node.elts]
+            return node
+        name = _string(node)
+        if (
+            name is None
+            or name in self.columns
+            or name.startswith("^")
+            or name == "*"
+        ):
+            return node
+        match = match_column(name, self.columns)
+        if match is None:
+            return node
+        self._fix(f"column {name!r} -> {match!r}")
+        return ast.copy_location(ast.Constant(match), node)
+
+    def visit_Subscript(self, node: ast.Subscript) -> ast.AST:
+        self.generic_visit(node)
+        if self.fix_columns and isinstance(node.value, ast.Name):
+            node.slice = self._column(node.slice)
+        return node
+
+    def visit_Attribute(self, node: ast.Attribute) -> ast.AST:
+        self.generic_visit(node)
+        column = node.value
+        if (
+            node.attr == "str"
+            and isinstance(column, ast.Call)
+            and isinstance(column.func, ast.Attribute)
+            and _is_pl(column.func.value)
+            and column.func.attr == "col"
+            and len(column.args) == 1
+            and _string(column.args[0]) in self.categorical
+        ):
+            # Categorical columns have no string methods
+            name = _string(column.args[0])
+            node.value = ast.Call(
+                ast.Attribute(column, "cast", ast.Load()),
+                [
+                    ast.Attribute(
+                        ast.Name("pl", ast.Load()), "String", ast.Load()
+                    )
+                ],
+                [],
+            )
+            self._fix(f"categorical column {name!r} cast to pl.String")
+        return node
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        func = node.func
+        if not isinstance(func, ast.Attribute):
+            return node
+
+        if func.attr in RENAMED:
+            self._fix(f"{func.attr} -> {RENAMED[func.attr]}")
+            func.attr = RENAMED[func.attr]
+        elif func.attr == "map_dict":
+            self._map_dict(node)
+        if func.attr == "sort":
+            self._sort(node)
+        if func.attr in ("select", "agg"):
+            self._deduplicate(node)
+
+        if self.fix_columns and (
+            func.attr in COLUMN_METHODS
+            or (_is_pl(func.value) and func.attr in PL_COLUMN_FUNCTIONS)
+        ):
+            node.args = [self._column(arg) for arg in node.args]
+            for keyword in node.keywords:
+                if keyword.arg in COLUMN_KEYWORDS:
+                    keyword.value = self._column(keyword.value)
+        return node
+
+    def _map_dict(self, node: ast.Call):
+        default = next((k for k in node.keywords if k.arg == "default"), None)
+        keeps_values = (
+            default is not None
+            and isinstance(default.value, ast.Call)
+            and isinstance(default.value.func, ast.Attribute)
+            and _is_pl(default.value.func.value)
+            and default.value.func.attr == "first"
+        )
+        if keeps_values:
+            # map_dict(..., default=pl.first()) kept unmapped values
+            node.func.attr = "replace"
+            node.keywords.remove(default)
+        else:
+            # map_dict set unmapped values to the default, null if none
+            node.func.attr = "replace_strict"
+            if default is None:
+                node.keywords.append(
+                    ast.keyword("default", ast.Constant(None))
+                )
+        self._fix(f"map_dict -> {node.func.attr}")
+
+    def _sort(self, node: ast.Call):
+        # The old signature was sort(by, descending, nulls_last)
+        flags = []
+        while (
+            node.args
+            and isinstance(node.args[-1], ast.Constant)
+            and isinstance(node.args[-1].value, bool)
+        ):
+            flags.insert(0, node.args.pop())
+        for keyword in node.keywords:
+            if keyword.arg == "reverse":
+                keyword.arg = "descending"
+                self._fix("sort(reverse=) -> sort(descending=)")
+        if not flags:
+            return
+        taken = {keyword.arg for keyword in node.keywords}
+        for name, flag in zip(("descending", "nulls_last"), flags):
+            if name not in taken:
+                node.keywords.append(ast.keyword(name, flag))
+        self._fix("sort positional flags -> keywords")
+
+    def _deduplicate(self, node: ast.Call):
+        seen = {keyword.arg for keyword in node.keywords if keyword.arg}
+        receiver = node.func.value
+        if (
+            node.func.attr == "agg"
+            and isinstance(receiver, ast.Call)
+            and isinstance(receiver.func, ast.Attribute)
+            and receiver.func.attr.startswith("group_by")
+        ):
+            seen |= {output_name(arg) for arg in receiver.args} - {None}
+            seen |= {k.arg for k in receiver.keywords if k.arg}
+
+        args = node.args
+        if len(args) == 1 and isinstance(args[0], ast.List):
+            args = args[0].elts
+        for i, arg in enumerate(args):
+            name = output_name(arg)
+            if name is None:
+                continue
+            if name in seen:
+                suffix = (
+                    arg.func.attr
+                    if isinstance(arg, ast.Call)
+                    and isinstance(arg.func, ast.Attribute)
+                    else str(i)
+                )
+                new_name, n = f"{name}_{suffix}", 2
+                while new_name in seen:
+                    new_name, n = f"{name}_{suffix}_{n}", n + 1
+                args[i] = ast.Call(
+                    ast.Attribute(arg, "alias", ast.Load()),
+                    [ast.Constant(new_name)],
+                    [],
+                )
+                self._fix(f"duplicate column {name!r} -> {new_name!r}")
+                name = new_name
+            seen.add(name)
+
+
+def _produced_names(tree: ast.AST) -> set[str] | None:
+    """
+    Column names the code creates itself, or None when it creates columns
+    whose names cannot be known from the code.
+    """
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        if isinstance(func, ast.Attribute):
+            if func.attr in OPAQUE_METHODS:
+                return None
+            if func.attr == "alias" and node.args:
+                names.add(_string(node.args[0]))
+            if func.attr == "rename":
+                for arg in node.args:
+                    if not isinstance(arg, ast.Dict):
+                        return None
+                    names |= {_string(value) for value in arg.values}
+        names |= {keyword.arg for keyword in node.keywords}
+    return names - {None}
+
+
+def repair_code(
+    code: str, columns: Iterable[str], categorical: Iterable[str] = ()
+) -> tuple[str, list[str]]:
+    """
+    Fixes common mistakes in generated code without calling the model.
+
+    Strips markdown fences, renames APIs removed from Polars, turns
+    positional `sort` flags into keywords, aliases duplicate output
+    columns, replaces misspelled or wrongly-cased column names with the
+    closest column of the schema and casts Categorical columns to strings
+    before `.str` methods.
+
+    Args:
+        code: The generated code
+        columns: The column names of the data
+        categorical: The Categorical columns among them
+
+    Returns:
+        tuple[str, list[str]]: The repaired code and a description of each
+        fix, empty when the code was left untouched
+    """
+    code, fenced = strip_fences(code)
+    fixes = ["markdown fences removed"] if fenced else []
+    try:
+        tree = ast.parse(code, mode="eval")
+    except SyntaxError:
+        return code, fixes
+
+    columns = list(columns)
+    produced = _produced_names(tree)
+    repairer = _Repairer(
+        columns + sorted(produced or ()),
+        fix_columns=produced is not None,
+        categorical=categorical,
+    )
+    tree = ast.fix_missing_locations(repairer.visit(tree))
+    if repairer.fixes:
+        code = ast.unparse(tree)
+    return code, fixes + repairer.fixes
+
+
+def record(repaired: bool, retries_left: bool = True):
+    """
+    Counts a local repair, and the model call it saved if it worked.
+
+    Args:
+        repaired: Whether the repaired code validated
+        retries_left: Whether the model would have been asked to fix the
+            code otherwise, a call is only saved when a retry was available
+    """
+    with _lock:
+        _counts["repairs"] += 1
+        _counts["llm_calls_saved"] += repaired and retries_left
+
+
+def stats() -> dict[str, int]:
+    """
+    Returns:
+        dict[str, int]: The number of repaired scripts, and how many of them
+        ran without another round trip to the model
+    """
+    with _lock:
+        return dict(_counts)
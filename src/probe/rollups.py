@@ -0,0 +1,371 @@
+import ast
+import hashlib
+import json
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+import polars as pl
+
+from probe.aggregates import Decomposition
+from probe.cache import cache_dir
+
+# An aggregation shape asked about this many times gets a rollup
+MIN_QUERIES = 3
+# Rollups with more rows than this share of the data are not kept
+MAX_ROLLUP_RATIO = 0.1
+# Row by row steps that can run on the rows of a rollup instead
+ROLLUP_STEPS = {"filter", "with_columns"}
+# Functions of `pl` that do not read columns
+PL_LITERALS = {"lit", "when", "date", "datetime", "duration", "time"}
+
+_lock = threading.Lock()
+_counts = {"built": 0, "routed": 0}
+
+
+@dataclass(frozen=True)
+class Shape:
+    """
+    The columns a query groups or filters by and the aggregations it needs.
+
+    Args:
+        dimensions (tuple[str, ...]): The columns of the data the query
+            filters, derives its keys from or groups by
+        measures (tuple[str, ...]): The partial aggregations it computes
+    """
+
+    dimensions: tuple[str, ...]
+    measures: tuple[str, ...]
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(
+            json.dumps([self.dimensions, self.measures]).encode()
+        ).hexdigest()[:16]
+
+    def covers(self, other: "Shape") -> bool:
+        return set(other.dimensions) <= set(self.dimensions) and set(
+            other.measures
+        ) <= set(self.measures)
+
+
+def _columns(node: ast.AST) -> set[str] | None:
+    """
+    The columns an expression reads, None when they cannot be told from
+    the code (`pl.all()`, selectors, regular expressions, ...).
+    """
+    columns = set()
+    for call in ast.walk(node):
+        if isinstance(call, ast.Name) and call.id == "cs":
+            return None
+        if not isinstance(call, ast.Call) or not isinstance(
+            call.func, ast.Attribute
+        ):
+            continue
+        func = call.func
+        if not (isinstance(func.value, ast.Name) and func.value.id == "pl"):
+            continue
+        if func.attr in PL_LITERALS:
+            continue
+        if func.attr == "len" and not call.args:
+            continue
+        names = [
+            arg.value
+            for arg in call.args
+            if isinstance(arg, ast.Constant) and isinstance(arg.value, str)
+        ]
+        if (
+            func.attr not in ("col", "sum", "mean", "min", "max", "count")
+            or not names
+            or len(names) != len(call.args)
+            or any(name.startswith("^") or name == "*" for name in names)
+        ):
+            return None
+        columns.update(names)
+    return columns
+
+
+def shape(decomposition: Decomposition, schema: pl.Schema) -> Shape | None:
+    """
+    The shape of a decomposed query, if a rollup can answer it.
+
+    The query must group by keys, and its row by row steps must only
+    filter and derive columns from other columns than the ones it
+    aggregates, so they can run on the grouped rows of a rollup.
+
+    Args:
+        decomposition: The query, as split by `aggregates.decompose`
+        schema: The schema of the data
+
+    Returns:
+        Shape | None: The shape, or None when no rollup can answer it
+    """
+    if decomposition.group_by is None:
+        return None
+    source = ast.parse(decomposition.source, mode="eval").body
+    steps, created, dimensions = [], set(), set()
+    while isinstance(source, ast.Call):
+        steps.append(source)
+        source = source.func.value
+    if not (isinstance(source, ast.Name) and source.id == "df"):
+        return None
+    for step in steps:
+        if step.func.attr not in ROLLUP_STEPS:
+            return None
+        if step.func.attr == "with_columns":
+            # Only named columns, so it is known what they replace
+            for arg in step.args:
+                column = _alias(arg)
+                if column is None:
+                    return None
+                created.add(column)
+            created.update(k.arg for k in step.keywords)
+        else:
+            # filter(region="East") compares a column to a value
+            dimensions.update(k.arg for k in step.keywords)
+        for arg in step.args + [k.value for k in step.keywords]:
+            columns = _columns(arg)
+            if columns is None:
+                return None
+            dimensions |= columns
+
+    for key in decomposition.group_by:
+        if key.startswith("maintain_order="):
+            continue
+        node = ast.parse(key.partition("=")[2] if _named(key) else key)
+        node = node.body[0].value
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            dimensions.add(node.value)
+            continue
+        if isinstance(node, (ast.List, ast.Tuple)) and all(
+            isinstance(e, ast.Constant) and isinstance(e.value, str)
+            for e in node.elts
+        ):
+            dimensions.update(e.value for e in node.elts)
+            continue
+        columns = _columns(node)
+        if columns is None:
+            return None
+        dimensions |= columns
+
+    measured = set()
+    for measure in decomposition.partials.values():
+        columns = _columns(ast.parse(measure, mode="eval"))
+        if columns is None:
+            return None
+        measured |= columns
+    dimensions -= created
+    if (
+        not dimensions
+        or measured & created
+        or not (dimensions | measured) <= set(schema.names())
+    ):
+        return None
+    return Shape(
+        tuple(sorted(dimensions)),
+        tuple(sorted(set(decomposition.partials.values()))),
+    )
+
+
+def _named(argument: str) -> bool:
+    name, sep, _ = argument.partition("=")
+    return bool(sep) and name.isidentifier()
+
+
+def _alias(node: ast.AST) -> str | None:
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "alias"
+        and node.args
+        and isinstance(node.args[0], ast.Constant)
+    ):
+        return node.args[0].value
+    return None
+
+
+def measure_columns(shape: Shape) -> dict[str, str]:
+    """The column of a rollup holding each measure of its shape."""
+    return {
+        measure: f"__probe_m{i}" for i, measure in enumerate(shape.measures)
+    }
+
+
+def rollup_code(shape: Shape) -> str:
+    """Code building the rollup of a shape from `df`."""
+    aggregations = ", ".join(
+        f"{measure}.alias({column!r})"
+        for measure, column in measure_columns(shape).items()
+    )
+    return f"df.group_by({list(shape.dimensions)!r}).agg([{aggregations}])"
+
+
+def routed_code(decomposition: Decomposition, rollup: Shape) -> str:
+    """
+    Code computing the partial aggregates of a query from a rollup covering
+    it, bound to `df`. `decomposition.final` finishes the query from them.
+    """
+    columns = measure_columns(rollup)
+    return decomposition.aggregate(
+        [
+            f"pl.col({columns[measure]!r})."
+            f"{decomposition.combine[name]}().alias({name!r})"
+            for name, measure in decomposition.partials.items()
+        ]
+    )
+
+
+class RollupStore:
+    """
+    Rollup tables of the aggregation shapes asked about most, per source.
+
+    Every shape a decomposable query uses is counted. Once a shape was
+    asked about `min_queries` times, the data is grouped by its dimensions
+    into a rollup stored as an Arrow IPC file, unless the rollup would have
+    more than `max_ratio` of the rows of the data. Rollups are tied to the
+    fingerprint of the data and rebuilt once it changed.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        min_queries: int = MIN_QUERIES,
+        max_ratio: float = MAX_ROLLUP_RATIO,
+    ):
+        self._path = Path(path) if path is not None else None
+        self.min_queries = min_queries
+        self.max_ratio = max_ratio
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self._path or cache_dir() / "rollups"
+
+    def _manifest_file(self, identity: str) -> Path:
+        return self.path / f"{identity}.json"
+
+    def _read(self, identity: str) -> dict:
+        try:
+            return json.loads(self._manifest_file(identity).read_text())
+        except (OSError, ValueError):
+            return {"shapes": {}, "rollups": {}}
+
+    def _write(self, identity: str, manifest: dict):
+        file = self._manifest_file(identity)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, file)
+
+    def find(
+        self, identity: str, fingerprint: str, shape: Shape
+    ) -> tuple[Shape, pl.LazyFrame] | None:
+        """The smallest up-to-date rollup covering `shape`, if any."""
+        with self._lock:
+            rollups = self._read(identity)["rollups"]
+        found = []
+        for entry in rollups.values():
+            rollup = Shape(
+                tuple(entry["dimensions"]), tuple(entry["measures"])
+            )
+            if (
+                entry["fingerprint"] == fingerprint
+                and entry.get("file")
+                and rollup.covers(shape)
+            ):
+                found.append((entry["rows"], rollup, entry["file"]))
+        for _, rollup, file in sorted(found, key=lambda item: item[0]):
+            try:
+                return rollup, pl.read_ipc(
+                    self.path / file, memory_map=True
+                ).lazy()
+            except (OSError, pl.exceptions.PolarsError):
+                continue
+        return None
+
+    def observe(self, identity: str, fingerprint: str, shape: Shape) -> bool:
+        """
+        Counts a query of `shape`.
+
+        Returns:
+            bool: Whether a rollup should now be built for it
+        """
+        with self._lock:
+            manifest = self._read(identity)
+            entry = manifest["shapes"].setdefault(
+                shape.key,
+                {
+                    "dimensions": list(shape.dimensions),
+                    "measures": list(shape.measures),
+                    "count": 0,
+                },
+            )
+            entry["count"] += 1
+            self._write(identity, manifest)
+            if entry["count"] < self.min_queries:
+                return False
+            # An up-to-date rollup of this shape was already built, or found
+            # too large to be worth it
+            built = manifest["rollups"].get(shape.key)
+            return built is None or built["fingerprint"] != fingerprint
+
+    def save(
+        self,
+        identity: str,
+        fingerprint: str,
+        shape: Shape,
+        rollup: pl.DataFrame,
+        source_rows: int,
+    ) -> bool:
+        """
+        Stores the rollup of a shape, when it is small enough.
+
+        Returns:
+            bool: Whether the rollup was kept
+        """
+        kept = rollup.height <= source_rows * self.max_ratio
+        entry = {
+            "dimensions": list(shape.dimensions),
+            "measures": list(shape.measures),
+            "fingerprint": fingerprint,
+            "rows": rollup.height,
+            "file": None,
+        }
+        if kept:
+            entry["file"] = f"{identity}-{shape.key}.arrow"
+            file = self.path / entry["file"]
+            file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = file.with_suffix(f".{uuid.uuid4().hex}.tmp")
+            rollup.write_ipc(tmp)
+            os.replace(tmp, file)
+        with self._lock:
+            manifest = self._read(identity)
+            manifest["rollups"][shape.key] = entry
+            self._write(identity, manifest)
+        return kept
+
+    def clear(self):
+        for file in self.path.glob("*"):
+            if file.suffix in (".json", ".arrow"):
+                file.unlink(missing_ok=True)
+
+
+rollup_store = RollupStore()
+
+
+def record(event: str):
+    """Counts a rollup built or a query answered from one."""
+    with _lock:
+        _counts[event] += 1
+
+
+def stats() -> dict[str, int]:
+    """
+    Returns:
+        dict[str, int]: The number of rollups built, and of queries
+        answered from a rollup instead of the data
+    """
+    with _lock:
+        return dict(_counts)
@@ -0,0 +1,475 @@
+import ast
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import polars as pl
+from pydantic import BaseModel
+
+from probe import governor
+from probe.catalog import Catalog
+from probe.repair import output_name
+
+# Rows are hashed into this many buckets, the first `fraction` of which
+# form the sample
+BUCKETS = 1_000_000
+# Two-sided 95% confidence
+Z = 1.96
+
+# Aggregations that grow with the number of rows, scaled up to estimate
+# the value on all rows
+TOTALS = {"sum", "count", "len"}
+# Aggregations estimated as they are on the sample
+ESTIMATES = {
+    "mean",
+    "median",
+    "quantile",
+    "std",
+    "var",
+    "min",
+    "max",
+    "first",
+    "last",
+    "n_unique",
+}
+# Methods that keep the aggregation of the expression they are called on
+KEEP = {"alias", "round", "cast", "abs", "fill_null", "fill_nan"}
+
+# Columns of a drawn sample holding the replicate of each row and, when
+# stratified, the number of rows of its stratum in the data
+REPLICATE = "__probe_replicate"
+STRATUM_ROWS = "__probe_stratum_rows"
+_ROW = "__probe_row"
+_KEY = "__probe_key_"
+_FACTOR = "__probe_factor"
+
+
+@dataclass(frozen=True)
+class Sampling:
+    """
+    How approximate answers are computed.
+
+    Args:
+        fraction (float): The share of rows in the sample
+        stratify_by (tuple[str, ...]): Columns whose groups are each sampled
+            at `fraction`, so that small groups are not left out by chance
+        replicates (int): Disjoint sub-samples the query is also run on to
+            estimate the margin of error
+        seed (int): Seed of the row hash choosing the sample
+        refine (bool): Run the exact query in the background once the
+            preliminary answer is given
+    """
+
+    fraction: float = 0.01
+    stratify_by: tuple[str, ...] = ()
+    replicates: int = 5
+    seed: int = 0
+    refine: bool = True
+
+
+DEFAULT_SAMPLING = Sampling()
+
+
+class Approximation(BaseModel):
+    """How a preliminary result was estimated."""
+
+    fraction: float
+    stratify_by: list[str] = []
+    # Output column -> relative margin of error at 95% confidence, the
+    # median over the rows of the result
+    margins: dict[str, float] = {}
+
+    def describe(self) -> str:
+        text = f"Estimated from a {self.fraction:.2%} sample of the rows"
+        if self.stratify_by:
+            text += f", taken in every {', '.join(self.stratify_by)}"
+        if self.margins:
+            text += ". Margins of error at 95% confidence: " + ", ".join(
+                f"{column} ±{margin:.1%}"
+                for column, margin in self.margins.items()
+            )
+        return text + "."
+
+    def marker(self) -> str:
+        text = f"Preliminary, from a {self.fraction:.2%} sample"
+        if self.margins:
+            text += f", ±{max(self.margins.values()):.1%}"
+        return f"[{text}] "
+
+
+def draw(lazy: pl.LazyFrame, sampling: Sampling) -> pl.LazyFrame:
+    """
+    Samples rows, numbering the replicate each of them belongs to.
+
+    The rows are chosen by a hash of their position, so the sample is the
+    same from one question to the next. A stratified sample also counts the
+    rows of each stratum in the data, see `strata`.
+    """
+    lazy = lazy.with_row_index(_ROW)
+    bucket = pl.col(_ROW).hash(sampling.seed) % BUCKETS
+    if sampling.stratify_by:
+        # Proportional allocation: the same share of every stratum
+        rank = bucket.rank("ordinal").over(sampling.stratify_by)
+        size = (pl.len() * sampling.fraction).ceil().over(sampling.stratify_by)
+        lazy = lazy.with_columns(
+            pl.len().over(sampling.stratify_by).alias(STRATUM_ROWS)
+        ).filter(rank <= size)
+    else:
+        lazy = lazy.filter(bucket < sampling.fraction * BUCKETS)
+    return lazy.with_columns(
+        (bucket % sampling.replicates).alias(REPLICATE)
+    ).drop(_ROW)
+
+
+class SampleCache:
+    """
+    LRU cache of collected samples keyed by source fingerprint.
+
+    The first approximate question on a dataset scans it once to draw the
+    sample, and later ones run on the sample in memory.
+    """
+
+    def __init__(self, maxsize: int = 4):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple, pl.DataFrame] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        data: pl.LazyFrame | Catalog,
+        key: str,
+        sampling: Sampling,
+        limits: governor.Limits | None = governor.DEFAULT_LIMITS,
+    ) -> pl.DataFrame:
+        """
+        Returns:
+            pl.DataFrame: The sample of `data`, or of its main table for a
+            catalog, with the replicate of each row in a `REPLICATE` column
+
+        Raises:
+            QueryAborted: When drawing the sample goes over `limits`
+        """
+        entry = (key, sampling.fraction, sampling.stratify_by)
+        entry += (sampling.replicates, sampling.seed)
+        with self._lock:
+            if entry in self._entries:
+                self._entries.move_to_end(entry)
+                return self._entries[entry]
+
+            lazy = data.main if isinstance(data, Catalog) else data
+            sample = governor.collect(draw(lazy, sampling), limits)
+            self._entries[entry] = sample
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return sample
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+sample_cache = SampleCache()
+
+
+def sample_frames(
+    data: pl.LazyFrame | Catalog, sample: pl.DataFrame, replicates: int
+) -> list[pl.LazyFrame | Catalog]:
+    """
+    Splits a sample drawn from `data` into its replicates.
+
+    In a catalog only the main table is sampled, and the tables it joins
+    are kept whole.
+
+    Returns:
+        list[pl.LazyFrame | Catalog]: The whole sample, followed by each
+        of its disjoint replicates
+    """
+    lazy = sample.lazy()
+    parts = [lazy.drop(REPLICATE, STRATUM_ROWS, strict=False)] + [
+        lazy.filter(pl.col(REPLICATE) == i).drop(
+            REPLICATE, STRATUM_ROWS, strict=False
+        )
+        for i in range(replicates)
+    ]
+    if isinstance(data, Catalog):
+        return [data.with_table(data.main_name, part) for part in parts]
+    return parts
+
+
+def strata(
+    sample: pl.DataFrame, sampling: Sampling
+) -> list[pl.DataFrame | None]:
+    """
+    The rows of every stratum in the data and in each part of a sample.
+
+    Returns:
+        list[pl.DataFrame | None]: For the whole sample and each of its
+        replicates, the strata with their `rows` in the data and the rows
+        `kept` in that part. None for each of them when the sample is not
+        stratified
+    """
+    parts = sampling.replicates + 1
+    if not sampling.stratify_by:
+        return [None] * parts
+
+    def count(part: pl.DataFrame) -> pl.DataFrame:
+        return part.group_by(sampling.stratify_by).agg(
+            pl.col(STRATUM_ROWS).first().alias("rows"),
+            pl.len().alias("kept"),
+        )
+
+    return [count(sample)] + [
+        count(sample.filter(pl.col(REPLICATE) == i))
+        for i in range(sampling.replicates)
+    ]
+
+
+def _aggregation(node: ast.AST) -> str | None:
+    """
+    "total" when an expression sums or counts rows, "estimate" for other
+    aggregations, None when it is not aggregated.
+    """
+    if isinstance(node, ast.BinOp):
+        left, right = _aggregation(node.left), _aggregation(node.right)
+        constant = (ast.Constant, ast.UnaryOp)
+        if isinstance(node.op, (ast.Mult, ast.Add, ast.Sub)) and (
+            {left, right} == {"total"}
+            or (left == "total" and isinstance(node.right, constant))
+            or (right == "total" and isinstance(node.left, constant))
+        ):
+            return "total"
+        if (
+            isinstance(node.op, ast.Div)
+            and left == "total"
+            and isinstance(node.right, constant)
+        ):
+            return "total"
+        return "estimate" if left or right else None
+    if not isinstance(node, ast.Call) or not isinstance(
+        node.func, ast.Attribute
+    ):
+        return None
+
+    attr = node.func.attr
+    if attr in KEEP:
+        return _aggregation(node.func.value)
+    if attr in TOTALS:
+        return "total"
+    if attr in ESTIMATES:
+        return "estimate"
+    return None
+
+
+def _root(node: ast.AST) -> str | None:
+    """The name a chain of calls and operators starts from."""
+    while True:
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, ast.BinOp):
+            node = node.left
+        elif isinstance(node, ast.Call):
+            node = node.func
+        elif isinstance(node, ast.Attribute):
+            node = node.value
+        else:
+            return None
+
+
+def aggregations(code: str) -> dict[str, str]:
+    """
+    Finds the aggregated output columns of generated code.
+
+    Args:
+        code: The generated code
+
+    Returns:
+        dict[str, str]: Output column -> "total" for sums and counts, which
+        scale with the number of rows, or "estimate" for other aggregations
+    """
+    try:
+        tree = ast.parse(code, mode="eval")
+    except SyntaxError:
+        return {}
+
+    outputs = []
+    if _root(tree.body) == "pl":
+        # An expression selected on the data
+        outputs.append(tree.body)
+    columns = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not isinstance(
+            node.func, ast.Attribute
+        ):
+            continue
+        receiver = node.func.value
+        if (
+            node.func.attr in ("len", "count")
+            and not node.args
+            and isinstance(receiver, ast.Call)
+            and isinstance(receiver.func, ast.Attribute)
+            and receiver.func.attr.startswith("group_by")
+        ):
+            columns[node.func.attr] = "total"
+        if node.func.attr in ("select", "agg"):
+            args = node.args
+            if len(args) == 1 and isinstance(args[0], ast.List):
+                args = args[0].elts
+            outputs.extend(args)
+            outputs.extend(
+                ast.Call(
+                    ast.Attribute(k.value, "alias", ast.Load()),
+                    [ast.Constant(k.arg)],
+                    [],
+                )
+                for k in node.keywords
+                if k.arg
+            )
+
+    for node in outputs:
+        name, kind = output_name(node), _aggregation(node)
+        if name is not None and kind is not None:
+            columns[name] = kind
+    return columns
+
+
+def scale_totals(
+    result: pl.DataFrame,
+    columns: dict[str, str],
+    fraction: float,
+    strata: pl.DataFrame | None = None,
+) -> pl.DataFrame:
+    """
+    Scales sums and counts computed on a sample up to all rows.
+
+    Every row of a sample drawn at `fraction` stands for `1 / fraction`
+    rows. In a stratified sample, a stratum stands for its rows in the data
+    over its rows kept, which is more than `1 / fraction` for strata too
+    small to keep exactly their share. A result grouped by the strata is
+    scaled stratum by stratum, any other one by all the rows of the data
+    over the rows of the sample.
+
+    Args:
+        result: The result computed on the sample, or on one of its parts
+        columns: The aggregated columns, as returned by `aggregations`
+        fraction: The share of rows in the sample, or in the part
+        strata: The strata of the part, see `strata`
+    """
+    totals = [
+        column
+        for column, kind in columns.items()
+        if kind == "total"
+        and column in result.columns
+        and result.schema[column].is_numeric()
+    ]
+    if not totals:
+        return result
+    schema = result.schema
+    factor = pl.lit(1 / fraction)
+    if strata is not None and not strata.is_empty():
+        overall = strata["rows"].sum() / strata["kept"].sum()
+        by = [
+            column
+            for column in strata.columns
+            if column not in ("rows", "kept")
+        ]
+        factor = pl.lit(overall)
+        if not set(by) & set(columns) and set(by) <= set(result.columns):
+            # Categoricals of separate collects cannot be joined
+            keys = [f"{_KEY}{column}" for column in by]
+            factors = strata.select(
+                *(
+                    pl.col(c).cast(pl.String).alias(k)
+                    for c, k in zip(by, keys)
+                ),
+                (pl.col("rows") / pl.col("kept")).alias(_FACTOR),
+            )
+            result = result.with_columns(
+                pl.col(c).cast(pl.String).alias(k) for c, k in zip(by, keys)
+            ).join(factors, on=keys, how="left", join_nulls=True)
+            result = result.drop(keys)
+            factor = pl.col(_FACTOR).fill_null(overall)
+    return result.with_columns(
+        (pl.col(column) * factor).round(0).cast(schema[column])
+        if schema[column].is_integer()
+        else pl.col(column) * factor
+        for column in totals
+    ).drop(_FACTOR, strict=False)
+
+
+def margins(
+    sample: pl.DataFrame,
+    replicates: list[pl.DataFrame],
+    columns: dict[str, str],
+) -> dict[str, float]:
+    """
+    Estimates the margin of error of the aggregated columns of a result.
+
+    The spread of a column over the disjoint replicates, divided by the
+    square root of their number, estimates the standard error of the value
+    computed on the whole sample. Rows are matched on the other columns of
+    the result.
+
+    Args:
+        sample: The result on the sample, totals already scaled
+        replicates: The results on each replicate, totals already scaled
+        columns: The aggregated columns, as returned by `aggregations`
+
+    Returns:
+        dict[str, float]: Column -> relative margin of error at 95%
+        confidence, the median over the rows
+    """
+    estimated = [
+        column
+        for column in columns
+        if column in sample.columns and sample.schema[column].is_numeric()
+    ]
+    keys = [column for column in sample.columns if column not in columns]
+    if (
+        not estimated
+        or sample.is_empty()
+        or len(replicates) < 2
+        or (keys and sample.select(keys).is_duplicated().any())
+        or (not keys and sample.height > 1)
+    ):
+        return {}
+
+    def key_columns(frame: pl.DataFrame) -> pl.DataFrame:
+        # Categoricals of separate collects cannot be joined
+        return frame.with_columns(pl.col(keys).cast(pl.String))
+
+    frame = key_columns(sample) if keys else sample
+    for i, replicate in enumerate(replicates):
+        if not keys and replicate.height != 1:
+            return {}
+        part = replicate.select(
+            *keys,
+            *(pl.col(column).alias(f"{column}__{i}") for column in estimated),
+        )
+        frame = (
+            frame.join(key_columns(part), on=keys, how="left", join_nulls=True)
+            if keys
+            else frame.hstack(part)
+        )
+
+    n = len(replicates)
+    found = {}
+    for column in estimated:
+        parts = pl.concat_list(
+            pl.col(f"{column}__{i}").cast(pl.Float64) for i in range(n)
+        )
+        relative = (
+            Z * parts.list.std() / parts.list.drop_nulls().list.len().sqrt()
+        ) / pl.col(column).cast(pl.Float64).abs()
+        margin = (
+            frame.select(relative.alias("margin"))
+            .filter(pl.col("margin").is_finite())
+            .select(pl.col("margin").median())
+            .item()
+        )
+        if margin is not None and not math.isnan(margin):
+            found[column] = margin
+    return found
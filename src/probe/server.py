@@ -0,0 +1,285 @@
+import http.client
+import json
+import os
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    import polars as pl
+
+    from probe.governor import Limits
+    from probe.main import PythonScript
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Request options passed through to `ask`
+ASK_OPTIONS = {
+    "max_retries",
+    "use_cache",
+    "fast_answer",
+    "max_rows",
+    "summary",
+    "compact_prompt",
+}
+MAX_RESULT_ROWS = 100
+
+
+class Datasets:
+    """
+    Registered datasets, loaded once and kept warm for every request.
+
+    Args:
+        allowed_root: Also serve files under this directory, by path,
+            registering each on first use. By default only registered
+            names are served.
+        **loader_options: Passed to `probe.load`
+    """
+
+    def __init__(
+        self, allowed_root: str | Path | None = None, **loader_options
+    ):
+        self.allowed_root = (
+            Path(allowed_root).resolve() if allowed_root is not None else None
+        )
+        self.loader_options = loader_options
+        self._frames: dict[str, "pl.LazyFrame"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, path: str | Path) -> "pl.LazyFrame":
+        from probe.ingest import load
+
+        df = load(path, **self.loader_options)
+        # Resolve the schema now so the first question does not pay for it
+        df.collect_schema()
+        with self._lock:
+            self._frames[name] = df
+        return df
+
+    def get(self, name: str) -> "pl.LazyFrame":
+        """
+        Returns a registered dataset, or registers a path under
+        `allowed_root` on first use.
+        """
+        with self._lock:
+            df = self._frames.get(name)
+        if df is not None:
+            return df
+        if self.allowed_root is None:
+            raise KeyError(f"unknown dataset {name!r}")
+        path = Path(name).resolve()
+        if not path.is_relative_to(self.allowed_root) or not path.exists():
+            raise KeyError(f"unknown dataset {name!r}")
+        return self.register(name, path)
+
+    def names(self) -> list[str]:
+        with self._lock:
+            return list(self._frames)
+
+
+def serialize_output(output: "PythonScript") -> dict:
+    import polars as pl
+
+    result = output.result
+    rows = None
+    if isinstance(result, pl.LazyFrame):
+        result = result.head(MAX_RESULT_ROWS).collect()
+    if isinstance(result, pl.DataFrame):
+        rows = json.loads(result.head(MAX_RESULT_ROWS).write_json())
+    return {
+        "query": output.user_query,
+        "answer": output.answer,
+        "code": output.code_str,
+        "console_output": output.console_output,
+        "row_count": output.row_count,
+        "rows": rows,
+        "error": output.error,
+        "execution_error": (
+            output.execution_error.model_dump()
+            if output.execution_error is not None
+            else None
+        ),
+        "plan_warnings": output.plan_warnings,
+    }
+
+
+def parse_request(request) -> tuple[str, str, dict]:
+    """
+    Reads the body of `POST /ask`.
+
+    Returns:
+        tuple[str, str, dict]: The dataset, the question and the options
+        passed through to `ask`
+
+    Raises:
+        ValueError: When the body is not a JSON object with a "data" and a
+            "query" string, and "options" is given but not an object
+    """
+    if not isinstance(request, dict):
+        raise ValueError("the request must be a JSON object")
+    for field in ("data", "query"):
+        if not isinstance(request.get(field), str):
+            raise ValueError(f'"{field}" must be a string')
+    options = request.get("options", {})
+    if not isinstance(options, dict):
+        raise ValueError('"options" must be an object')
+    options = {k: v for k, v in options.items() if k in ASK_OPTIONS}
+    return request["data"], request["query"], options
+
+
+class ProbeHandler(BaseHTTPRequestHandler):
+    datasets: Datasets
+    # None keeps the default limits of `probe.ask`
+    limits: "Limits | None" = None
+
+    def _send(self, status: int, body: dict):
+        payload = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def do_GET(self):
+        if self.path == "/datasets":
+            self._send(200, {"datasets": self.datasets.names()})
+        elif self.path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/ask":
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data, query, options = parse_request(
+                json.loads(self.rfile.read(length))
+            )
+            df = self.datasets.get(data)
+        except (KeyError, ValueError) as e:
+            self._send(400, {"error": str(e)})
+            return
+
+        from probe.main import ask
+
+        try:
+            if self.limits is not None:
+                options["limits"] = self.limits
+            output = ask(df, query, print_answer=False, **options)
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, serialize_output(output))
+
+
+class UnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+
+def make_server(
+    datasets: Datasets,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    unix_socket: str | None = None,
+    limits: "Limits | None" = None,
+) -> socketserver.BaseServer:
+    handler = type(
+        "Handler", (ProbeHandler,), {"datasets": datasets, "limits": limits}
+    )
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        return UnixHTTPServer(unix_socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(
+    datasets: Datasets,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    unix_socket: str | None = None,
+    limits: "Limits | None" = None,
+):
+    server = make_server(datasets, host, port, unix_socket, limits)
+    address = unix_socket or f"http://{host}:{port}"
+    print(f"probe serving {datasets.names()} on {address}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket is not None and os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float | None = None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def _connection(
+    server: str, timeout: float | None
+) -> http.client.HTTPConnection:
+    if server.startswith("unix:"):
+        return _UnixHTTPConnection(server.removeprefix("unix:"), timeout)
+    url = urlparse(server if "://" in server else f"http://{server}")
+    return http.client.HTTPConnection(
+        url.hostname or DEFAULT_HOST, url.port or DEFAULT_PORT, timeout=timeout
+    )
+
+
+def ask_remote(
+    server: str,
+    data: str,
+    query: str,
+    timeout: float | None = None,
+    **options,
+) -> dict:
+    """
+    Asks a question to a running `probe serve` process.
+
+    Args:
+        server: "host:port", an http:// URL, or "unix:/path/to/socket"
+        data: A dataset name registered on the server, or a file path under
+            its `--allow-paths` directory
+        query: The question to answer
+        **options: Passed through to `probe.ask` on the server
+
+    Returns:
+        dict: The answer, generated code, console output, preview rows and
+        error of the question
+    """
+    if os.path.exists(data):
+        data = os.path.abspath(data)
+    conn = _connection(server, timeout)
+    try:
+        body = json.dumps({"data": data, "query": query, "options": options})
+        conn.request(
+            "POST", "/ask", body, {"Content-Type": "application/json"}
+        )
+        response = conn.getresponse()
+        payload = json.loads(response.read())
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise RuntimeError(payload.get("error", f"HTTP {response.status}"))
+    return payload
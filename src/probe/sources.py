@@ -0,0 +1,292 @@
+import glob
+import hashlib
+import os
+import re
+import threading
+import uuid
+import weakref
+
+import polars as pl
+
+# A DataFrame held in a plan, as shown by `LazyFrame.explain`
+_IN_MEMORY = re.compile(r"^\s*DF \[", re.M)
+_SCAN = re.compile(r"SCAN \[([^\]]+)\]")
+
+# Fingerprints that only identify data within this process start with this
+LOCAL = "local-"
+
+_tokens: dict[int, tuple[weakref.ref, str]] = {}
+_tokens_lock = threading.Lock()
+
+
+def _cbor(data: bytes, i: int = 0) -> tuple[object, int]:
+    """Decodes the CBOR item at `data[i]`, with the offset that follows it."""
+    head = data[i]
+    major, info = head >> 5, head & 0x1F
+    i += 1
+    arg = info
+    if 24 <= info < 28:
+        size = 1 << (info - 24)
+        arg = int.from_bytes(data[i : i + size], "big")
+        i += size
+    elif info == 31:
+        arg = None
+    if major == 0:
+        return arg, i
+    if major == 1:
+        return -1 - arg, i
+    if major in (2, 3):
+        if arg is None:
+            chunks = []
+            while data[i] != 0xFF:
+                chunk, i = _cbor(data, i)
+                chunks.append(chunk)
+            return type(chunks[0])().join(chunks) if chunks else b"", i + 1
+        value = data[i : i + arg]
+        return (value.decode() if major == 3 else bytes(value)), i + arg
+    if major in (4, 5):
+        items = []
+        while len(items) < arg if arg is not None else data[i] != 0xFF:
+            item, i = _cbor(data, i)
+            if major == 5:
+                value, i = _cbor(data, i)
+                item = (item, value)
+            items.append(item)
+        if arg is None:
+            i += 1
+        return (dict(items) if major == 5 else items), i
+    if major == 6:
+        return _cbor(data, i)
+    # Floats and simple values are kept as their bits, enough to compare
+    return arg, i
+
+
+def _plan(df: pl.LazyFrame) -> dict | list:
+    """
+    The plan of a LazyFrame as nested dicts and lists, without the schema
+    Polars stores in it once resolved.
+
+    Raises:
+        ComputeError: When the plan holds python UDFs, which cannot be
+            serialized
+    """
+    # `serialize` writes CBOR, the JSON format being deprecated
+    return _strip_resolved(_cbor(df.serialize())[0])
+
+
+def _strip_resolved(node):
+    # Resolving a schema wraps the plan in {"IR": {"version": n, "dsl": plan}}
+    if isinstance(node, dict):
+        if set(node) == {"IR"} and "dsl" in node["IR"]:
+            return _strip_resolved(node["IR"]["dsl"])
+        return {key: _strip_resolved(value) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_strip_resolved(value) for value in node]
+    return node
+
+
+def _plan_paths(plan: dict | list) -> list[str]:
+    paths = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "Paths" and isinstance(value, list):
+                    paths.extend(v for v in value if isinstance(v, str))
+                else:
+                    stack.append(value)
+        elif isinstance(node, list):
+            stack.extend(node)
+    return paths
+
+
+def _file_identity(path: str) -> list[tuple[str, int, int]]:
+    identity = []
+    for file in sorted(glob.glob(path, recursive=True)) or [path]:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            identity.append((file, -1, -1))
+            continue
+        if os.path.isdir(file):
+            for root, _, files in os.walk(file):
+                for name in sorted(files):
+                    child = os.stat(os.path.join(root, name))
+                    identity.append(
+                        (
+                            os.path.join(root, name),
+                            child.st_size,
+                            child.st_mtime_ns,
+                        )
+                    )
+        else:
+            identity.append((file, stat.st_size, stat.st_mtime_ns))
+    return identity
+
+
+def _object_token(df: pl.LazyFrame) -> str:
+    """A token of a LazyFrame object, never handed to another object."""
+
+    def forget(ref: weakref.ref, key: int = id(df)):
+        with _tokens_lock:
+            if key in _tokens and _tokens[key][0] is ref:
+                del _tokens[key]
+
+    with _tokens_lock:
+        entry = _tokens.get(id(df))
+        if entry is None or entry[0]() is not df:
+            entry = (weakref.ref(df, forget), uuid.uuid4().hex)
+            _tokens[id(df)] = entry
+        return entry[1]
+
+
+def _in_memory_fingerprint(df: pl.LazyFrame, plan: str) -> str:
+    # Serializing the plan would copy every row of its DataFrames, so the
+    # frame is identified by the object, its plan and the files it scans
+    digest = hashlib.sha256(f"{_object_token(df)}:{plan}".encode())
+    for paths in _SCAN.findall(plan):
+        if " other " in paths:
+            # Only the first of several sources is shown
+            return LOCAL + uuid.uuid4().hex
+        digest.update(repr(_file_identity(paths)).encode())
+    return LOCAL + digest.hexdigest()
+
+
+def is_local(fingerprint: str) -> bool:
+    """Whether a fingerprint only identifies the data within this process."""
+    return fingerprint.startswith(LOCAL)
+
+
+def holds_data(df: pl.LazyFrame) -> bool:
+    """Whether the plan of a LazyFrame holds a DataFrame in memory."""
+    try:
+        return bool(_IN_MEMORY.search(df.explain(optimized=False)))
+    except Exception:
+        return False
+
+
+def source_fingerprint(df: pl.LazyFrame) -> str:
+    """
+    Identifies the data behind a LazyFrame without reading it.
+
+    File scans are identified by path, size and mtime. Plans holding
+    in-memory data are identified by the LazyFrame object they belong to,
+    so the same frame asked about again hits the caches, but an equal
+    frame built anew does not. Their fingerprints start with `LOCAL`, see
+    `is_local`.
+
+    Args:
+        df: The LazyFrame to identify
+
+    Returns:
+        str: A hex digest that changes whenever the plan or its files do
+    """
+    try:
+        explained = df.explain(optimized=False)
+    except Exception:
+        explained = None
+    if explained is not None and _IN_MEMORY.search(explained):
+        return _in_memory_fingerprint(df, explained)
+    try:
+        plan = _plan(df)
+    except Exception:
+        # Plans holding python UDFs cannot be serialized
+        plan = f"{id(df)}:{df.explain(optimized=False)}"
+        return LOCAL + hashlib.sha256(plan.encode()).hexdigest()
+
+    digest = hashlib.sha256(repr(plan).encode())
+    for path in _plan_paths(plan):
+        digest.update(repr(_file_identity(path)).encode())
+    return digest.hexdigest()
+
+
+def source_identity(df: pl.LazyFrame) -> str | None:
+    """
+    Identifies the plan behind a LazyFrame, but not the content of its
+    files, so it stays the same when rows are appended to them.
+
+    Returns:
+        str | None: A hex digest, None when the plan cannot be serialized
+        or holds in-memory data
+    """
+    if holds_data(df):
+        return None
+    try:
+        plan = _plan(df)
+    except Exception:
+        return None
+    return hashlib.sha256(repr(plan).encode()).hexdigest()
+
+
+def scans_files(df: pl.LazyFrame) -> bool:
+    """Whether a LazyFrame reads files, rather than data held in memory."""
+    try:
+        return " SCAN " in df.explain(optimized=False)
+    except Exception:
+        return False
+
+
+def scan_paths(df: pl.LazyFrame) -> list[str]:
+    """
+    The file paths (or globs) scanned by a LazyFrame, none for plans
+    holding data in memory, which serializing would copy.
+    """
+    if holds_data(df):
+        return []
+    try:
+        plan = _plan(df)
+    except Exception:
+        return []
+    return _plan_paths(plan)
+
+
+def _partition_values(path: str) -> dict[str, set[str]]:
+    files = glob.glob(path, recursive=True) or [path]
+    if len(files) == 1 and os.path.isdir(files[0]):
+        files = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(files[0])
+            for name in names
+        ]
+    values = {}
+    for file in files:
+        for part in os.path.dirname(file).split(os.sep):
+            key, sep, value = part.partition("=")
+            if sep and key:
+                values.setdefault(key, set()).add(value)
+    return values
+
+
+def hive_partitions(df: pl.LazyFrame) -> dict[str, list[str]]:
+    """
+    The hive partition keys of the files scanned by a LazyFrame.
+
+    Args:
+        df: The LazyFrame to inspect
+
+    Returns:
+        dict[str, list[str]]: Partition column to its sorted values, for the
+        keys that are columns of `df`
+    """
+    schema = df.collect_schema()
+    partitions = {}
+    for path in scan_paths(df):
+        for key, values in _partition_values(path).items():
+            if key in schema:
+                partitions.setdefault(key, set()).update(values)
+
+    def order(value: str):
+        return (0, float(value), "") if _is_number(value) else (1, 0, value)
+
+    return {
+        key: sorted(values, key=order) for key, values in partitions.items()
+    }
+
+
+def _is_number(value: str) -> bool:
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
@@ -0,0 +1,58 @@
+from typing import NamedTuple
+
+import anthropic
+import polars as pl
+
+from probe import prompts, trace
+from probe.main import (
+    MODEL,
+    PythonScript,
+    check_code_message,
+    translate_message,
+)
+
+_client: anthropic.Anthropic | None = None
+
+
+class Reply(NamedTuple):
+    """The text of a model reply, and the tokens it took."""
+
+    text: str
+    usage: dict[str, int]
+
+
+def client() -> anthropic.Anthropic:
+    global _client
+    if _client is None:
+        _client = anthropic.Anthropic()
+    return _client
+
+
+def complete(system: str | list[dict], user: str, max_tokens: int) -> Reply:
+    response = client().messages.create(
+        model=MODEL,
+        temperature=0.7,
+        max_tokens=max_tokens,
+        system=system,
+        messages=[{"role": "user", "content": user}],
+    )
+    return Reply(
+        "".join(
+            block.text for block in response.content if block.type == "text"
+        ),
+        trace.usage(response),
+    )
+
+
+def code_creator(context: list[dict], query: str) -> Reply:
+    return complete(context, query, 1000)
+
+
+def check_code(output: PythonScript, schema: pl.Schema | None = None) -> Reply:
+    return complete(
+        prompts.check_system(), check_code_message(output, schema), 1000
+    )
+
+
+def translate_output(output: PythonScript) -> Reply:
+    return complete(prompts.TRANSLATE, translate_message(output), 200)
@@ -0,0 +1,210 @@
+import json
+import os
+import uuid
+from pathlib import Path
+
+import polars as pl
+
+from probe import governor
+from probe.cache import cache_dir
+from probe.governor import DEFAULT_LIMITS, Limits
+from probe.ingest import (
+    PROFILE_SAMPLE_ROWS,
+    SIDECAR_DIR,
+    detect_temporal_format,
+    sidecar_dir,
+)
+from probe.sources import holds_data, scan_paths, source_fingerprint
+
+STATS_VERSION = 1
+TOP_K = 10
+# Top values are only listed for columns with at most this many distinct values
+MAX_TOP_UNIQUE = 50
+MAX_VALUE_LENGTH = 40
+
+_TEXT = (pl.String, pl.Categorical, pl.Enum, pl.Boolean)
+
+
+def _is_text(dtype: pl.DataType) -> bool:
+    return isinstance(dtype, _TEXT)
+
+
+def _is_ordered(dtype: pl.DataType) -> bool:
+    return dtype.is_numeric() or dtype.is_temporal()
+
+
+def compute_stats(
+    lf: pl.LazyFrame, limits: Limits | None = DEFAULT_LIMITS
+) -> dict[str, dict]:
+    """
+    Profiles every column of a LazyFrame.
+
+    Collects null counts, distinct counts and min/max of numeric and
+    temporal columns in one pass, along with the date format of string
+    columns holding dates, then the most frequent values of the text
+    columns with at most MAX_TOP_UNIQUE distinct values in a second one.
+
+    Args:
+        lf: The data to profile
+        limits: The limits of the profiling query, see `governor.Limits`
+
+    Returns:
+        dict[str, dict]: Column name to its statistics
+
+    Raises:
+        QueryAborted: When profiling fails or goes over a limit
+    """
+    schema = lf.collect_schema()
+    exprs = []
+    for i, (name, dtype) in enumerate(schema.items()):
+        column = pl.col(name)
+        exprs += [
+            column.null_count().alias(f"{i}:nulls"),
+            column.n_unique().alias(f"{i}:unique"),
+        ]
+        if _is_ordered(dtype):
+            exprs += [
+                column.min().alias(f"{i}:min"),
+                column.max().alias(f"{i}:max"),
+            ]
+    strings = [name for name, dtype in schema.items() if dtype == pl.String]
+    profile, sample = governor.collect_all(
+        [lf.select(exprs), lf.select(strings).head(PROFILE_SAMPLE_ROWS)],
+        limits,
+    )
+    row = profile.row(0, named=True)
+
+    # Counting values groups the rows by them, so only columns with few
+    # distinct values are counted, in a second pass
+    top = [
+        pl.col(name)
+        .value_counts(sort=True)
+        .head(TOP_K)
+        .implode()
+        .alias(f"{i}:top")
+        for i, (name, dtype) in enumerate(schema.items())
+        if _is_text(dtype) and row[f"{i}:unique"] <= MAX_TOP_UNIQUE
+    ]
+    if top:
+        row.update(governor.collect(lf.select(top), limits).row(0, named=True))
+
+    stats = {}
+    for i, (name, dtype) in enumerate(schema.items()):
+        column = {
+            "dtype": str(dtype),
+            "nulls": row[f"{i}:nulls"],
+            "unique": row[f"{i}:unique"],
+        }
+        if f"{i}:min" in row:
+            column["min"] = str(row[f"{i}:min"])
+            column["max"] = str(row[f"{i}:max"])
+        if f"{i}:top" in row:
+            column["top"] = [
+                [str(value[name]), value["count"]] for value in row[f"{i}:top"]
+            ]
+        if name in strings:
+            date_format = detect_temporal_format(sample[name])
+            if date_format is not None:
+                column["date_format"] = date_format
+        stats[name] = column
+    return stats
+
+
+def _short(value: str) -> str:
+    if len(value) > MAX_VALUE_LENGTH:
+        value = value[: MAX_VALUE_LENGTH - 3] + "..."
+    return json.dumps(value, ensure_ascii=False)
+
+
+def summarize(stats: dict[str, dict]) -> str:
+    """Renders statistics as one compact line per column for the prompt."""
+    lines = []
+    for name, column in stats.items():
+        parts = [f"{column['unique']} distinct"]
+        if "min" in column:
+            parts.append(f"range {column['min']} to {column['max']}")
+        if "date_format" in column:
+            parts.append(f"date strings formatted as {column['date_format']}")
+        if "top" in column:
+            values = ", ".join(
+                f"{_short(value)} ({count})" for value, count in column["top"]
+            )
+            more = column["unique"] - len(column["top"])
+            parts.append(
+                f"values {values}" + (f" and {more} more" if more > 0 else "")
+            )
+        if column["nulls"]:
+            parts.append(f"{column['nulls']} nulls")
+        lines.append(f"- {name} ({column['dtype']}): " + "; ".join(parts))
+    return "\n".join(lines)
+
+
+def stats_path(lf: pl.LazyFrame, fingerprint: str) -> Path:
+    """
+    Where the statistics of `lf` are stored.
+
+    Single-file sources keep them in the sidecar directory next to the file,
+    anything else in probe's cache directory.
+    """
+    paths = scan_paths(lf)
+    if len(paths) == 1 and os.path.isfile(paths[0]):
+        path = Path(paths[0])
+        directory = (
+            path.parent
+            if path.parent.name == SIDECAR_DIR
+            else sidecar_dir(path)
+        )
+        return directory / f"{path.name}.stats.json"
+    return cache_dir() / "stats" / f"{fingerprint}.json"
+
+
+def load_stats(
+    lf: pl.LazyFrame,
+    fingerprint: str | None = None,
+    limits: Limits | None = DEFAULT_LIMITS,
+) -> dict[str, dict]:
+    """
+    Returns the statistics of `lf`, recomputing them when the data changed.
+
+    Statistics of data held in memory are not stored: their fingerprint
+    lasts as long as the frame, so a stored copy would never be read again.
+
+    Args:
+        lf: The data to profile
+        fingerprint: The source fingerprint of `lf`, if already known
+        limits: The limits of the profiling query, see `governor.Limits`
+
+    Returns:
+        dict[str, dict]: Column name to its statistics
+    """
+    if holds_data(lf):
+        return compute_stats(lf, limits)
+    fingerprint = fingerprint or source_fingerprint(lf)
+    path = stats_path(lf, fingerprint)
+    try:
+        stored = json.loads(path.read_text())
+        if (
+            stored.get("version") == STATS_VERSION
+            and stored.get("fingerprint") == fingerprint
+        ):
+            return stored["columns"]
+    except (OSError, ValueError):
+        pass
+
+    stats = compute_stats(lf, limits)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "version": STATS_VERSION,
+                    "fingerprint": fingerprint,
+                    "columns": stats,
+                }
+            )
+        )
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return stats
@@ -0,0 +1,306 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from pydantic import BaseModel, PrivateAttr
+
+logger = logging.getLogger("probe")
+
+# The token counts of an Anthropic response
+TOKEN_COUNTS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+
+class Span(BaseModel):
+    """
+    One timed stage of a question.
+
+    Args:
+        name (str): The stage, like `context`, `llm.code_creator`,
+            `safe_eval`, `collect` or `translate`
+        start (float): When it started, in seconds since the epoch
+        duration (float): How long it took, in seconds
+        parent (int | None): The index of the span it ran in
+        attributes (dict): What the stage reported, like token counts
+        error (str | None): The exception it raised, if any
+    """
+
+    name: str
+    start: float
+    duration: float = 0.0
+    parent: int | None = None
+    attributes: dict[str, Any] = {}
+    error: str | None = None
+
+    def set(self, **attributes):
+        self.attributes.update(
+            {k: v for k, v in attributes.items() if v is not None}
+        )
+
+
+class Trace(BaseModel):
+    """The spans of one question, and how often its code was retried."""
+
+    trace_id: str
+    query: str | None = None
+    start: float
+    duration: float = 0.0
+    spans: list[Span] = []
+    retries: int = 0
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def stage(self, name: str) -> float:
+        """Seconds spent in the spans named `name`."""
+        return sum(span.duration for span in self.spans if span.name == name)
+
+    def tokens(self) -> dict[str, int]:
+        """
+        Tokens of every model call. `input_tokens` leaves out the prompt
+        tokens written to or read from the provider's prompt cache.
+        """
+        totals = dict.fromkeys(TOKEN_COUNTS, 0)
+        for span in self.spans:
+            for key in totals:
+                totals[key] += span.attributes.get(key) or 0
+        return totals
+
+
+class _NoSpan:
+    """Stands in for a span when nothing is traced."""
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+class _OpenSpan:
+    def __init__(self, trace: Trace, name: str, attributes: dict):
+        self.trace = trace
+        self.span = Span(
+            name=name,
+            start=time.time(),
+            parent=_parent.get(),
+            attributes=attributes,
+        )
+
+    def __enter__(self) -> Span:
+        with self.trace._lock:
+            self.trace.spans.append(self.span)
+            index = len(self.trace.spans) - 1
+        self._token = _parent.set(index)
+        self._started = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.span.duration = time.perf_counter() - self._started
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _parent.reset(self._token)
+        return False
+
+
+_NO_SPAN = _NoSpan()
+_current: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+    "probe_trace", default=None
+)
+_parent: contextvars.ContextVar[int | None] = contextvars.ContextVar(
+    "probe_span", default=None
+)
+_sinks: list[Callable[[Trace], Any]] = []
+
+
+def span(name: str, **attributes) -> _OpenSpan | _NoSpan:
+    """
+    Times a stage of the question being traced.
+
+    Use it as `with span("collect") as s: ...; s.set(rows=...)`. Outside
+    of a traced question it does nothing.
+    """
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return _OpenSpan(trace, name, attributes)
+
+
+def retried():
+    """Counts a retry of the code of the question being traced."""
+    trace = _current.get()
+    if trace is not None:
+        trace.retries += 1
+
+
+def usage(response) -> dict[str, int]:
+    """The token counts of an Anthropic response, for `Span.set`."""
+    return {
+        key: value
+        for key in TOKEN_COUNTS
+        if isinstance(value := getattr(response.usage, key, None), int)
+    }
+
+
+def current() -> Trace | None:
+    return _current.get()
+
+
+@contextmanager
+def tracing(query: str | None, enabled: bool | None = None) -> Iterator:
+    """
+    Traces the question asked in the block, and sends the trace to the
+    sinks when the block ends.
+
+    Args:
+        query: The question
+        enabled: Whether to trace, by default only when a sink is added
+
+    Yields:
+        Trace | None: The trace, None when not tracing
+    """
+    if enabled is None:
+        enabled = bool(_sinks)
+    if not enabled:
+        yield None
+        return
+    trace = Trace(trace_id=uuid.uuid4().hex, query=query, start=time.time())
+    token = _current.set(trace)
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.duration = time.perf_counter() - started
+        _current.reset(token)
+        emit(trace)
+
+
+def emit(trace: Trace):
+    for sink in list(_sinks):
+        try:
+            sink(trace)
+        except Exception:
+            # A broken sink never fails the question
+            logger.exception("probe trace sink %r failed", sink)
+
+
+def add_sink(sink: Callable[[Trace], Any]):
+    """Sends the trace of every question to `sink`, which turns tracing on."""
+    _sinks.append(sink)
+
+
+def remove_sink(sink: Callable[[Trace], Any]):
+    _sinks.remove(sink)
+
+
+class JSONLSink:
+    """Appends every trace as one line of JSON to a file."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def __call__(self, trace: Trace):
+        line = trace.model_dump_json() + "\n"
+        with self._lock, self.path.open("a") as f:
+            f.write(line)
+
+
+class LoggingSink:
+    """Logs every span of a trace, and then the trace as a whole."""
+
+    def __init__(
+        self, logger: logging.Logger = logger, level: int = logging.INFO
+    ):
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, trace: Trace):
+        for span in trace.spans:
+            self.logger.log(
+                self.level,
+                "%s %s %.1fms %s%s",
+                trace.trace_id[:8],
+                span.name,
+                span.duration * 1000,
+                json.dumps(span.attributes, default=str),
+                f" error={span.error}" if span.error else "",
+            )
+        self.logger.log(
+            self.level,
+            "%s ask %.1fms retries=%d %s %r",
+            trace.trace_id[:8],
+            trace.duration * 1000,
+            trace.retries,
+            json.dumps(trace.tokens()),
+            trace.query,
+        )
+
+
+class OpenTelemetrySink:
+    """
+    Exports every trace as OpenTelemetry spans, under a root `probe.ask`
+    span. Needs the `opentelemetry-api` package.
+
+    Args:
+        tracer: The tracer to use, by default the one of the global tracer
+            provider
+    """
+
+    def __init__(self, tracer=None):
+        try:
+            from opentelemetry import trace as otel
+        except ImportError as e:
+            raise ImportError(
+                "OpenTelemetrySink needs opentelemetry-api, install it with "
+                "`pip install opentelemetry-api opentelemetry-sdk`"
+            ) from e
+        self._otel = otel
+        self.tracer = tracer or otel.get_tracer("probe")
+
+    def __call__(self, trace: Trace):
+        def ns(seconds: float) -> int:
+            return int(seconds * 1e9)
+
+        root = self.tracer.start_span(
+            "probe.ask",
+            start_time=ns(trace.start),
+            attributes={
+                "probe.query": trace.query or "",
+                "probe.retries": trace.retries,
+                **{f"probe.{k}": v for k, v in trace.tokens().items()},
+            },
+        )
+        opened = []
+        for span in trace.spans:
+            parent = root if span.parent is None else opened[span.parent]
+            otel_span = self.tracer.start_span(
+                span.name,
+                context=self._otel.set_span_in_context(parent),
+                start_time=ns(span.start),
+                attributes={
+                    f"probe.{k}": v
+                    if isinstance(v, (bool, int, float))
+                    else str(v)
+                    for k, v in span.attributes.items()
+                },
+            )
+            if span.error:
+                otel_span.set_status(
+                    self._otel.Status(self._otel.StatusCode.ERROR, span.error)
+                )
+            opened.append(otel_span)
+        for span, otel_span in zip(trace.spans, opened):
+            otel_span.end(end_time=ns(span.start + span.duration))
+        root.end(end_time=ns(trace.start + trace.duration))
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+import probe
+from probe import aggregates, main, rollups
+
+CODE = (
+    'df.filter(pl.col("amount") > 0).group_by("region").agg('
+    'pl.col("amount").sum().alias("total"), pl.col("amount").mean(), '
+    'pl.col("amount").max(), orders=pl.len()).sort("region")'
+)
+
+
+@pytest.mark.parametrize(
+    "code, decomposable",
+    [
+        (CODE, True),
+        ('pl.col("amount").sum()', True),
+        ('df.group_by("region").len()', True),
+        ('df.select(pl.col("a").sum() / pl.col("b").sum())', True),
+        ('df.group_by("region").agg(pl.col("amount").median())', False),
+        ('df.select(pl.col("a").n_unique())', False),
+        ('df.sort("a").head(3).select(pl.col("a").sum())', False),
+        ('df.filter(pl.col("a") > 1).head(3)', False),
+    ],
+)
+def test_decompose(code, decomposable):
+    assert (aggregates.decompose(code) is not None) == decomposable
+
+
+def test_mean_of_only_nulls_is_null():
+    code = 'df.group_by("region").agg(pl.col("amount").mean()).sort("region")'
+    df = pl.LazyFrame(
+        {"region": ["East", "East", "West"], "amount": [1.0, 2.0, None]}
+    )
+    decomposition = aggregates.decompose(code)
+    partial = main.to_lazy(main.safe_eval(decomposition.partial, df), df)
+    state = aggregates.combine([partial.collect()], decomposition)
+    final = main.safe_eval(decomposition.final, state.lazy())
+    result = main.to_lazy(final, state.lazy()).collect()
+    expected = main.to_lazy(main.safe_eval(code, df), df).collect()
+    assert_frame_equal(result, expected)
+    assert result["amount"].to_list() == [1.5, None]
+
+
+def _part(start: int, rows: int) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "region": [
+                ["East", "West"][i % 2] for i in range(start, start + rows)
+            ],
+            "amount": [float(i % 7) for i in range(start, start + rows)],
+        }
+    )
+
+
+def _ask(path) -> tuple[pl.DataFrame, pl.DataFrame]:
+    df = probe.load(path)
+    out = probe.ask(df, "Sales per region?", print_answer=False)
+    return out.result, main.to_lazy(out, df).collect()
+
+
+def test_appended_rows_update_aggregates(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text=CODE),
+    )
+    monkeypatch.setattr(
+        main, "translate_output", lambda output: SimpleNamespace(text="")
+    )
+    # Answered from the data, not from a rollup of it
+    monkeypatch.setattr(rollups.rollup_store, "min_queries", 10)
+    data = tmp_path / "sales"
+    data.mkdir()
+    _part(0, 1000).write_parquet(data / "part-0.parquet")
+    _ask(data)
+    before = aggregates.stats()
+
+    _part(1000, 10).write_parquet(data / "part-1.parquet")
+    result, exact = _ask(data)
+    assert_frame_equal(result, exact)
+    after = aggregates.stats()
+    assert after["updates"] == before["updates"] + 1
+    assert after["rows_skipped"] == before["rows_skipped"] + 1000
+
+    # Rows changed in place are not an append
+    _part(5, 1000).write_parquet(data / "part-0.parquet")
+    result, exact = _ask(data)
+    assert_frame_equal(result, exact)
+    assert aggregates.stats()["recomputes"] == after["recomputes"] + 1
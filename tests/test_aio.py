@@ -0,0 +1,155 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import polars as pl
+
+import probe
+from probe import governor, main, prompts
+
+
+class FakeAsyncClient:
+    def __init__(self):
+        self.systems = []
+        self.messages = self
+
+    async def create(self, system, messages, **kwargs):
+        self.systems.append(system)
+        await asyncio.sleep(0)
+        if system == prompts.TRANSLATE:
+            text = "The total is 6"
+        elif system == prompts.check_system():
+            text = 'pl.col("a").sum()'
+        else:
+            text = "df.("
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=text)],
+            usage=SimpleNamespace(
+                input_tokens=100,
+                output_tokens=10,
+                cache_creation_input_tokens=0,
+                cache_read_input_tokens=50,
+            ),
+        )
+
+
+def test_ask_async_concurrent():
+    df = pl.LazyFrame({"a": [1, 2, 3]})
+    client = FakeAsyncClient()
+
+    async def main():
+        return await asyncio.gather(
+            *(
+                probe.ask_async(
+                    df,
+                    f"total {i}",
+                    max_retries=1,
+                    client=client,
+                    fast_answer=False,
+                    trace=True,
+                )
+                for i in range(3)
+            )
+        )
+
+    outputs = asyncio.run(main())
+    assert [o.result.item() for o in outputs] == [6, 6, 6]
+    assert {o.answer for o in outputs} == {"The total is 6"}
+    assert client.systems.count(prompts.check_system()) == 3
+    # Every question has its own trace, concurrent ones included
+    for output in outputs:
+        assert output.trace.retries == 1
+        assert output.trace.tokens() == {
+            "input_tokens": 300,
+            "output_tokens": 30,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 150,
+        }
+
+
+def test_ask_async_runs_polars_off_the_event_loop(monkeypatch):
+    threads = []
+    collect_all = governor.collect_all
+    validate = main.validate
+
+    def collect_on(frames, *args, **kwargs):
+        threads.append(threading.current_thread())
+        return collect_all(frames, *args, **kwargs)
+
+    def validate_on(code, data):
+        threads.append(threading.current_thread())
+        return validate(code, data)
+
+    monkeypatch.setattr(governor, "collect_all", collect_on)
+    monkeypatch.setattr(main, "validate", validate_on)
+
+    class Client(FakeAsyncClient):
+        async def create(self, system, messages, **kwargs):
+            response = await super().create(system, messages, **kwargs)
+            response.content[0].text = 'pl.col("a").sum()'
+            return response
+
+    df = pl.LazyFrame({"a": [1.0] * 100_000})
+    output = asyncio.run(
+        probe.ask_async(
+            df,
+            "total",
+            client=Client(),
+            fast_answer=True,
+            use_cache=False,
+            approximate=probe.Sampling(fraction=0.1, refine=False),
+        )
+    )
+    assert output.approximation is not None
+    assert output.answer.startswith("[Preliminary, from a 10.00% sample")
+    assert threads
+    assert threading.main_thread() not in threads
+
+
+def test_ask_async_traces_streamed_answer():
+    class Stream:
+        def __init__(self):
+            self.text_stream = self.chunks()
+
+        async def chunks(self):
+            for chunk in ("The total ", "is 6"):
+                yield chunk
+
+        async def get_final_message(self):
+            return SimpleNamespace(
+                usage=SimpleNamespace(input_tokens=70, output_tokens=4)
+            )
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+    class Client(FakeAsyncClient):
+        async def create(self, system, messages, **kwargs):
+            response = await super().create(system, messages, **kwargs)
+            response.content[0].text = 'pl.col("a").sum()'
+            return response
+
+        def stream(self, **kwargs):
+            return Stream()
+
+    chunks = []
+    output = asyncio.run(
+        probe.ask_async(
+            pl.LazyFrame({"a": [1, 2, 3]}),
+            "total",
+            client=Client(),
+            fast_answer=False,
+            use_cache=False,
+            on_chunk=chunks.append,
+            trace=True,
+        )
+    )
+    assert output.answer == "The total is 6"
+    (span,) = [
+        s for s in output.trace.spans if s.name == "llm.translate_output"
+    ]
+    assert span.attributes["input_tokens"] == 70
+    assert span.attributes["output_tokens"] == 4
@@ -0,0 +1,21 @@
+from types import SimpleNamespace
+
+import polars as pl
+from typer.testing import CliRunner
+
+from probe import app, main
+
+
+def test_failed_query_exits_with_an_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text='pl.col("missing").sum()'),
+    )
+    path = tmp_path / "numbers.csv"
+    pl.DataFrame({"a": [1, 2]}).write_csv(path)
+    result = CliRunner().invoke(
+        app.app, [str(path), "What is the total?", "--no-cache"]
+    )
+    assert result.exit_code == 1
+    assert "missing" in result.stderr
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+
+import probe
+from probe import main
+
+CODE = {
+    "total": 'pl.col("a").sum()',
+    "by b": 'df.group_by("b").agg(pl.col("a").sum()).sort("b")',
+    "broken": 'pl.col("missing").sum()',
+    "syntax": "df.(",
+}
+
+
+@pytest.fixture(autouse=True)
+def fake_llm(monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text=CODE[query]),
+    )
+    monkeypatch.setattr(
+        main, "translate_output", lambda o: SimpleNamespace(text="answer")
+    )
+
+
+def test_ask_many_keeps_order_and_errors():
+    df = pl.LazyFrame({"a": [1, 2, 3], "b": ["x", "y", "x"]})
+    total, by_b, broken, syntax = probe.ask_many(
+        df,
+        ["total", "by b", "broken", "syntax"],
+        concurrency=2,
+        fast_answer=False,
+    )
+    assert total.result.item() == 6
+    assert by_b.result.to_dict(as_series=False) == {
+        "b": ["x", "y"],
+        "a": [4, 2],
+    }
+    assert total.answer == by_b.answer == "answer"
+    assert "missing" in broken.error and broken.answer is None
+    assert syntax.error and syntax.result is None
+
+
+def test_ask_many_shares_one_plan(monkeypatch):
+    calls = []
+    collect_all = pl.collect_all
+
+    def counted(frames, **kwargs):
+        calls.append(len(frames))
+        return collect_all(frames, **kwargs)
+
+    df = pl.LazyFrame({"a": [1, 2, 3], "b": ["x", "y", "x"]})
+    # Profiling the data for the prompt is a plan of its own
+    probe.context_cache.get(df)
+    monkeypatch.setattr(pl, "collect_all", counted)
+    total, by_b = probe.ask_many(
+        df, ["total", "by b"], fast_answer=False, use_cache=False
+    )
+    # The default limits have a timeout, the queries still run together
+    assert probe.governor.DEFAULT_LIMITS.timeout is not None
+    assert calls == [2]
+    assert total.result.item() == 6
+    assert by_b.result.height == 2
@@ -0,0 +1,61 @@
+import importlib.util
+import json
+from pathlib import Path
+
+BENCHMARKS = Path(__file__).parent.parent / "benchmarks"
+
+
+def _benchmark(name: str):
+    spec = importlib.util.spec_from_file_location(
+        name, BENCHMARKS / f"{name}.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_recorded_responses_replay_without_errors():
+    queries = _benchmark("queries")
+    responses = json.loads(queries.RESPONSES.read_text())
+    report = queries.run([1], 1, responses)
+    assert report["errors"] == []
+    assert {row["stage"] for row in report["summary"]} == set(queries.STAGES)
+    assert len(report["results"]) == len(responses) * len(queries.STAGES)
+    assert report["peak_memory"]["1"] > 0
+
+
+def test_replay_answers_retries():
+    queries = _benchmark("queries")
+    responses = [{"query": "q", "code": 'pl.col("b").sum()', "answer": ""}]
+    with queries.replay(responses):
+        output = queries.probe.main.ask(
+            queries.pl.LazyFrame({"a": [1]}),
+            "q",
+            max_retries=1,
+            print_answer=False,
+            use_cache=False,
+            trace=True,
+        )
+    assert output.trace.retries == 1
+    assert output.execution_error.kind == "code"
+
+
+def test_cached_prompts_are_read_once():
+    prompts = _benchmark("prompts")
+    responses = json.loads(prompts.RESPONSES.read_text())[:3]
+    report = prompts.run(responses, prefill=1e9)
+    results = {(r["prompt"], r["caching"]): r for r in report["results"]}
+    assert all(r["errors"] == 0 for r in results.values())
+    for prompt in ("full", "compact"):
+        off, on = results[prompt, False], results[prompt, True]
+        assert on["prompt_tokens"] == off["prompt_tokens"]
+        assert off["cache_read_input_tokens"] == 0
+        # The instructions and data are written once, then read twice
+        assert on["cache_read_input_tokens"] == (
+            2 * on["cache_creation_input_tokens"]
+        )
+        assert on["input_tokens"] < off["input_tokens"] / 10
+    assert (
+        results["compact", False]["prompt_tokens"]
+        < results["full", False]["prompt_tokens"]
+    )
@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+import polars as pl
+
+import probe
+from probe import main
+
+
+def test_ask_collects_bounded_preview(monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(
+            text='df.filter(pl.col("a") > 1)'
+        ),
+    )
+    seen = []
+    monkeypatch.setattr(
+        main,
+        "translate_output",
+        lambda output: (
+            seen.append(output.console_output)
+            or SimpleNamespace(text="answer")
+        ),
+    )
+    out = probe.ask(
+        pl.LazyFrame({"a": range(10)}),
+        "Which rows have a above 1?",
+        print_answer=False,
+        max_rows=3,
+        summary=True,
+    )
+    assert isinstance(out.result, pl.LazyFrame)
+    assert out.row_count == 8
+    assert out.result.collect().height == 8
+    assert "Showing the first 3 of 8 rows." in seen[0]
+    assert "Summary of all rows" in seen[0]
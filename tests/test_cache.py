@@ -0,0 +1,136 @@
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+
+import probe
+from probe import cache, main, prompts
+from probe.cache import CodeCache, ResultCache, StateCache
+
+
+@pytest.fixture
+def code_cache(tmp_path):
+    return CodeCache(tmp_path / "code.sqlite")
+
+
+def test_normalized_query_hits(code_cache):
+    code_cache.put("schema", "Who are the best sales reps?", "model", "df")
+    assert (
+        code_cache.get("schema", "  who are the best   sales reps", "model")
+        == "df"
+    )
+    assert (
+        code_cache.get("other-schema", "who are the best sales reps", "model")
+        is None
+    )
+    assert (
+        code_cache.get("schema", "who are the best sales reps", "other-model")
+        is None
+    )
+    assert (code_cache.hits, code_cache.misses) == (1, 2)
+
+
+def test_prompt_version_covers_every_template(monkeypatch):
+    version = cache.prompt_version()
+    for name in ("CATEGORICAL", "COLUMN_STATS", "PARTITIONS", "CATALOG"):
+        monkeypatch.setattr(prompts, name, getattr(prompts, name) + " ")
+        assert cache.prompt_version() != version
+        version = cache.prompt_version()
+
+
+def test_ttl_expires(code_cache):
+    code_cache.ttl = -1
+    code_cache.put("schema", "query", "model", "df")
+    assert code_cache.get("schema", "query", "model") is None
+
+
+def test_lru_eviction(code_cache):
+    code_cache.max_entries = 2
+    code_cache.put("schema", "a", "model", "df")
+    code_cache.put("schema", "b", "model", "df")
+    code_cache.get("schema", "a", "model")
+    code_cache.put("schema", "c", "model", "df")
+    assert len(code_cache) == 2
+    assert code_cache.get("schema", "b", "model") is None
+    assert code_cache.get("schema", "a", "model") == "df"
+
+
+def test_result_roundtrip(tmp_path):
+    result_cache = ResultCache(tmp_path / "results")
+    result = pl.DataFrame({"a": [1, 2], "b": ["x", "y"]})
+    assert result_cache.get("df", "data") is None
+    result_cache.put("df", "data", result)
+    assert result_cache.get("df", "data").equals(result)
+    assert result_cache.get("df", "other-data") is None
+    assert (result_cache.hits, result_cache.misses) == (1, 2)
+
+
+def test_result_byte_budget(tmp_path):
+    result_cache = ResultCache(tmp_path / "results")
+    result = pl.DataFrame({"a": range(1000)})
+    result_cache.put("first", "data", result)
+    (file,) = (tmp_path / "results").iterdir()
+    result_cache.max_bytes = file.stat().st_size
+    result_cache.put("second", "data", result)
+    assert len(result_cache) == 1
+    assert result_cache.get("second", "data") is not None
+
+
+def test_results_of_in_memory_data_are_not_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text='pl.col("a").sum()'),
+    )
+    result_cache = ResultCache(tmp_path / "results")
+    df = pl.LazyFrame({"a": [1, 2]})
+    output = probe.ask(
+        df, "total", print_answer=False, result_cache=result_cache
+    )
+    assert output.result.item() == 3
+    assert len(result_cache) == 0
+
+
+def test_evicted_state_drops_its_watermark(tmp_path):
+    state_cache = StateCache(tmp_path / "aggregates")
+    state = pl.DataFrame({"a": range(1000)})
+    state_cache.put_state("first", "data", state, {"rows": 1000})
+    (file,) = (tmp_path / "aggregates").glob("*.arrow")
+    state_cache.max_bytes = file.stat().st_size
+    state_cache.put_state("second", "data", state, {"rows": 1000})
+    assert state_cache.get_state("first", "data") is None
+    assert state_cache.get_state("second", "data")[1] == {"rows": 1000}
+    assert len(list((tmp_path / "aggregates").glob("*.json"))) == 1
+
+    state_cache.put_state("large", "data", pl.concat([state] * 2), {})
+    assert len(list((tmp_path / "aggregates").glob("*.json"))) == 1
+
+
+def test_ask_reuses_generated_code(code_cache, monkeypatch):
+    calls = []
+
+    def fake_code_creator(context, query):
+        calls.append(query)
+        return SimpleNamespace(text='pl.col("a").sum()')
+
+    monkeypatch.setattr(main, "code_creator", fake_code_creator)
+    monkeypatch.setattr(
+        main, "translate_output", lambda o: SimpleNamespace(text="3")
+    )
+    df = pl.LazyFrame({"a": [1, 2]})
+
+    for _ in range(2):
+        out = probe.ask(
+            df, "What is the total?", print_answer=False, code_cache=code_cache
+        )
+    assert out.result.item() == 3
+    assert calls == ["What is the total?"]
+
+    probe.ask(
+        df,
+        "What is the total?",
+        print_answer=False,
+        code_cache=code_cache,
+        use_cache=False,
+    )
+    assert len(calls) == 2
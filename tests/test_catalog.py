@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+
+import probe
+from probe import main
+from probe.context import build_context
+
+
+@pytest.fixture
+def catalog():
+    sales = pl.LazyFrame(
+        {"customer_id": [1, 2, 1], "amount": [10.0, 20.0, 5.0]}
+    )
+    customers = pl.LazyFrame({"customer_id": [1, 2], "country": ["FR", "DE"]})
+    return (
+        probe.Catalog()
+        .register("sales", sales, references={"customer_id": "customers"})
+        .register("customers", customers, key="customer_id")
+    )
+
+
+def test_catalog_context(catalog):
+    assert catalog.relationships() == [
+        ("sales", "customer_id", "customers", "customer_id")
+    ]
+    context = build_context(catalog, stats=False)
+    assert context.schema.names() == ["customer_id", "amount", "country"]
+    assert "sales.customer_id = customers.customer_id" in context.prompt
+    assert "`df` is the sales table" in context.prompt
+
+
+def test_register_checks_columns(catalog):
+    with pytest.raises(ValueError, match="no column 'id'"):
+        catalog.register("orders", pl.LazyFrame({"a": [1]}), key="id")
+
+
+def test_ask_joins_tables(monkeypatch, catalog):
+    code = (
+        'sales.join(customers, on="customer_id")'
+        '.group_by("country").agg(pl.col("amount").sum()).sort("country")'
+    )
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text=code),
+    )
+    out = probe.ask(
+        catalog, "Sales per country?", print_answer=False, fast_answer=True
+    )
+    assert out.result.to_dict(as_series=False) == {
+        "country": ["DE", "FR"],
+        "amount": [20.0, 15.0],
+    }
@@ -0,0 +1,136 @@
+import os
+import threading
+import warnings
+from types import SimpleNamespace
+
+import polars as pl
+
+import probe
+from probe import context, main
+from probe.context import ContextCache, source_fingerprint
+
+
+def test_repeated_context_is_cached(tmp_path):
+    path = tmp_path / "sales_data.csv"
+    path.write_bytes(open("data/sales_data.csv", "rb").read())
+    cache = ContextCache()
+    first = cache.get(pl.scan_csv(path))
+    second = cache.get(pl.scan_csv(path))
+    assert first is second
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+    assert "final_amount" in first.prompt
+
+
+def test_modified_file_misses(tmp_path):
+    path = tmp_path / "data.csv"
+    pl.DataFrame({"a": [1, 2]}).write_csv(path)
+    cache = ContextCache()
+    cache.get(pl.scan_csv(path))
+
+    pl.DataFrame({"a": [1, 2, 3]}).write_csv(path)
+    os.utime(path, ns=(0, 0))
+    context = cache.get(pl.scan_csv(path))
+    assert cache.misses == 2
+    assert context.sample.item() == 1
+
+
+def test_in_memory_fingerprint_tracks_the_frame():
+    a = pl.LazyFrame({"a": [1, 2]})
+    assert source_fingerprint(a) == source_fingerprint(a)
+    assert source_fingerprint(a) != source_fingerprint(
+        pl.LazyFrame({"a": [1, 2]})
+    )
+    assert source_fingerprint(a) != source_fingerprint(a.select("a"))
+
+
+def test_in_memory_fingerprint_survives_reused_ids():
+    fingerprints = set()
+    for i in range(20):
+        df = pl.LazyFrame({"a": [i]})
+        fingerprints.add(source_fingerprint(df))
+        del df
+    assert len(fingerprints) == 20
+
+
+def test_large_in_memory_frame_is_not_serialized(monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text='pl.col("a").max()'),
+    )
+    serialized, builds = [], []
+    serialize = pl.LazyFrame.serialize
+    build_context = context.build_context
+
+    def counted_serialize(self, *args, **kwargs):
+        serialized.append(self)
+        return serialize(self, *args, **kwargs)
+
+    def counted_build(*args, **kwargs):
+        builds.append(args)
+        return build_context(*args, **kwargs)
+
+    monkeypatch.setattr(pl.LazyFrame, "serialize", counted_serialize)
+    monkeypatch.setattr(context, "build_context", counted_build)
+    df = pl.DataFrame(
+        {"a": range(2_000_000), "b": ["x", "y"] * 1_000_000}
+    ).lazy()
+    cache = ContextCache(with_stats=False)
+    for _ in range(2):
+        output = probe.ask(
+            df, "Largest a?", print_answer=False, context_cache=cache
+        )
+    assert output.result.item() == 1_999_999
+    assert serialized == []
+    assert len(builds) == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_file_fingerprint_is_stable_and_warns_nothing(tmp_path):
+    path = tmp_path / "data.csv"
+    pl.DataFrame({"a": [1, 2]}).write_csv(path)
+    df = pl.scan_csv(path).filter(pl.col("a") > 1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        before = source_fingerprint(df)
+        df.collect_schema()
+        assert source_fingerprint(df) == before
+    assert source_fingerprint(pl.scan_csv(path)) != before
+
+
+def test_invalidate():
+    cache = ContextCache()
+    df = pl.LazyFrame({"a": [1]})
+    cache.get(df)
+    cache.invalidate(df)
+    assert len(cache) == 0
+    cache.get(df)
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_building_a_context_does_not_block_other_sources(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    build_context = context.build_context
+
+    def slow_build(df, key=None, stats=True):
+        if "slow" in df.collect_schema():
+            started.set()
+            release.wait(5)
+        return build_context(df, key, stats)
+
+    monkeypatch.setattr(context, "build_context", slow_build)
+    cache = ContextCache(with_stats=False)
+    slow = pl.LazyFrame({"slow": [1]})
+    thread = threading.Thread(target=cache.get, args=(slow,))
+    thread.start()
+    assert started.wait(5)
+    try:
+        assert cache.get(pl.LazyFrame({"fast": [1]})).schema.names() == [
+            "fast"
+        ]
+    finally:
+        release.set()
+        thread.join()
+    assert cache.get(slow).schema.names() == ["slow"]
+    assert cache.stats() == {"hits": 1, "misses": 2, "size": 2}
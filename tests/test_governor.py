@@ -0,0 +1,77 @@
+import time
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+
+import probe
+from probe import governor, main
+from probe.governor import Limits, QueryAborted
+
+DF = pl.LazyFrame({"a": range(20_000)})
+CROSS = DF.join(DF, how="cross").select(pl.len())
+
+
+def test_inspect_plan_flags_cross_joins_of_tables():
+    assert "cross join" in governor.inspect_plan(CROSS)[0]
+    share = DF.join(DF.select(pl.col("a").sum().alias("total")), how="cross")
+    assert governor.inspect_plan(share) == []
+
+
+@pytest.mark.parametrize(
+    "limits, kind",
+    [
+        (Limits(timeout=0.2, isolate=True), "timeout"),
+        (Limits(max_memory=1, isolate=True), "memory"),
+    ],
+)
+def test_collect_cancels_at_limits(limits, kind):
+    with pytest.raises(QueryAborted) as e:
+        governor.collect(CROSS, limits)
+    assert e.value.error.kind == kind
+    assert "cancelled" in e.value.error.message
+
+
+def test_in_process_timeout_only_stops_waiting():
+    slow = DF.select(pl.col("a").map_batches(lambda s: time.sleep(1) or s))
+    with pytest.raises(QueryAborted) as e:
+        governor.collect(slow, Limits(timeout=0.1))
+    assert e.value.error.kind == "timeout"
+    assert e.value.error.message == "The query did not finish within 0.1s"
+
+
+def test_memory_limit_runs_in_a_worker(monkeypatch):
+    started = []
+    isolated = governor._Isolated
+
+    def counted(lazy):
+        started.append(lazy)
+        return isolated(lazy)
+
+    monkeypatch.setattr(governor, "_Isolated", counted)
+    result = governor.collect(DF.select(pl.len()), Limits(max_memory=2**40))
+    assert result.item() == 20_000
+    assert len(started) == 1
+
+
+@pytest.mark.parametrize(
+    "code, limits, kind",
+    [
+        ('df.join(df, how="cross")', Limits(reject_risky=True), "plan"),
+        (
+            'df.select(pl.col("a").cast(pl.String).str.to_date())',
+            Limits(),
+            "runtime",
+        ),
+    ],
+)
+def test_ask_returns_structured_errors(monkeypatch, code, limits, kind):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text=code),
+    )
+    out = probe.ask(DF, "question", print_answer=False, limits=limits)
+    assert out.execution_error.kind == kind
+    assert out.error == out.execution_error.message
+    assert out.answer is None
@@ -0,0 +1,114 @@
+import os
+
+import polars as pl
+
+import probe
+from probe import ingest
+from probe.context import build_context
+from probe.ingest import convert_csv, infer_types
+
+
+def test_csv_is_converted_once(tmp_path):
+    path = tmp_path / "sales.csv"
+    pl.DataFrame({"a": [1, 2], "b": ["x", "y"]}).write_csv(path)
+
+    sidecar, _ = convert_csv(path)
+    assert sidecar == tmp_path / ".probe" / "sales.csv.parquet"
+    mtime = sidecar.stat().st_mtime_ns
+    assert convert_csv(path)[0].stat().st_mtime_ns == mtime
+
+    assert probe.load(path).collect().to_dict(as_series=False) == {
+        "a": [1, 2],
+        "b": ["x", "y"],
+    }
+
+
+def test_changed_csv_is_reconverted(tmp_path):
+    path = tmp_path / "sales.csv"
+    pl.DataFrame({"a": [1, 2]}).write_csv(path)
+    probe.load(path, format="ipc")
+
+    pl.DataFrame({"a": [1, 2, 3]}).write_csv(path)
+    os.utime(path, ns=(0, 0))
+    assert probe.load(path, format="ipc").collect()["a"].to_list() == [1, 2, 3]
+
+
+def test_non_csv_is_scanned(tmp_path):
+    path = tmp_path / "sales.parquet"
+    pl.DataFrame({"a": [1]}).write_parquet(path)
+    assert probe.load(path).collect().item() == 1
+    assert not (tmp_path / ".probe").exists()
+
+
+def test_infer_types():
+    lf = pl.LazyFrame(
+        {
+            "id": [f"ORD-{i}" for i in range(40)],
+            "day": ["2023-01-02", None] * 20,
+            "at": ["2020-01-03T20:00:00.000000"] * 40,
+            "region": ["North", "South"] * 20,
+        }
+    )
+    assert infer_types(lf) == {
+        "day": "%Y-%m-%d",
+        "at": "%Y-%m-%dT%H:%M:%S%.f",
+        "region": "categorical",
+    }
+
+
+def test_dates_after_the_sample_are_not_lost(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "PROFILE_SAMPLE_ROWS", 10)
+    days = ["2023-01-02"] * 20 + ["02/01/2023"]
+    path = tmp_path / "sales.csv"
+    pl.DataFrame({"day": days, "ok": ["2023-01-03"] * 21}).write_csv(path)
+    df = probe.load(path).collect()
+    assert df["day"].to_list() == days
+    assert df.schema["ok"] == pl.Date
+
+
+def test_sales_data_is_typed(tmp_path):
+    path = tmp_path / "sales_data.csv"
+    path.write_bytes(open("data/sales_data.csv", "rb").read())
+    schema = probe.load(path).collect_schema()
+    assert schema["date"] == pl.Datetime
+    assert schema["region"] == pl.Categorical("lexical")
+    assert schema["customer_id"] == pl.String
+    assert probe.load(path, typed=False).collect_schema()["date"] == pl.String
+
+
+def _write_partitions(root):
+    pl.DataFrame(
+        {
+            "year": [2023, 2023, 2024],
+            "month": [6, 7, 1],
+            "region": ["East", "West", "East"],
+            "amount": [1.0, 2.0, 3.0],
+        }
+    ).write_parquet(root, partition_by=["year", "month", "region"])
+
+
+def test_hive_partitions_are_pruned(tmp_path):
+    root = tmp_path / "sales"
+    _write_partitions(root)
+    df = probe.load(root)
+
+    context = build_context(df, stats=False)
+    assert context.partitions == {
+        "year": ["2023", "2024"],
+        "month": ["1", "6", "7"],
+        "region": ["East", "West"],
+    }
+    assert "partitioned by year, month, region" in context.prompt
+
+    # Only the 2023 East file is read, the others are never opened
+    for path in root.glob("year=2024/*/*/*.parquet"):
+        path.write_bytes(b"not parquet")
+    east = df.filter((pl.col("year") == 2023) & (pl.col("region") == "East"))
+    assert east.select("amount").collect().item() == 1.0
+
+
+def test_glob_of_csv_files(tmp_path):
+    for i in range(3):
+        pl.DataFrame({"a": [i]}).write_csv(tmp_path / f"part-{i}.csv")
+    df = probe.load(tmp_path / "part-*.csv")
+    assert sorted(df.collect()["a"]) == [0, 1, 2]
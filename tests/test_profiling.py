@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+
+import probe
+from probe import main, profiling
+
+DF = pl.LazyFrame(
+    {
+        "seller": ["Ann", "Bob", "Ann", "Cid"],
+        "date": ["2024-01-02", "2024-02-03", "2024-02-04", "2024-03-05"],
+        "amount": [1.0, 2.0, 3.0, 4.0],
+    }
+)
+
+
+@pytest.mark.parametrize(
+    "query, finding",
+    [
+        (
+            DF.with_columns(total=pl.col("amount").sum().over("seller"))
+            .select("seller", "total")
+            .unique()
+            .head(2),
+            "use group_by instead",
+        ),
+        (DF.sort("amount").unique().head(2), "all rows are sorted"),
+        (
+            DF.filter(pl.col("date").str.to_date().dt.month() > 1)
+            .group_by(pl.col("date").str.to_date().dt.month())
+            .len(),
+            "column 'date' is parsed from text 2 times",
+        ),
+        (DF.sort("amount").head(2), None),
+        (DF.group_by("seller").agg(pl.col("amount").sum()), None),
+    ],
+)
+def test_findings(query, finding):
+    result, profile = profiling.profile_query(query)
+    assert result.schema == query.collect_schema()
+    assert profile.nodes and profile.plan == query.explain()
+    if finding is None:
+        assert profile.findings == []
+    else:
+        assert any(finding in f for f in profile.findings)
+
+
+def test_ask_profile(monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(
+            text='df.sort("amount").unique().head(2)'
+        ),
+    )
+    monkeypatch.setattr(
+        main, "translate_output", lambda output: SimpleNamespace(text="")
+    )
+    out = probe.ask(DF, "Two sales?", print_answer=False, profile=True)
+    assert out.result.height == 2
+    assert out.profile.findings
+    assert "Node timings:" in out.profile.describe()
+    # Without profile=True, nothing is profiled
+    out = probe.ask(DF, "Two sales?", print_answer=False)
+    assert out.profile is None
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import polars as pl
+
+import probe
+from probe import main, prompts, trace
+from probe.cache import CodeCache
+
+
+def test_code_system_caches_instructions_then_data():
+    data = "the data\n" * 500
+    blocks = prompts.code_system(data)
+    assert [block.get("cache_control") for block in blocks] == [
+        None,
+        {"type": "ephemeral"},
+    ]
+    assert blocks[0]["text"].startswith(prompts.CODE_INSTRUCTIONS)
+    assert blocks[1]["text"] == data
+
+    compact = prompts.code_system(data, compact=True)
+    assert compact[0]["text"] == prompts.COMPACT_INSTRUCTIONS
+    assert compact[1] == blocks[1]
+    assert len(compact[0]["text"]) < len(blocks[0]["text"]) / 3
+
+
+def test_short_prompts_are_not_marked_for_caching():
+    assert "cache_control" not in prompts.check_system()[0]
+    blocks = prompts.cached("a" * 3000, "b" * 1096, "c")
+    assert [block.get("cache_control") for block in blocks] == [
+        None,
+        {"type": "ephemeral"},
+        {"type": "ephemeral"},
+    ]
+
+
+def test_question_is_not_part_of_the_cached_prompt(monkeypatch):
+    systems = []
+
+    def fake_code_creator(context, query):
+        systems.append(context)
+        return SimpleNamespace(text='pl.col("a").sum()')
+
+    monkeypatch.setattr(main, "code_creator", fake_code_creator)
+    monkeypatch.setattr(
+        main, "translate_output", lambda o: SimpleNamespace(text="3")
+    )
+    df = pl.LazyFrame({"a": [1, 2]})
+    for query in ("Sum of the zebras?", "Sum of a?"):
+        probe.ask(df, query, print_answer=False, use_cache=False)
+    assert systems[0] == systems[1]
+    assert not any("zebras" in block["text"] for block in systems[0])
+
+
+def test_compact_code_is_cached_apart(tmp_path, monkeypatch):
+    code_cache = CodeCache(tmp_path / "code")
+    calls = []
+
+    def fake_code_creator(context, query):
+        calls.append(context[0]["text"])
+        return SimpleNamespace(text='pl.col("a").sum()')
+
+    monkeypatch.setattr(main, "code_creator", fake_code_creator)
+    monkeypatch.setattr(
+        main, "translate_output", lambda o: SimpleNamespace(text="3")
+    )
+    df = pl.LazyFrame({"a": [1, 2]})
+    for compact in (False, True, True):
+        probe.ask(
+            df,
+            "What is the total?",
+            print_answer=False,
+            code_cache=code_cache,
+            compact_prompt=compact,
+        )
+    assert calls == [
+        prompts.CODE_INSTRUCTIONS + prompts.POLARS_TWEAKS,
+        prompts.COMPACT_INSTRUCTIONS,
+    ]
+
+
+def test_usage_counts_cached_tokens():
+    response = SimpleNamespace(
+        usage=SimpleNamespace(
+            input_tokens=20,
+            output_tokens=5,
+            cache_creation_input_tokens=None,
+            cache_read_input_tokens=1500,
+        )
+    )
+    assert trace.usage(response) == {
+        "input_tokens": 20,
+        "output_tokens": 5,
+        "cache_read_input_tokens": 1500,
+    }
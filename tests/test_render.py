@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import polars as pl
+
+from probe.render import NO_DATA, render_answer
+
+
+def test_empty_and_scalar():
+    assert render_answer(pl.DataFrame({"a": []})) == NO_DATA
+    assert (
+        render_answer(pl.DataFrame({"total_sales": [4_882_318.16]}))
+        == "The total sales is 4,882,318.16."
+    )
+    assert (
+        render_answer(pl.DataFrame({"date": [datetime(2023, 9, 28)]}))
+        == "The date is 2023-09-28."
+    )
+
+
+def test_small_and_large_floats_keep_their_value():
+    for value, text in [
+        (0.0012, "0.0012"),
+        (-1e-7, "-1e-07"),
+        (0.0, "0.00"),
+        (0.25, "0.25"),
+        (1.5e12, "1,500,000,000,000.00"),
+    ]:
+        assert (
+            render_answer(pl.DataFrame({"rate": [value]}))
+            == f"The rate is {text}."
+        )
+
+
+def test_rows_need_extended():
+    result = pl.DataFrame({"product": ["Mouse"], "total_revenue": [618559.63]})
+    assert render_answer(result) is None
+    assert (
+        render_answer(result, extended=True)
+        == "product: Mouse; total revenue: 618,559.63"
+    )
+
+
+def test_ranked_list():
+    result = pl.DataFrame(
+        {
+            "salesperson_name": ["Karen Le", "Emma Kumar"],
+            "total_sales": [255723.09, 181779.21],
+        }
+    )
+    assert render_answer(result, extended=True) == (
+        "1. Karen Le: total sales 255,723.09\n"
+        "2. Emma Kumar: total sales 181,779.21"
+    )
+    assert render_answer(pl.concat([result] * 6), extended=True) is None
@@ -0,0 +1,126 @@
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+
+import probe
+from probe import main, repair
+from probe.repair import match_column, repair_code
+
+COLUMNS = ["order_date", "Region", "final_amount"]
+
+
+def test_match_column():
+    assert match_column("region", COLUMNS) == "Region"
+    assert match_column("final amount", COLUMNS) == "final_amount"
+    assert match_column("final_amont", COLUMNS) == "final_amount"
+    assert match_column("customer", COLUMNS) is None
+
+
+@pytest.mark.parametrize(
+    "code, expected",
+    [
+        (
+            '```python\ndf.groupby("region").agg(pl.col("Final_Amount").sum())\n```',
+            "df.group_by('Region').agg(pl.col('final_amount').sum())",
+        ),
+        (
+            'df.sort("final_amount", True)',
+            "df.sort('final_amount', descending=True)",
+        ),
+        (
+            'pl.col("Region").map_dict({"EU": "Europe"})',
+            "pl.col('Region').replace_strict({'EU': 'Europe'}, default=None)",
+        ),
+        (
+            'df.select(pl.col("final_amount"), pl.col("final_amount").sum())',
+            "df.select(pl.col('final_amount'), "
+            "pl.col('final_amount').sum().alias('final_amount_sum'))",
+        ),
+        (
+            'df.group_by("Region").agg(pl.col("Region").count())',
+            "df.group_by('Region').agg("
+            "pl.col('Region').count().alias('Region_count'))",
+        ),
+    ],
+)
+def test_repair_code(code, expected):
+    repaired, fixes = repair_code(code, COLUMNS)
+    assert repaired == expected
+    assert fixes
+
+
+def test_repair_keeps_valid_code_and_created_columns():
+    code = (
+        'df.with_columns(pl.col("final_amount").alias("total"))'
+        '.sort("total", descending=True)'
+    )
+    assert repair_code(code, COLUMNS) == (code, [])
+
+
+def test_ask_repairs_without_calling_the_model(monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text='pl.col("A").sum()'),
+    )
+
+    def check_code(output, schema=None):
+        raise AssertionError("the model should not be asked to fix the code")
+
+    monkeypatch.setattr(main, "check_code", check_code)
+    saved = repair.stats()["llm_calls_saved"]
+    out = probe.ask(
+        pl.LazyFrame({"a": [1, 2]}),
+        "What is the total?",
+        max_retries=1,
+        print_answer=False,
+    )
+    assert out.code_str == "pl.col('a').sum()"
+    assert out.repairs == ["column 'A' -> 'a'"]
+    assert out.answer == "The a is 3."
+    assert repair.stats()["llm_calls_saved"] == saved + 1
+
+
+def test_repair_without_retries_saves_no_call(monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text='pl.col("A").sum()'),
+    )
+    before = repair.stats()
+    out = probe.ask(
+        pl.LazyFrame({"a": [1, 2]}),
+        "What is the total?",
+        max_retries=0,
+        print_answer=False,
+    )
+    assert out.repairs == ["column 'A' -> 'a'"]
+    assert repair.stats() == {
+        "repairs": before["repairs"] + 1,
+        "llm_calls_saved": before["llm_calls_saved"],
+    }
+
+
+def test_string_methods_on_categorical_columns(monkeypatch):
+    code = (
+        'df.filter(pl.col("Region").str.to_lowercase().str.contains("ea"))'
+        '.select(pl.col("final_amount").sum())'
+    )
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text=code),
+    )
+    df = pl.LazyFrame(
+        {"Region": ["East", "West", "East"], "final_amount": [1, 2, 3]}
+    ).with_columns(pl.col("Region").cast(pl.Categorical("lexical")))
+    context = probe.context.build_context(df, stats=False)
+    assert "Categorical: Region" in context.prompt
+
+    out = probe.ask(df, "Total in the east?", print_answer=False)
+    assert out.result.item() == 4
+    assert out.repairs == ["categorical column 'Region' cast to pl.String"]
+    assert "pl.col('Region').cast(pl.String).str.to_lowercase()" in (
+        out.code_str
+    )
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+import probe
+from probe import aggregates, main, rollups
+
+SCHEMA = pl.Schema(
+    {"region": pl.String, "product": pl.String, "amount": pl.Float64}
+)
+BY_PRODUCT = (
+    'df.group_by("region", "product").agg(pl.col("amount").sum(), '
+    'pl.col("amount").mean().alias("average"), orders=pl.len())'
+    '.sort("region", "product")'
+)
+EAST_PHONES = (
+    'df.filter(pl.col("region") == "East").group_by("product").agg('
+    'pl.col("amount").sum(), orders=pl.len()).sort("product")'
+)
+
+
+@pytest.mark.parametrize(
+    "code, dimensions",
+    [
+        (BY_PRODUCT, ("product", "region")),
+        (EAST_PHONES, ("product", "region")),
+        (
+            'df.with_columns(big=pl.col("region") == "East")'
+            '.group_by("big").agg(pl.col("amount").max())',
+            ("region",),
+        ),
+        ('df.select(pl.col("amount").sum())', None),
+        ('df.group_by(pl.col("^r.*$")).agg(pl.len())', None),
+        (
+            'df.with_columns(pl.col("amount") * 2)'
+            '.group_by("region").agg(pl.col("amount").sum())',
+            None,
+        ),
+    ],
+)
+def test_shape(code, dimensions):
+    shape = rollups.shape(aggregates.decompose(code), SCHEMA)
+    assert (shape and shape.dimensions) == dimensions
+
+
+def test_frequent_shapes_are_answered_from_a_rollup(tmp_path, monkeypatch):
+    code = SimpleNamespace(text=BY_PRODUCT)
+    monkeypatch.setattr(main, "code_creator", lambda context, query: code)
+    monkeypatch.setattr(
+        main, "translate_output", lambda output: SimpleNamespace(text="")
+    )
+    path = tmp_path / "sales.parquet"
+    pl.DataFrame(
+        {
+            "region": [["East", "West"][i % 2] for i in range(2000)],
+            "product": [["Phone", "Laptop", "TV"][i % 3] for i in range(2000)],
+            "amount": [float(i % 11) for i in range(2000)],
+        }
+    ).write_parquet(path)
+    df = probe.load(path)
+    before = rollups.stats()
+
+    for question in ["Sales per product?", "Sales by product?"]:
+        out = probe.ask(df, question, print_answer=False)
+        assert not out.from_rollup
+    out = probe.ask(df, "Sales per product again?", print_answer=False)
+    assert out.from_rollup
+    assert_frame_equal(out.result, main.to_lazy(out, df).collect())
+
+    code.text = EAST_PHONES
+    out = probe.ask(df, "Sales in the East?", print_answer=False)
+    assert out.from_rollup
+    assert_frame_equal(out.result, main.to_lazy(out, df).collect())
+    assert rollups.stats()["built"] == before["built"] + 1
+    assert rollups.stats()["routed"] == before["routed"] + 2
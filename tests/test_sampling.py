@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+
+import probe
+from probe import main, sampling
+from probe.sampling import Sampling
+
+DF = pl.LazyFrame(
+    {
+        "region": ["East", "West"] * 50_000,
+        "amount": [float(i % 100) for i in range(100_000)],
+    }
+)
+
+
+@pytest.mark.parametrize(
+    "code, expected",
+    [
+        ('pl.col("amount").sum()', {"amount": "total"}),
+        (
+            'df.group_by("region").agg(pl.col("amount").mean(), '
+            'orders=pl.len(), share=pl.col("amount").sum() / 2)',
+            {"amount": "estimate", "orders": "total", "share": "total"},
+        ),
+        ('df.group_by("region").len()', {"len": "total"}),
+        ('df.filter(pl.col("amount") > 1).head(3)', {}),
+    ],
+)
+def test_aggregations(code, expected):
+    assert sampling.aggregations(code) == expected
+
+
+def test_stratified_sample_keeps_small_groups():
+    df = pl.LazyFrame({"group": ["big"] * 10_000 + ["small"] * 20})
+    uniform = sampling.draw(df, Sampling(fraction=0.01)).collect()
+    stratified = sampling.draw(
+        df, Sampling(fraction=0.01, stratify_by=("group",))
+    ).collect()
+    assert stratified["group"].value_counts().height == 2
+    assert stratified.height < uniform.height + 2
+
+
+def test_ask_approximate_then_exact(monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(
+            text='df.select(pl.col("amount").sum(), pl.len())'
+        ),
+    )
+    out = probe.ask(
+        DF,
+        "What is the total amount?",
+        print_answer=False,
+        fast_answer=True,
+        approximate=probe.Sampling(fraction=0.05),
+    )
+    assert out.answer.startswith("[Preliminary, from a 5.00% sample, ±")
+    assert "Estimated from a 5.00% sample" in out.console_output
+    assert set(out.approximation.margins) == {"amount", "len"}
+    total, rows = out.result.row(0)
+    assert abs(total - 4_950_000) / 4_950_000 < 0.1
+    assert abs(rows - 100_000) / 100_000 < 0.1
+
+    exact = out.exact.result()
+    assert exact.result.row(0) == (4_950_000.0, 100_000)
+    assert exact.answer == "amount: 4,950,000.00; len: 100,000"
+
+
+def test_stratified_totals_scale_each_stratum(monkeypatch):
+    df = pl.LazyFrame(
+        {
+            "group": ["big"] * 10_000 + ["small"] * 20,
+            "amount": [1.0] * 10_020,
+        }
+    )
+    stratified = Sampling(fraction=0.01, stratify_by=("group",), refine=False)
+
+    def ask(code: str):
+        monkeypatch.setattr(
+            main,
+            "code_creator",
+            lambda context, query: SimpleNamespace(text=code),
+        )
+        return probe.ask(
+            df,
+            code,
+            print_answer=False,
+            fast_answer=True,
+            use_cache=False,
+            approximate=stratified,
+        )
+
+    # One row of the small stratum is kept, it stands for 20 rows not 100
+    grouped = ask(
+        'df.group_by("group").agg(pl.len(), pl.col("amount").sum())'
+        '.sort("group")'
+    )
+    assert grouped.result.to_dict(as_series=False) == {
+        "group": ["big", "small"],
+        "len": [10_000, 20],
+        "amount": [10_000.0, 20.0],
+    }
+    total = ask('df.select(pl.col("amount").sum(), pl.len())')
+    assert total.result.row(0) == (10_020.0, 10_020)
@@ -0,0 +1,100 @@
+import http.client
+import json
+import threading
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+
+from probe import main
+from probe.server import Datasets, ask_remote, make_server
+
+
+@pytest.fixture
+def datasets(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text='pl.col("a").sum()'),
+    )
+    path = tmp_path / "numbers.parquet"
+    pl.DataFrame({"a": [1, 2]}).write_parquet(path)
+    datasets = Datasets()
+    datasets.register("numbers", path)
+    return datasets
+
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def test_ask_over_tcp(datasets):
+    server = _serve(make_server(datasets, port=0))
+    try:
+        host, port = server.server_address
+        out = ask_remote(f"{host}:{port}", "numbers", "What is the total?")
+        assert out["answer"] == "The a is 3."
+        assert out["rows"] == [{"a": 3}]
+        with pytest.raises(RuntimeError, match="unknown dataset"):
+            ask_remote(f"{host}:{port}", "missing", "What is the total?")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_ask_over_unix_socket(datasets, tmp_path):
+    path = str(tmp_path / "probe.sock")
+    server = _serve(make_server(datasets, unix_socket=path))
+    try:
+        out = ask_remote(f"unix:{path}", "numbers", "What is the total?")
+        assert out["code"] == 'pl.col("a").sum()'
+        assert out["row_count"] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_paths_are_only_served_under_the_allowed_root(tmp_path):
+    inside = tmp_path / "allowed" / "inside.parquet"
+    outside = tmp_path / "outside.parquet"
+    inside.parent.mkdir()
+    for path in (inside, outside):
+        pl.DataFrame({"a": [1]}).write_parquet(path)
+
+    with pytest.raises(KeyError, match="unknown dataset"):
+        Datasets().get(str(inside))
+
+    datasets = Datasets(allowed_root=inside.parent)
+    assert datasets.get(str(inside)).collect()["a"].to_list() == [1]
+    for name in (str(outside), str(inside.parent / ".." / outside.name)):
+        with pytest.raises(KeyError, match="unknown dataset"):
+            datasets.get(name)
+    assert datasets.names() == [str(inside)]
+
+
+@pytest.mark.parametrize(
+    "body, error",
+    [
+        ({"data": "numbers"}, '"query" must be a string'),
+        ({"data": "numbers", "query": 3}, '"query" must be a string'),
+        (
+            {"data": "numbers", "query": "total", "options": [1]},
+            '"options" must be an object',
+        ),
+        (["numbers"], "the request must be a JSON object"),
+    ],
+)
+def test_malformed_requests_are_rejected(datasets, body, error):
+    server = _serve(make_server(datasets, port=0))
+    try:
+        conn = http.client.HTTPConnection(*server.server_address)
+        conn.request("POST", "/ask", json.dumps(body))
+        response = conn.getresponse()
+        assert response.status == 400
+        assert json.loads(response.read())["error"] == error
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import time
+
+# Cold start budget of the CLI in seconds, override with PROBE_STARTUP_BUDGET
+STARTUP_BUDGET = float(os.environ.get("PROBE_STARTUP_BUDGET", "1.0"))
+HEAVY_MODULES = ["anthropic", "polars"]
+
+
+def _run(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def test_cli_import_skips_heavy_modules():
+    out = _run(
+        "import sys, probe, probe.app\n"
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    )
+    assert out.stdout.strip() == "[]"
+
+
+def test_public_api_still_resolves():
+    out = _run(
+        "import probe; print(probe.ask.__module__, probe.load.__name__)"
+    )
+    assert out.stdout.split() == ["probe.main", "load"]
+
+
+def test_cli_cold_start_within_budget():
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        _run("import probe.app")
+        timings.append(time.perf_counter() - start)
+    assert min(timings) < STARTUP_BUDGET, (
+        f"importing the CLI took {min(timings):.2f}s, budget {STARTUP_BUDGET}s"
+    )
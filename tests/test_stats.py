@@ -0,0 +1,91 @@
+import os
+import time
+
+import polars as pl
+import pytest
+
+from probe import governor
+from probe.governor import Limits, QueryAborted
+from probe.stats import compute_stats, load_stats, summarize
+
+
+def test_compute_stats():
+    stats = compute_stats(
+        pl.LazyFrame(
+            {
+                "region": ["East", "East", "West", None],
+                "amount": [1.5, 2.0, None, 4.0],
+                "day": ["2023-01-02", "2023-01-03", None, "2023-02-01"],
+            }
+        )
+    )
+    assert stats["region"] == {
+        "dtype": "String",
+        "nulls": 1,
+        "unique": 3,
+        "top": [["East", 2], ["West", 1], ["None", 1]],
+    }
+    assert stats["amount"]["min"] == "1.5"
+    assert stats["amount"]["max"] == "4.0"
+    assert stats["day"]["date_format"] == "%Y-%m-%d"
+    assert (
+        "- amount (Float64): 4 distinct; range 1.5 to 4.0; 1 nulls"
+        in summarize(stats)
+    )
+
+
+def test_stats_are_stored_next_to_the_data(tmp_path):
+    path = tmp_path / "sales.csv"
+    pl.DataFrame({"a": [1, 2]}).write_csv(path)
+    assert load_stats(pl.scan_csv(path))["a"]["max"] == "2"
+    assert (tmp_path / ".probe" / "sales.csv.stats.json").exists()
+
+    pl.DataFrame({"a": [1, 2, 3]}).write_csv(path)
+    os.utime(path, ns=(0, 0))
+    assert load_stats(pl.scan_csv(path))["a"]["max"] == "3"
+
+
+def test_stats_of_in_memory_data_are_not_stored(cache_dir):
+    df = pl.LazyFrame({"a": [1, 2]})
+    assert load_stats(df)["a"]["max"] == "2"
+    assert not (cache_dir / "stats").exists()
+
+
+def test_stats_run_under_the_limits(monkeypatch):
+    calls = []
+    collect_all = governor.collect_all
+
+    def counted(frames, limits, *args, **kwargs):
+        calls.append(limits)
+        return collect_all(frames, limits, *args, **kwargs)
+
+    monkeypatch.setattr(governor, "collect_all", counted)
+    df = pl.LazyFrame({"a": ["x", "y"]})
+    limits = Limits(timeout=10.0)
+    assert compute_stats(df, limits)["a"]["unique"] == 2
+    assert calls == [limits, limits]
+
+    slow = df.select(pl.col("a").map_batches(lambda s: time.sleep(1) or s))
+    with pytest.raises(QueryAborted, match="did not finish"):
+        compute_stats(slow, Limits(timeout=0.05))
+
+
+def test_values_are_only_counted_for_low_cardinality(monkeypatch):
+    queries = []
+    collect_all = governor.collect_all
+
+    def recorded(frames, *args, **kwargs):
+        queries.extend(frame.explain() for frame in frames)
+        return collect_all(frames, *args, **kwargs)
+
+    monkeypatch.setattr(governor, "collect_all", recorded)
+    df = pl.LazyFrame(
+        {"id": [f"ID-{i}" for i in range(200)], "region": ["N", "S"] * 100}
+    )
+    stats = compute_stats(df)
+    assert "top" not in stats["id"]
+    assert stats["region"]["top"] == [["N", 100], ["S", 100]]
+    counted = [query for query in queries if "value_counts" in query]
+    assert len(counted) == 1
+    assert 'col("region")' in counted[0]
+    assert 'col("id")' not in counted[0]
@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import polars as pl
+
+import probe
+from probe import main
+
+
+class FakeStreamingClient:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.messages = self
+
+    @contextmanager
+    def stream(self, **kwargs):
+        yield SimpleNamespace(
+            text_stream=iter(self.chunks),
+            get_final_message=lambda: SimpleNamespace(
+                usage=SimpleNamespace(input_tokens=120, output_tokens=8)
+            ),
+        )
+
+
+def test_ask_streams_chunks(monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text='pl.col("a").sum()'),
+    )
+    monkeypatch.setattr(
+        main, "_client", FakeStreamingClient(["The total ", "is 3."])
+    )
+    received = []
+    out = probe.ask(
+        pl.LazyFrame({"a": [1, 2]}),
+        "What is the total?",
+        stream=True,
+        on_chunk=received.append,
+        fast_answer=False,
+    )
+    assert received == ["The total ", "is 3."]
+    assert out.answer == "The total is 3."
+
+
+def test_streamed_answer_is_traced(monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "code_creator",
+        lambda context, query: SimpleNamespace(text='pl.col("a").sum()'),
+    )
+    monkeypatch.setattr(main, "_client", FakeStreamingClient(["3"]))
+    out = probe.ask(
+        pl.LazyFrame({"a": [1, 2]}),
+        "What is the total?",
+        stream=True,
+        print_answer=False,
+        fast_answer=False,
+        use_cache=False,
+        trace=True,
+    )
+    (span,) = [s for s in out.trace.spans if s.name == "llm.translate_output"]
+    assert span.attributes["input_tokens"] == 120
+    assert out.trace.tokens()["output_tokens"] == 8
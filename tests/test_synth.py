@@ -0,0 +1,45 @@
+import importlib.util
+from pathlib import Path
+
+import polars as pl
+
+import probe
+
+DATA = Path(__file__).parent.parent / "data"
+
+
+def _synth():
+    spec = importlib.util.spec_from_file_location("synth", DATA / "synth.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_chunks_match_the_sample_schema_and_are_deterministic():
+    synth = _synth()
+    df = pl.concat(synth.chunks(3000, chunk_size=1000, seed=7))
+    sample = pl.read_csv(DATA / "sales_data.csv", try_parse_dates=True)
+    assert df.schema == sample.schema
+    assert df["date"].is_sorted()
+    assert df["order_id"].n_unique() == 3000
+    assert df.equals(pl.concat(synth.chunks(3000, chunk_size=1000, seed=7)))
+    assert not df.equals(pl.concat(synth.chunks(3000, 1000, seed=8)))
+
+
+def test_skew_and_partitions(tmp_path):
+    synth = _synth()
+    synth.generate(
+        4000, tmp_path, chunk_size=1000, skew=1.5, partition_by=["region"]
+    )
+    assert len(list(tmp_path.glob("region=*/part-*.parquet"))) == 20
+    counts = (
+        probe.load(tmp_path)
+        .group_by("product")
+        .len()
+        .sort("len", descending=True)
+        .collect()
+    )
+    assert counts["len"].sum() == 4000
+    # Zipf's law: the first product is the most frequent by far
+    assert counts["product"][0] == synth.PRODUCTS[0]
+    assert counts["len"][0] > 2 * counts["len"][1]
@@ -0,0 +1,98 @@
+import json
+import logging
+from types import SimpleNamespace
+
+import polars as pl
+
+import probe
+from probe import main, trace
+
+DF = pl.LazyFrame({"region": ["East", "West", "East"], "amount": [1, 2, 3]})
+
+
+def _fake_model(monkeypatch, code: str):
+    monkeypatch.setattr(
+        main, "code_creator", lambda context, query: SimpleNamespace(text=code)
+    )
+    monkeypatch.setattr(
+        main, "translate_output", lambda output: SimpleNamespace(text="Six")
+    )
+
+
+def test_untraced_by_default(monkeypatch):
+    _fake_model(monkeypatch, 'pl.col("amount").sum()')
+    out = probe.ask(DF, "Total?", print_answer=False)
+    assert out.trace is None
+    assert trace.current() is None
+
+
+def test_spans_of_every_stage(monkeypatch):
+    _fake_model(
+        monkeypatch, 'df.group_by("region").agg(pl.col("amount").sum())'
+    )
+    out = probe.ask(
+        DF,
+        "Sales per region?",
+        print_answer=False,
+        use_cache=False,
+        trace=True,
+    )
+    names = [span.name for span in out.trace.spans]
+    assert names[:2] == ["context", "safe_eval"]
+    assert names[-2:] == ["collect", "translate"]
+    collect = out.trace.spans[names.index("collect")]
+    assert collect.attributes["rows"] == 2
+    assert out.trace.stage("translate") > 0
+    assert out.trace.retries == 0
+    assert trace.current() is None
+
+
+def test_retries_are_counted(monkeypatch):
+    _fake_model(monkeypatch, "df.(")
+    monkeypatch.setattr(
+        main,
+        "check_code",
+        lambda output, schema: SimpleNamespace(text='pl.col("amount").sum()'),
+    )
+    out = probe.ask(
+        DF, "Total?", print_answer=False, max_retries=2, trace=True
+    )
+    assert out.result.item() == 6
+    assert out.trace.retries == 1
+    retry = next(span for span in out.trace.spans if span.name == "retry")
+    assert retry.attributes["attempt"] == 1
+    # The spans of the retry are nested in it
+    index = out.trace.spans.index(retry)
+    assert any(span.parent == index for span in out.trace.spans)
+
+
+def test_sinks(monkeypatch, tmp_path, caplog):
+    _fake_model(monkeypatch, 'pl.col("amount").sum()')
+
+    def broken(_):
+        raise RuntimeError("down")
+
+    sinks = [
+        trace.JSONLSink(tmp_path / "traces.jsonl"),
+        trace.LoggingSink(),
+        broken,
+    ]
+    for sink in sinks:
+        trace.add_sink(sink)
+    try:
+        with caplog.at_level(logging.INFO, logger="probe"):
+            first = probe.ask(DF, "Total?", print_answer=False)
+            probe.ask(DF, "Total again?", print_answer=False)
+    finally:
+        for sink in sinks:
+            trace.remove_sink(sink)
+
+    assert first.trace is not None
+    lines = (tmp_path / "traces.jsonl").read_text().splitlines()
+    assert [json.loads(line)["query"] for line in lines] == [
+        "Total?",
+        "Total again?",
+    ]
+    assert json.loads(lines[0])["trace_id"] == first.trace.trace_id
+    assert "collect" in caplog.text
+    assert "sink" in caplog.text and "down" in caplog.text